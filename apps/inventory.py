@@ -4,27 +4,67 @@
 #
 # OOM script to inventory the modules in a switch
 #
+#   inventory.py                      the local switch
+#   inventory.py -url <switch>        one remote switch (oomjsonsvr.py)
+#   inventory.py -fleet <switch> ...  many remote switches, at once
+#   inventory.py -fleet @<file>       remote switches listed in a file
+#
 import sys
 from oom import *
 from oom.oomlib import type_to_str
 
-# load the json shim if a URL has been provided
+formatstr = '%-10s %-16s %-13s %-16s %-16s'
+inventory_keys = ('VENDOR_NAME', 'VENDOR_PN', 'VENDOR_SN')
+
+
+def print_inventory(ports):
+    print("")
+    print(formatstr % ('Port Name', 'Vendor', 'Type', 'Part #', 'Serial #'))
+    print("")
+    for (port, values) in ports:
+        modtype = type_to_str(port.port_type)
+        if modtype == 'UNKNOWN':
+            modtype = 'No Module'
+        print(formatstr % (port.port_name,
+              values['VENDOR_NAME'],
+              modtype,
+              values['VENDOR_PN'],
+              values['VENDOR_SN']))
+    print("")
+
+
+# the switches named on the command line, '@file' is a file of names
+def fleet_switches(names):
+    switches = []
+    for name in names:
+        if name[0] == '@':
+            with open(name[1:]) as fd:
+                switches.extend([line.strip() for line in fd
+                                 if line.strip() != ''])
+        else:
+            switches.append(name)
+    return switches
+
+
 parms = sys.argv
+if len(parms) > 1 and parms[1] == '-fleet':
+    # inventory many switches, print each one as soon as it is done
+    from oom.oomfleet import Fleet
+    fleet = Fleet(fleet_switches(parms[2:]))
+    for (switch, ports, error) in fleet.get_keyvalues(inventory_keys):
+        print('Switch: %s' % switch)
+        if error is not None:
+            print('    failed: %s' % str(error))
+            continue
+        print_inventory(ports)
+    fleet.close()
+    sys.exit()
+
+# load the json shim if a URL has been provided
 if len(parms) > 1:
     if parms[1] == '-url':
         oomlib.setshim("oomjsonshim", parms[2])
 
-formatstr = '%-10s %-16s %-13s %-16s %-16s'
-print("")
-print(formatstr % ('Port Name', 'Vendor', 'Type', 'Part #', 'Serial #'))
-print("")
-for port in oom_get_portlist():
-    modtype = type_to_str(port.port_type)
-    if modtype == 'UNKNOWN':
-        modtype = 'No Module'
-    print(formatstr % (port.port_name,
-          oom_get_keyvalue(port, 'VENDOR_NAME'),
-          modtype,
-          oom_get_keyvalue(port, 'VENDOR_PN'),
-          oom_get_keyvalue(port, 'VENDOR_SN')))
-print("")
+print_inventory([(port, dict([(key, oom_get_keyvalue(port, key))
+                              for key in inventory_keys]))
+                 for port in oom_get_portlist()])
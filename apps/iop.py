@@ -26,10 +26,13 @@ def iop(port, fileflag):
     if port.port_type == 0:
         return
 
+    # read the whole module once, the report is decoded from that image
+    values = oom_get_snapshot(port)
+
     # build the name of the file to store results to
-    vendor_name = oom_get_keyvalue(port, 'VENDOR_NAME').replace(" ", "_")[0:8]
+    vendor_name = values.get('VENDOR_NAME', '').replace(" ", "_")[0:8]
     outfilename = vendor_name + '_'
-    vendor_sn = oom_get_keyvalue(port, 'VENDOR_SN').replace(" ", "_")
+    vendor_sn = values.get('VENDOR_SN', '').replace(" ", "_")
     outfilename += vendor_sn + '_EEPROMdecode_'
     dt = datetime.now()
     dateformat = "%Y%m%d%H%M%S"
@@ -44,11 +47,11 @@ def iop(port, fileflag):
     print("")
     print('Port: %s' % port.port_name)
     print('%s %s module' %
-          (oom_get_keyvalue(port, 'VENDOR_NAME'),
+          (values.get('VENDOR_NAME', ''),
            mod_id(port.port_type)))
     print('Part Number: %s  Serial Number: %s' %
-          (oom_get_keyvalue(port, 'VENDOR_PN'),
-           oom_get_keyvalue(port, 'VENDOR_SN')))
+          (values.get('VENDOR_PN', ''),
+           values.get('VENDOR_SN', '')))
     print(outfilename)
 
     # print out the Serial ID keys
@@ -56,7 +59,7 @@ def iop(port, fileflag):
     keys = port.fmap['SERIAL_ID']
     print('SERIAL_ID Keys:')
     for key in sorted(keys):
-        val = oom_get_keyvalue(port, key)
+        val = values[key]
         decoder = port.mmap[key][1]
         if ((decoder == 'get_bytes') or (decoder == 'get_cablespec')):
             valstr = get_hexstr(val)
@@ -69,34 +72,34 @@ def iop(port, fileflag):
     vend_specific = ''
     if port.port_type == 0x3 or (port.port_type == 0xB):   # SFP
         vend_specific = \
-            get_hexstr(oom_get_keyvalue(port, 'VENDOR_SPECIFIC_96'))
+            get_hexstr(values.get('VENDOR_SPECIFIC_96', ''))
     if (port.port_type == 0xD) or (port.port_type == 0x11):  # QSFP+/QSFP28
         vend_specific = \
-            get_hexstr(oom_get_keyvalue(port, 'VENDOR_SPECIFIC_224'))
+            get_hexstr(values.get('VENDOR_SPECIFIC_224', ''))
     print('Vendor Specific: ' + vend_specific)
 
     # dump the raw data from the two most popular blocks, by type
     print("")
     if port.port_type == 0x3 or (port.port_type == 0xB):  # SFP
         print('I2C Address A0h, bytes 0-127, in hex')
-        print_block_hex(oom_get_memory_sff(port, 0xA0, 0, 0, 128), 0)
+        print_block_hex(oom_get_cached_sff(port, 0xA0, 0, 0, 128), 0)
         print("")
         print('I2C Address A2h, bytes 0-127, in hex')
-        print_block_hex(oom_get_memory_sff(port, 0xA2, 0, 0, 128), 0)
+        print_block_hex(oom_get_cached_sff(port, 0xA2, 0, 0, 128), 0)
 
     if (port.port_type == 0xD) or (port.port_type == 0x11):  # QSFP+/QSFP28
         print('I2C Address A0h, bytes 0-127, in hex')
-        print_block_hex(oom_get_memory_sff(port, 0xA0, 0, 0, 128), 0)
+        print_block_hex(oom_get_cached_sff(port, 0xA0, 0, 0, 128), 0)
         print("")
         print('I2C Address A0h, page 0, bytes 128-255, in hex')
-        print_block_hex(oom_get_memory_sff(port, 0xA0, 0, 128, 128), 0)
+        print_block_hex(oom_get_cached_sff(port, 0xA0, 0, 128, 128), 0)
 
     # print out all the keys
     keys = port.mmap
     print('All Keys:')
     print("")
     for key in sorted(keys):
-        val = oom_get_keyvalue(port, key)
+        val = values[key]
         decoder = port.mmap[key][1]
         if ((decoder == 'get_bytes') or (decoder == 'get_cablespec')):
             valstr = get_hexstr(val)
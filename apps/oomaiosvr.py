@@ -0,0 +1,265 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomaiosvr.py : concurrent asyncio server for oomjsonsvr.py
+#  (python 3 only, run it with 'oomjsonsvr.py --aio')
+#
+#  Serves the same JSON commands (HTTP, keep-alive) and the same binary
+#  transport (oombinproto.py) as oomjsonsvr.py, but serves any number of
+#  connections at once.  The network is handled by one asyncio loop,
+#  access to the modules is handed to one worker thread per bus (see
+#  oom_get_bus()), so a slow read on one bus never holds up the others.
+#  Commands that are not for one port (portlist, keys, query, snapshot)
+#  run on a worker of their own, and the samplers and the snapshot
+#  refresher on their own threads, so other threads still reach a bus:
+#  the shim locks each access, and oomlib locks a module across a bank
+#  select and the access that needs it (see oomlib.bank_lock()).
+#
+#  Back-pressure: each connection gets its requests answered in turn
+#  (HTTP), or has a limit on requests in flight (binary), and the
+#  server stops reading from a client that is not reading its replies.
+#
+#  Subscriptions ('subscribe' command) are streamed back as chunked
+#  HTTP, one JSON line per sample, until the client goes away.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import asyncio
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from oom import oombinproto
+from oom.oombinproto import HEADER, MAX_PAYLOAD, FLAG_ZLIB, FLAG_ZLIB_OK
+
+MAX_INFLIGHT = 32       # binary requests in flight, per connection
+MAX_BODY = 1024 * 1024  # largest JSON request accepted
+MAX_QUEUE = 100         # samples waiting for a slow subscriber
+
+
+# the reply of one command of a batch, or an error object in its place
+def batch_reply(result):
+    if isinstance(result, Exception):
+        return json.dumps({'error': str(result)})
+    if result is None:
+        return '{"error": "unknown command"}'
+    return result
+
+
+class AioServer:
+    def __init__(self, json_dispatch, json_bus, bin_dispatch, bin_bus,
+                 subscribe=None, unsubscribe=None):
+        self.json_dispatch = json_dispatch
+        self.json_bus = json_bus
+        self.bin_dispatch = bin_dispatch
+        self.bin_bus = bin_bus
+        self.subscribe = subscribe
+        self.unsubscribe = unsubscribe
+        self.workers = {}   # bus: single thread executor
+
+    #
+    # The worker for a bus, None is for commands that are not for
+    # one port (portlist, snapshot...)
+    #
+    def worker(self, bus):
+        if bus not in self.workers:
+            self.workers[bus] = ThreadPoolExecutor(max_workers=1)
+        return self.workers[bus]
+
+    def run_on_bus(self, bus, func, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.worker(bus), func, *args)
+
+    #
+    # One JSON command.  The commands in a batch are spread across the
+    # bus workers, and run in order on each bus.  A command of a batch
+    # that fails (or is unknown) gets an error object as its reply, the
+    # others still get theirs.
+    #
+    async def json_command(self, command):
+        if command.get('cmd') == 'batch':
+            results = await asyncio.gather(*[self.json_command(op)
+                                             for op in command['ops']],
+                                           return_exceptions=True)
+            return '{"results": [\n%s\n]}' % ',\n'.join(
+                [batch_reply(result) for result in results])
+        bus = self.json_bus(command)
+        return await self.run_on_bus(bus, self.json_dispatch, command)
+
+    #
+    # One binary request.  Multi-reads are split across the buses.
+    #
+    async def bin_request(self, op, payload):
+        if op == oombinproto.OP_GET_MULTI:
+            reqs = oombinproto.unpack_multireq(payload)
+            replies = await asyncio.gather(*[
+                self.bin_request(oombinproto.OP_GET_MEMORY,
+                                 oombinproto.pack_memreq(*req))
+                for req in reqs])
+            return oombinproto.pack_multiret(
+                [(oombinproto.RETLEN.unpack_from(reply, 0)[0],
+                  reply[oombinproto.RETLEN.size:]) for reply in replies])
+        bus = self.bin_bus(op, payload)
+        return await self.run_on_bus(bus, self.bin_dispatch, op, payload)
+
+    #
+    # HTTP/1.1 with keep-alive, one request at a time per connection
+    #
+    async def http_client(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    (name, _, value) = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    break
+                body = await reader.readexactly(length)
+                command = self.http_subscription(request, body)
+                if command is not None:
+                    await self.http_stream(reader, writer, command)
+                    break
+                (status, reply) = await self.http_reply(request, body)
+                reply = reply.encode('utf-8')
+                writer.write(('HTTP/1.1 %s\r\n'
+                              'Content-Type: application/json\r\n'
+                              'Content-Length: %d\r\n\r\n' %
+                              (status, len(reply))).encode('latin-1') + reply)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def http_reply(self, request, body):
+        parts = request.decode('latin-1').split()
+        if len(parts) < 2 or parts[1].split('?')[0] != '/OOM':
+            return ('404 Not Found', '{}')
+        try:
+            reply = await self.json_command(json.loads(body.decode('utf-8')))
+        except Exception as err:
+            return ('500 Internal Server Error',
+                    json.dumps({'error': str(err)}))
+        if reply is None:
+            return ('400 Bad Request', '{"error": "unknown command"}')
+        return ('200 OK', reply)
+
+    # the 'subscribe' command in a request, None if it is anything else
+    def http_subscription(self, request, body):
+        if self.subscribe is None or b'subscribe' not in body:
+            return None
+        try:
+            command = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return None
+        if command.get('cmd') != 'subscribe':
+            return None
+        return command
+
+    #
+    # stream the samples of one subscription, as chunked HTTP, until
+    # the client closes the connection.  The sampler thread hands each
+    # sample to this loop, or drops it if the client is too far behind
+    #
+    async def http_stream(self, reader, writer, command):
+        loop = asyncio.get_event_loop()
+        lines = asyncio.Queue()
+
+        def put(line):
+            if lines.qsize() >= MAX_QUEUE:
+                return False
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+            return True
+
+        subscription = self.subscribe(command, put)
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: application/x-ndjson\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n')
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            while True:
+                line = asyncio.ensure_future(lines.get())
+                await asyncio.wait([line, closed],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not line.done():
+                    line.cancel()
+                    break
+                chunk = (line.result() + '\n').encode('utf-8')
+                writer.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            closed.cancel()
+            self.unsubscribe(subscription)
+
+    #
+    # binary transport, requests are pipelined, replies go out as they
+    # are ready (in any order, the request id ties them together)
+    #
+    async def bin_client(self, reader, writer):
+        inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        tasks = set()
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                (length, op, flags, reqid) = HEADER.unpack(header)
+                if length > MAX_PAYLOAD:
+                    break
+                payload = await reader.readexactly(length)
+                if flags & FLAG_ZLIB:
+                    payload = zlib.decompress(payload)
+                await inflight.acquire()   # back-pressure
+                task = asyncio.ensure_future(
+                    self.bin_answer(writer, inflight, op, flags, reqid,
+                                    payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+    async def bin_answer(self, writer, inflight, op, flags, reqid, payload):
+        try:
+            reply = await self.bin_request(op, payload)
+        except Exception as err:
+            (op, reply) = (oombinproto.OP_ERROR, str(err).encode('utf-8'))
+        try:
+            writer.write(oombinproto.pack_frame(op, reqid, reply,
+                                                flags & FLAG_ZLIB_OK))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            inflight.release()
+
+
+async def start(host, port, binport, json_dispatch, json_bus,
+                bin_dispatch, bin_bus, subscribe=None, unsubscribe=None):
+    server = AioServer(json_dispatch, json_bus, bin_dispatch, bin_bus,
+                       subscribe, unsubscribe)
+    servers = [await asyncio.start_server(server.http_client, host, port)]
+    if binport > 0:
+        servers.append(await asyncio.start_server(server.bin_client,
+                                                  host, binport))
+    return servers
+
+
+def serve(host, port, binport, json_dispatch, json_bus,
+          bin_dispatch, bin_bus, subscribe=None, unsubscribe=None):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(start(host, port, binport, json_dispatch,
+                                  json_bus, bin_dispatch, bin_bus,
+                                  subscribe, unsubscribe))
+    loop.run_forever()
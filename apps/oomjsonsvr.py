@@ -18,18 +18,38 @@ import os
 from ctypes import *
 import json
 import base64
-from flask import Flask, request
+import argparse
+import time
+import zlib
+from threading import Thread, Lock, Event
+try:
+    import queue
+except ImportError:
+    import Queue as queue               # python 2.7
+try:
+    from flask import Flask, request, Response
+except ImportError:
+    Flask = None        # no Flask, only the asyncio server (--aio) can run
 from oom.oomjsonshim import jpdict_to_cport, cport_to_json
 from oom.oomtypes import c_port_t
+from oom import oombinproto
+from oom.oombinproto import read_frame, pack_frame, MEMREQ, RETLEN
+from oom.oompagecache import PageCache
+from oom.oomquery import compile_query
+from oom.oomtypes import port_class_e
 from oom import *
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver   # python 2.7
 
 
 #
 # Read from EEPROM, pass it over the network as JSON
 #
 def oom_get_json_memory_sff(cport, address, page, offset, length):
-    port = matchport(cport, portlist.list)
-    data = oom_get_memory_sff(port, address, page, offset, length)
+    port = matchport(cport)
+    data = svr_get_memory_sff(port, address, page, offset, length)
     jsdata = base64.b64encode(data)
     js_out = '{"data": "%s",\n "length": "%s"}' % (jsdata, str(length))
     return(js_out)
@@ -39,25 +59,500 @@ def oom_get_json_memory_sff(cport, address, page, offset, length):
 # Raw write
 #
 def oom_set_json_memory_sff(cport, address, page, offset, length, data):
-    port = matchport(cport, portlist.list)
-    retlen = oom_set_memory_sff(port, address, page, offset, length, data)
+    port = matchport(cport)
+    retlen = svr_set_memory_sff(port, address, page, offset, length, data)
     js_out = '{"length": "%s"}' % str(retlen)
     return js_out
 
 
-def matchport(cport, portlist):
-    for port in portlist:
-        if cport.handle == port.c_port.handle:
-            return port
+def matchport(cport):
+    return matchhandle(oombinproto.cport_handle(cport))
+
+
+def matchhandle(handle):
+    return portlist.byhandle.get(handle)
+
+
+#
+# The bus (see oom_get_bus()) a command will use, None if the command
+# is not for one port.  The asyncio server runs each bus on its own
+# worker, so different buses are read in parallel
+#
+def port_bus(port):
+    if port is None:
+        return None
+    if not hasattr(port, 'bus'):
+        port.bus = oomlib.oom_get_bus(port)
+    return port.bus
+
+
+def json_command_bus(command):
+    if command['cmd'] in ('ogms', 'osms', 'ogkv', 'ogm'):
+        return port_bus(matchport(jpdict_to_cport(
+            json.loads(command['port']))))
     return None
 
 
+def bin_request_bus(op, payload):
+    if op in (oombinproto.OP_GET_MEMORY, oombinproto.OP_SET_MEMORY):
+        return port_bus(matchhandle(MEMREQ.unpack_from(payload, 0)[0]))
+    return None
+
+
+#
+# The server keeps one page cache for all of its clients.  Reads are
+# served from the cache, the cache goes to the module only when the
+# cache line is older than its max-age (see oompagecache.py).
+# Ports are typed (and get their key maps) the first time they are read,
+# the key maps say which cache lines are static.  A port that now holds
+# a module of another type than the last time it was typed has all of
+# its cache lines dropped.
+#
+def port_keys(port):
+    if not hasattr(port, 'mmap'):
+        if port.c_port.oom_class == port_class_e['SFF']:
+            # the type byte comes from the (shared) cache too
+            port.add_addr(0xA0)
+            port.pages[0xA0][-1] = create_string_buffer(
+                pagecache.fetch(port.port_name, 0xA0, -1,
+                                pagecache.dynamic_maxage,
+                                lambda: oomlib.oom_get_page_sff(
+                                    port, 0xA0, -1).raw), 128)
+        oomlib.init_port_keys(port)
+        port.static_pages = set()
+        if port.c_port.oom_class == port_class_e['SFF']:
+            mm = port.mmap
+            port.static_pages = set(oomlib.get_key_pages(
+                port, [key for key in mm if mm[key][0] == 0])) - \
+                set(oomlib.get_dynamic_pages(port))
+        if portlist.types.get(port.port_name, port.port_type) != \
+                port.port_type:
+            pagecache.invalidate(port.port_name)
+        portlist.types[port.port_name] = port.port_type
+        if port.port_name not in portlist.idents:
+            portlist.idents[port.port_name] = port_ident(port)
+    return port
+
+
+#
+# only the lines with static keys (and no dynamic ones) are static,
+# lines with no keys (vendor pages, VDM, no module...) may change at
+# any time, don't trust old data
+#
+def page_is_dynamic(port, address, pagekey):
+    return (address, pagekey) not in port.static_pages
+
+
+#
+# fetch one 128 byte cache line through the server's page cache
+# maxage None means use the cache's policy for this line
+#
+def svr_get_page(port, address, pagekey, maxage=None):
+    port_keys(port)
+    if maxage is None:
+        maxage = pagecache.maxage(address, pagekey,
+                                  page_is_dynamic(port, address, pagekey))
+    return pagecache.fetch(port.port_name, address, pagekey, maxage,
+                           lambda: oomlib.oom_get_page_sff(port, address,
+                                                           pagekey).raw)
+
+
+#
+# same as oom_get_memory_sff(), but through the server's page cache
+#
+def svr_get_memory_sff(port, address, page, offset, length):
+    if (port is None) or (port.c_port.oom_class != port_class_e['SFF']) or \
+            (offset < 0) or (offset + length > 256):
+        return oom_get_memory_sff(port, address, page, offset, length)
+    data = create_string_buffer(length)
+    ptr = 0
+    while ptr < length:
+        pagekey = oomlib.get_pagekey(page, offset + ptr)
+        start = (offset + ptr) % 128
+        count = min(length - ptr, 128 - start)
+        buf = svr_get_page(port, address, pagekey)
+        data[ptr:ptr + count] = buf[start:start + count]
+        ptr += count
+    return data
+
+
+# write, then drop the cache lines that were written to
+def svr_set_memory_sff(port, address, page, offset, length, data):
+    retlen = oom_set_memory_sff(port, address, page, offset, length, data)
+    if port is not None:
+        for pagekey in set((oomlib.get_pagekey(page, offset),
+                            oomlib.get_pagekey(page, offset + length - 1))):
+            pagecache.invalidate(port.port_name, address, pagekey)
+    return retlen
+
+
+#
+# Decode keys on the server: the pages the keys need are copied from
+# the server's page cache into the port's own page cache, then decoded
+# from there.  dynmaxage is the max-age for the dynamic pages (None for
+# the page cache's usual max-age)
+#
+def svr_get_keyvalues(port, keys, dynmaxage=None):
+    port_keys(port)
+    if port.c_port.oom_class != port_class_e['SFF']:
+        return dict([(key, oom_get_keyvalue(port, key)) for key in keys])
+    for (address, pagekey) in oomlib.get_key_pages(port, keys):
+        maxage = None
+        if page_is_dynamic(port, address, pagekey):
+            maxage = dynmaxage
+        data = svr_get_page(port, address, pagekey, maxage)
+        if address not in port.pages:
+            port.add_addr(address)
+        port.pages[address][pagekey] = create_string_buffer(data, 128)
+    return dict([(key, oomlib.oom_get_keyvalue_cached(port, key))
+                 for key in keys])
+
+
+#
+# the keys named by a list of key names and function names (eg: 'DOM')
+# that exist on this port, in order, without duplicates
+#
+def svr_key_list(port, names):
+    port_keys(port)
+    keys = []
+    for name in names:
+        for key in port.fmap.get(name, (name,)):
+            if key in port.mmap and key not in keys:
+                keys.append(key)
+    return keys
+
+
+# the 'maxage' of a command, None if it has none
+def command_maxage(command):
+    if 'maxage' not in command:
+        return None
+    return float(command['maxage'])
+
+
+# a decoded value as JSON, raw bytes are sent as a hex string
+def value_to_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = ''.join(['%02x' % c for c in bytearray(value)])
+    try:
+        return json.dumps(value)
+    except (TypeError, ValueError):
+        return json.dumps(str(value))
+
+
+#
+# Subscriptions: a client names ports (none for all ports), keys or
+# function names, and an interval, and gets back a stream of samples,
+# one JSON line per sample:
+#   {"timestamp": "...", "ports": {"port0": {"KEY": value, ...}, ...}}
+# With 'deltas', a sample only carries the keys that changed since the
+# sample before (a port that went away is null), and samples with no
+# change are not sent, except one every HEARTBEAT seconds.  The first
+# sample a subscriber gets is always complete.
+#
+# All the subscribers of the same (ports, keys, interval) share one
+# Sampler, one thread that reads and decodes each sample once, and
+# hands it to all of them.  A subscriber that falls behind (its queue
+# is full) loses samples, and gets a complete sample when it catches up.
+#
+MIN_INTERVAL = 0.1
+HEARTBEAT = 15
+MAX_QUEUE = 100
+
+
+class Subscriber:
+    def __init__(self, deltas, put):
+        self.deltas = deltas
+        self.put = put          # put(line) returns False if it is full
+        self.resync = True      # the next sample must be complete
+
+    def deliver(self, full, delta):
+        line = full
+        if self.deltas and not self.resync:
+            line = delta
+        if line is None:
+            return
+        self.resync = not self.put(line)
+
+
+class Sampler:
+    def __init__(self, ident, ports, names, interval):
+        self.ident = ident
+        self.ports = ports      # port names, empty for all ports
+        self.names = names
+        self.interval = interval
+        self.subscribers = []
+        self.last = {}          # port name: {key: value as JSON}
+        self.full = None        # the last complete sample
+        self.sent = 0           # time the last sample was sent
+        self.stop = Event()
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stop.is_set():
+            start = time.time()
+            try:
+                self.tick()
+            except Exception as err:
+                print('subscription sample failed: %s' % str(err))
+            self.stop.wait(max(0, self.interval - (time.time() - start)))
+
+    def sample(self):
+        return svr_sample(self.ports, self.names,
+                          min(self.interval, pagecache.dynamic_maxage))
+
+    def tick(self):
+        values = self.sample()
+        now = time.time()
+        delta = []
+        for (name, vals) in values:
+            old = self.last.get(name, {})
+            changed = dict([(key, vals[key]) for key in vals
+                            if old.get(key) != vals[key]])
+            if changed:
+                delta.append((name, changed))
+        names = [name for (name, vals) in values]
+        for name in self.last:
+            if name not in names:
+                delta.append((name, None))
+        self.last = dict(values)
+        js_full = sample_to_json(now, values)
+        js_delta = None
+        if delta or (now - self.sent) >= HEARTBEAT:
+            js_delta = sample_to_json(now, delta)
+            self.sent = now
+        # (under the lock, so a new subscriber gets each sample once)
+        with subscriptions.lock:
+            self.full = js_full
+            for subscriber in self.subscribers:
+                subscriber.deliver(js_full, js_delta)
+
+
+#
+# decode keys (or functions) on ports (port names, empty for all ports)
+# returns [(port name, {key: value as JSON})], in portlist order
+#
+def svr_sample(ports, names, dynmaxage=None):
+    if portlist.list == []:
+        refresh_portlist()
+    values = []
+    for port in list(portlist.list):
+        if ports and port.port_name not in ports:
+            continue
+        keys = svr_key_list(port, names)
+        vals = svr_get_keyvalues(port, keys, dynmaxage)
+        values.append((port.port_name,
+                       dict([(key, value_to_json(vals[key]))
+                             for key in keys])))
+    return values
+
+
+#
+# the ports (port names, empty for all ports) that match a query, with
+# the keys that matched, and the keys (or functions) named in 'names'
+# returns [(port name, {key: value as JSON})], in portlist order
+#
+def svr_query(query, ports, names, dynmaxage=None):
+    if portlist.list == []:
+        refresh_portlist()
+    values = []
+    for port in list(portlist.list):
+        if ports and port.port_name not in ports:
+            continue
+        port_keys(port)
+        keys = query.keys(port)
+        if keys == []:
+            continue
+        vals = svr_get_keyvalues(port, keys, dynmaxage)
+        (matched, hits) = query.evaluate(vals)
+        if not matched:
+            continue
+        extra = [key for key in svr_key_list(port, names) if key not in hits]
+        vals.update(svr_get_keyvalues(port, extra, dynmaxage))
+        values.append((port.port_name,
+                       dict([(key, value_to_json(vals[key]))
+                             for key in hits + extra])))
+    return values
+
+
+def sample_to_json(timestamp, values):
+    js_ports = []
+    for (name, vals) in values:
+        if vals is None:
+            js_ports.append('%s: null' % json.dumps(name))
+            continue
+        js_keys = ['"%s": %s' % (key, vals[key]) for key in sorted(vals)]
+        js_ports.append('%s: {%s}' % (json.dumps(name), ', '.join(js_keys)))
+    return '{"timestamp": "%f", "ports": {%s}}' % \
+        (timestamp, ', '.join(js_ports))
+
+
+class subscriptions:
+    samplers = {}       # (ports, names, interval): Sampler
+    lock = Lock()
+
+subscriptions = subscriptions()
+
+
+#
+# add a subscriber for a 'subscribe' command, put(line) takes the
+# samples, returns (sampler, subscriber), for oom_json_unsubscribe()
+#
+def oom_json_subscribe(command, put):
+    ports = tuple(sorted(command.get('ports', ())))
+    names = tuple(command.get('keys', ('DOM',)))
+    interval = max(MIN_INTERVAL, float(command.get('interval', 1.0)))
+    deltas = int(command.get('deltas', 1)) > 0
+    subscriber = Subscriber(deltas, put)
+    ident = (ports, names, interval)
+    with subscriptions.lock:
+        sampler = subscriptions.samplers.get(ident)
+        if sampler is None:
+            sampler = Sampler(ident, ports, names, interval)
+            subscriptions.samplers[ident] = sampler
+        sampler.subscribers.append(subscriber)
+        if sampler.full is not None:     # don't wait for the next sample
+            subscriber.deliver(sampler.full, None)
+    return (sampler, subscriber)
+
+
+# the last subscriber of a sampler stops it
+def oom_json_unsubscribe(subscription):
+    (sampler, subscriber) = subscription
+    with subscriptions.lock:
+        if subscriber in sampler.subscribers:
+            sampler.subscribers.remove(subscriber)
+        if sampler.subscribers == []:
+            sampler.stop.set()
+            subscriptions.samplers.pop(sampler.ident, None)
+
+
+#
+# the stream of samples for one subscriber, as lines of JSON
+#
+def subscription_lines(command):
+    lines = queue.Queue(MAX_QUEUE)
+
+    def put(line):
+        try:
+            lines.put_nowait(line)
+            return True
+        except queue.Full:
+            return False
+
+    subscription = oom_json_subscribe(command, put)
+    try:
+        while True:
+            yield lines.get() + '\n'
+    finally:
+        oom_json_unsubscribe(subscription)
+
+
+#
+# The snapshot: the static pages and the DOM pages of every port,
+# in one reply, built from the page cache.  A background thread
+# (see refresh_snapshot()) keeps it current, so a snapshot request
+# never waits for the modules.  Without it (or if it misses a refresh),
+# a request rebuilds a snapshot older than the dynamic max-age.
+#
+class snapshot:
+    js = None
+    time = 0
+    interval = 0        # of the background refresh, 0 for none
+
+snapshot = snapshot()
+
+
+def snapshot_pages(port):
+    mm = port.mmap
+    if mm == {}:
+        return [(0xA0, -1)]     # enough to see if a module shows up
+    static = [key for key in mm if mm[key][0] == 0]
+    pages = oomlib.get_key_pages(port, static)
+    for line in oomlib.get_key_pages(port, port.fmap.get('DOM', ())):
+        if line not in pages:
+            pages.append(line)
+    return pages
+
+
+#
+# re-read the DOM pages (dynmaxage, None for the usual max-age) and any
+# expired static pages, rebuild the snapshot reply
+#
+def build_snapshot(dynmaxage=None):
+    if portlist.list == []:
+        refresh_portlist()
+    js_ports = []
+    for port in list(portlist.list):
+        if port.c_port.oom_class != port_class_e['SFF']:
+            continue
+        port_keys(port)
+        js_pages = []
+        for (address, pagekey) in snapshot_pages(port):
+            maxage = None
+            if page_is_dynamic(port, address, pagekey):
+                maxage = dynmaxage
+            data = svr_get_page(port, address, pagekey, maxage)
+            js_pages.append('{"address": "%d", "page": "%d", "data": "%s"}'
+                            % (address, pagekey,
+                               base64.b64encode(data).decode('ascii')))
+        js_ports.append('{"port": %s,\n "port_type": "%d",\n "pages": [%s]}'
+                        % (cport_to_json(port.c_port), port.port_type,
+                           ',\n\t'.join(js_pages)))
+    now = time.time()
+    snapshot.js = '{"timestamp": "%f", "ports": [\n%s\n]}' % \
+        (now, ',\n'.join(js_ports))
+    snapshot.time = now
+    return snapshot.js
+
+
+def refresh_snapshot(interval):
+    snapshot.interval = interval
+    while True:
+        start = time.time()
+        try:
+            build_snapshot(0)
+        except Exception as err:
+            print('snapshot refresh failed: %s' % str(err))
+        time.sleep(max(0, interval - (time.time() - start)))
+
+
+def oom_get_json_snapshot():
+    maxage = max(pagecache.dynamic_maxage, 2 * snapshot.interval)
+    if snapshot.js is None or time.time() - snapshot.time > maxage:
+        return build_snapshot()
+    return snapshot.js
+
+
+#
+# re-inventory the ports, forget cached pages of ports that are gone,
+# and of ports that now hold another module
+#
+def refresh_portlist():
+    newlist = oom_get_portlist()
+    idents = {}
+    for port in newlist:
+        old = portlist.idents.get(port.port_name)
+        if old is None:
+            continue        # not in use, not read
+        idents[port.port_name] = port_ident(port)
+        if idents[port.port_name] != old:
+            pagecache.invalidate(port.port_name)
+    portlist.idents = idents
+    portlist.byhandle = dict([(oombinproto.cport_handle(port.c_port), port)
+                              for port in newlist])
+    portlist.list = newlist
+    pagecache.retain(set([port.port_name for port in portlist.list]))
+    return portlist.list
+
+
 #
 # Simulate oomsouth.oom_get_portlist(0,0)
 # In fact, call oom_get_portlist(), cache the portlist, return it's length
 #
 def oom_get_json_portlist_zeros():
-    portlist.list = oom_get_portlist()
+    refresh_portlist()
     numports = len(portlist.list)
     return '{"numports": "%d"}' % numports
 
@@ -67,10 +562,35 @@ def oom_get_json_portlist_zeros():
 #
 def oom_get_json_portlist():
     if portlist.list == []:
-        portlist.list = oom_get_portlist()
+        refresh_portlist()
     return port_list_to_json(portlist.list)
 
 
+#
+# The identity of the module in a port, so that clients can keep static
+# data across portlist refreshes, for as long as the same module is
+# there.  A CRC of the type and the vendor name, part number and serial
+# number (see oomlib.read_port_ident()), 0 if the module can't be
+# identified (eg: no module).
+# Always read from the module (two small reads, not from the page
+# cache), by refresh_portlist(), and only for the ports in use (ports
+# that have been read since the portlist before), the others are 0
+# until they are read.
+#
+def port_ident(port):
+    if port.c_port.oom_class != port_class_e['SFF']:
+        return 0
+    (ptype, ident) = oomlib.read_port_ident(port)
+    if ident == b'':
+        return 0
+    return zlib.crc32(bytes(bytearray([ptype])) + ident) & 0xFFFFFFFF
+
+
+# the identity of the module in a port, as of the last portlist refresh
+def known_ident(port):
+    return portlist.idents.get(port.port_name, 0)
+
+
 def port_list_to_json(portlist):
     js_out = '{"portlist":[\n\t'
     first = 1
@@ -80,7 +600,8 @@ def port_list_to_json(portlist):
         else:
             first = 0
 
-        js_out += cport_to_json(port.c_port)
+        js_out += '%s, "ident": "%08x"}' % (cport_to_json(port.c_port)[:-1],
+                                            known_ident(port))
     js_out += '\n\t]}'
     return js_out
 
@@ -89,20 +610,56 @@ def json_to_numports(js):
     # json to dict, dict to value string, string to int
     return int(json.loads(js)["numports"])
 
+
+# receive all requests, hand them to the dispatcher
+def getOOMdata():
+    command = request.json
+    if verbose.on:
+        print('command:')
+        print(command)
+    if command['cmd'] == 'subscribe':
+        return Response(subscription_lines(command),
+                        mimetype='application/x-ndjson')
+    reply = oom_json_dispatch(command)
+    if reply is None:     # same as oomaiosvr.py
+        return ('{"error": "unknown command"}', 400)
+    return reply
+
+
+class verbose:
+    on = False
+
+verbose = verbose()
+
 #
 # Start up the Flask server
+# set up the one URL that I'm listening to for requests
 #
-app = Flask(__name__)
+if Flask is not None:
+    app = Flask(__name__)
+    app.route('/OOM', methods=['GET'])(getOOMdata)
 
 
-# set up the one URL that I'm listening to for requests
-# receive all requests, unpack the parameters and send them to the
-# right routine
-@app.route('/OOM', methods=['GET'])
-def getOOMdata():
-    command = request.json
-    print('command:')
-    print(command)
+#
+# one command of a batch, an error object in place of its reply if it
+# fails, or is not a command (eg: 'subscribe' can't be batched), so the
+# other replies still get back
+#
+def batch_op(op):
+    try:
+        reply = oom_json_dispatch(op)
+    except Exception as err:
+        return json.dumps({'error': str(err)})
+    if reply is None:
+        return '{"error": "unknown command"}'
+    return reply
+
+
+#
+# unpack the parameters of one command and send them to the right routine
+# returns the JSON reply for that command
+#
+def oom_json_dispatch(command):
     # 'ogp0' means oom_get_portlist(0, 0)
     if command['cmd'] == 'ogp0':
         js = oom_get_json_portlist_zeros()
@@ -140,16 +697,192 @@ def getOOMdata():
         retval = oom_set_json_memory_sff(cport, address, page, offset,
                                          length, data)
         return retval
+    # 'batch' carries a list of the commands above, executed in order,
+    # the replies come back as a list, in the same order
+    if command['cmd'] == 'batch':
+        results = [batch_op(op) for op in command['ops']]
+        return '{"results": [\n%s\n]}' % ',\n'.join(results)
+    # Northbound (decoded) commands, decoded on the switch, from the
+    # page cache.  'maxage' (optional) is the oldest dynamic data wanted
+    # 'ogkv' means 'oom_get_keyvalue()'
+    if command['cmd'] == 'ogkv':
+        port = matchport(jpdict_to_cport(json.loads(command['port'])))
+        if port is None:
+            return '{"value": null}'
+        values = svr_get_keyvalues(port, svr_key_list(port,
+                                                      [command['key']]),
+                                   command_maxage(command))
+        return '{"value": %s}' % value_to_json(values.get(command['key'],
+                                                          ''))
+    # 'ogm' means 'oom_get_memory()'
+    if command['cmd'] == 'ogm':
+        port = matchport(jpdict_to_cport(json.loads(command['port'])))
+        if port is None:
+            return '{"values": null}'
+        if command['function'] not in port_keys(port).fmap:
+            return '{"values": null}'
+        values = svr_get_keyvalues(port, svr_key_list(
+                                   port, [command['function']]),
+                                   command_maxage(command))
+        return '{"values": {%s}}' % ', '.join(
+            ['"%s": %s' % (key, value_to_json(values[key]))
+             for key in sorted(values)])
+    # 'keys' means keys and/or functions, on many (default all) ports,
+    # the reply looks like one subscription sample
+    if command['cmd'] == 'keys':
+        return sample_to_json(time.time(),
+                              svr_sample(command.get('ports', ()),
+                                         command['keys'],
+                                         command_maxage(command)))
+    # 'query' returns the ports (default all) that match a predicate
+    # (see oomquery.py), with the keys that matched, plus any 'keys'
+    if command['cmd'] == 'query':
+        try:
+            query = compile_query(command['where'])
+        except ValueError as err:
+            return '{"error": %s}' % json.dumps(str(err))
+        return sample_to_json(time.time(),
+                              svr_query(query, command.get('ports', ()),
+                                        command.get('keys', ()),
+                                        command_maxage(command)))
+    # 'snapshot' returns the static and DOM pages of all ports
+    if command['cmd'] == 'snapshot':
+        return oom_get_json_snapshot()
+    # 'caps' tells the client what else this server can do
+    if command['cmd'] == 'caps':
+        return '{"batch": "1", "binary": "%d", "zlib": "1", ' \
+               '"snapshot": "1", "subscribe": "1", "keys": "1", ' \
+               '"query": "1", ' \
+               '"version": "%d"}' % \
+               (binserver.port, oombinproto.PROTO_VERSION)
+
+
+#
+# The binary transport (see oombinproto.py), same operations as the
+# JSON commands, raw bytes instead of JSON+base64
+# returns the reply payload for one request
+#
+def oom_bin_dispatch(op, payload):
+    if op == oombinproto.OP_PORTCOUNT:      # 'ogp0' + 'ogp'
+        refresh_portlist()
+        return bin_portlist()
+    if op == oombinproto.OP_PORTLIST:       # 'ogp'
+        if portlist.list == []:
+            refresh_portlist()
+        return bin_portlist()
+    if op == oombinproto.OP_GET_MEMORY:     # 'ogms'
+        return oom_bin_memory_sff(MEMREQ.unpack_from(payload, 0))
+    if op == oombinproto.OP_GET_MULTI:      # 'batch' of 'ogms'
+        results = []
+        for req in oombinproto.unpack_multireq(payload):
+            reply = oom_bin_memory_sff(req)
+            results.append((RETLEN.unpack_from(reply, 0)[0],
+                            reply[RETLEN.size:]))
+        return oombinproto.pack_multiret(results)
+    if op == oombinproto.OP_SET_MEMORY:     # 'osms'
+        (handle, address, page, offset, length) = \
+            MEMREQ.unpack_from(payload, 0)
+        port = matchhandle(handle)
+        data = create_string_buffer(payload[MEMREQ.size:], length)
+        retlen = svr_set_memory_sff(port, address, page, offset, length, data)
+        return RETLEN.pack(retlen)
+    raise ValueError('unknown oom binary op: %d' % op)
+
+
+def bin_portlist():
+    return oombinproto.pack_portlist([port.c_port for port in portlist.list],
+                                     [known_ident(port)
+                                      for port in portlist.list])
+
+
+def oom_bin_memory_sff(req):
+    (handle, address, page, offset, length) = req
+    port = matchhandle(handle)
+    data = svr_get_memory_sff(port, address, page, offset, length)
+    return RETLEN.pack(length) + data.raw[0:length]
+
+
+#
+# One binary connection: read requests, answer them in order.
+# The client may send more requests before reading the replies.
+#
+class BinHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                (op, flags, reqid, payload) = read_frame(self.request)
+            except (EOFError, IOError, OSError):
+                return
+            try:
+                reply = oom_bin_dispatch(op, payload)
+            except Exception as err:
+                (op, reply) = (oombinproto.OP_ERROR, str(err).encode('utf-8'))
+            self.request.sendall(pack_frame(op, reqid, reply,
+                                            flags & oombinproto.FLAG_ZLIB_OK))
+
+
+class binserver:
+    port = 0    # 0 means the binary transport is not running
+
+binserver = binserver()
+
+
+def start_binserver(port):
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(('0.0.0.0', port), BinHandler)
+    server.daemon_threads = True
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    binserver.port = server.server_address[1]
+    return server
 
 
 class portlist:
     list = []
+    byhandle = {}       # handle: port, for matchport()
+    types = {}          # port name: port type, the last time it was typed
+    idents = {}         # port name: port_ident(), for the ports in use
 
 portlist = portlist()
 oomlib.oom_portlist_nokeys = 1    # secret speedup for oom_get_portlist()
+pagecache = PageCache(static_maxage=300, dynamic_maxage=1.0)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--binport", type=int, default=5001,
+                        help="TCP port for the binary transport, 0 to disable")
+    parser.add_argument("--static-maxage", type=float, default=300,
+                        help="seconds to keep static pages cached")
+    parser.add_argument("--dynamic-maxage", type=float, default=1.0,
+                        help="seconds to keep dynamic (DOM) pages cached")
+    parser.add_argument("-r", "--refresh", type=float, default=10,
+                        help="seconds between snapshot refreshes, 0 for none")
+    parser.add_argument("-a", "--aio", action="store_true",
+                        help="use the concurrent asyncio server, not Flask")
+    parser.add_argument("-p", "--port", type=int, default=5000,
+                        help="TCP port for the JSON server")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print every command received")
+    args = parser.parse_args()
+    verbose.on = args.verbose
+    pagecache.static_maxage = args.static_maxage
+    pagecache.dynamic_maxage = args.dynamic_maxage
+    if args.refresh > 0:
+        refresher = Thread(target=refresh_snapshot, args=(args.refresh,))
+        refresher.daemon = True
+        refresher.start()
+    if args.aio or Flask is None:
+        import oomaiosvr      # python 3 only
+        binserver.port = args.binport
+        oomaiosvr.serve('0.0.0.0', args.port, args.binport,
+                        oom_json_dispatch, json_command_bus,
+                        oom_bin_dispatch, bin_request_bus,
+                        oom_json_subscribe, oom_json_unsubscribe)
+        exit()
+    if args.binport > 0:
+        start_binserver(args.binport)
     # to debug locally use:
     # app.run(debug=True)
     # to be visible across the network, use:
-    app.run(host='0.0.0.0')
+    app.run(host='0.0.0.0', port=args.port)
@@ -65,6 +65,16 @@ The additional keys will be available to all subsequent users of OOM
 To deactivate, remove the file: 'rm ./keyfiles/addonsample.py', and
 re-install: 'cd ..; python setup.py install'
 
+A keyfile may say which port types it serves, with a 'port_types'
+line (eg: port_types = (0xD,) for QSFP+ only).  Then it is only imported
+when a port of one of those types is seen, and its add_keys() is called
+once per type, not per port, to build the (cached) keys of the type:
+the 'port' it gets only has port_type and the maps, it can't read the
+EEPROM or look at anything else.  Without it (as here), add_keys() is
+called for every port, as described above, and must check the port
+type itself.  Add-ons that look at the module (vendor specific keys,
+spec revisions...) must not declare port_types.
+
 See the files already in the keyfiles directory for a rich list of
 keys and their extractor functions.
 See decode.py for the exhaustive list of extractor functions in OOM
@@ -152,6 +152,83 @@ def get_signed_current(x):  # return in mA
     return result
 
 
+# lane vectors: a run of 2 byte values, one per lane (eg: the 8 lane
+# monitors of a CMIS module), decoded from one block into a list
+def get_words(x):
+    data = bytearray(x)
+    return [data[i]*256 + data[i+1] for i in range(0, len(data) - 1, 2)]
+
+
+def get_power_lanes(x):  # return a list, in mW, one per lane
+    """ Decodes and returns the power of each lane (in mW)"""
+    return [float(temp*0.1/1000) for temp in get_words(x)]
+
+
+def get_power_dbm_lanes(x):  # return a list, in dBm, one per lane
+    """ Decodes and returns the power of each lane (in dBm)"""
+    return [mwtodbm(power) for power in get_power_lanes(x)]
+
+
+def get_current_lanes(x):  # return a list, in mA, one per lane
+    """ Decodes and returns the current of each lane (in mA)"""
+    return [float(temp/500.0) for temp in get_words(x)]
+
+
+# CMIS VDM (Versatile Diagnostics Monitoring) observable types:
+# type ID: (key name, decoder, scale), key names get the lane added
+vdm_type_dict = {
+    1: ('VDM_LASER_AGE', 'get_vdm_u16', 1),                  # %
+    2: ('VDM_TEC_CURRENT', 'get_vdm_s16', 100.0/32767),      # %
+    3: ('VDM_LASER_FREQ_ERROR', 'get_vdm_s16', 10),          # MHz
+    4: ('VDM_LASER_TEMP', 'get_vdm_s16', 1/256.0),           # 'C
+    5: ('VDM_ESNR_MEDIA', 'get_vdm_u16', 1/256.0),           # dB
+    6: ('VDM_ESNR_HOST', 'get_vdm_u16', 1/256.0),            # dB
+    7: ('VDM_LTP_MEDIA', 'get_vdm_u16', 1/256.0),            # dB
+    8: ('VDM_LTP_HOST', 'get_vdm_u16', 1/256.0),             # dB
+    9: ('VDM_PREFEC_BER_MIN_MEDIA', 'get_vdm_f16', 1),
+    10: ('VDM_PREFEC_BER_MIN_HOST', 'get_vdm_f16', 1),
+    11: ('VDM_PREFEC_BER_MAX_MEDIA', 'get_vdm_f16', 1),
+    12: ('VDM_PREFEC_BER_MAX_HOST', 'get_vdm_f16', 1),
+    13: ('VDM_PREFEC_BER_AVG_MEDIA', 'get_vdm_f16', 1),
+    14: ('VDM_PREFEC_BER_AVG_HOST', 'get_vdm_f16', 1),
+    15: ('VDM_PREFEC_BER_CUR_MEDIA', 'get_vdm_f16', 1),
+    16: ('VDM_PREFEC_BER_CUR_HOST', 'get_vdm_f16', 1),
+    17: ('VDM_FERC_MIN_MEDIA', 'get_vdm_f16', 1),    # errored frames
+    18: ('VDM_FERC_MIN_HOST', 'get_vdm_f16', 1),
+    19: ('VDM_FERC_MAX_MEDIA', 'get_vdm_f16', 1),
+    20: ('VDM_FERC_MAX_HOST', 'get_vdm_f16', 1),
+    21: ('VDM_FERC_AVG_MEDIA', 'get_vdm_f16', 1),
+    22: ('VDM_FERC_AVG_HOST', 'get_vdm_f16', 1),
+    23: ('VDM_FERC_CUR_MEDIA', 'get_vdm_f16', 1),
+    24: ('VDM_FERC_CUR_HOST', 'get_vdm_f16', 1),
+    }
+
+
+# a page of VDM descriptors (64 of 2 bytes each), returns a list of
+# (type ID, lane (1-16), threshold set), type ID 0 is an unused slot
+def get_vdm_descriptors(x):
+    data = bytearray(x)
+    return [(data[i+1], (data[i] & 0xF) + 1, data[i] >> 4)
+            for i in range(0, len(data) - 1, 2)]
+
+
+def get_vdm_u16(x, scale):
+    return get_words(x)[0] * scale
+
+
+def get_vdm_s16(x, scale):
+    temp = get_words(x)[0]
+    if temp > 0x7FFF:   # if the sign bit is set
+        temp -= 65536   # take two's complement
+    return temp * scale
+
+
+# F16: 5 bit exponent, 11 bit mantissa, value is mantissa * 10^(exp - 24)
+def get_vdm_f16(x, scale=1):
+    temp = get_words(x)[0]
+    return (temp & 0x7FF) * 10.0 ** ((temp >> 11) - 24) * scale
+
+
 def get_string(x):  # copy the cbuffer into a string
     """ Decodes and returns string from the raw data"""
     if isinstance(x, bytes):
@@ -565,11 +642,7 @@ def collapse_cfp(data):
     if len(data) < 2:
         return ''
     newdata = create_string_buffer(int(len(data)/2))
-    i = 0
-    for c in data:
-        if (i % 2) == 1:
-            newdata[int(i/2)] = c
-        i += 1
+    newdata[0:len(newdata)] = bytes(bytearray(data)[1::2])
     return newdata
 
 
@@ -577,12 +650,12 @@ def collapse_cfp(data):
 # (except, expand_cfp(collapse_cfp(string)) will delete the last byte
 # if string is of odd length)
 def expand_cfp(data):
+    if isinstance(data, type(u'')):
+        data = data.encode('utf-8')
     newdata = create_string_buffer(int(len(data)*2))
-    i = 0
-    for c in data:
-        newdata[i*2] = '\0'
-        newdata[i*2+1] = c
-        i += 1
+    expanded = bytearray(len(newdata))
+    expanded[1::2] = bytearray(data)
+    newdata[0:len(newdata)] = bytes(expanded)
     return newdata
 
 
@@ -26,7 +26,7 @@
 #     with the bit field in the low order bits
 #
 # Key attributes are:
-#   Dynamic: 0 if not dynamic, 1 if it is (OOM doesn't currently cache CFP)
+#   Dynamic: 0 if not dynamic, 1 if it is (don't cache dynamic keys)
 #   Decoder: name of the decoder function (these are in decode.py)
 #   Collapse: 0 if 16 bits of the register are used, 1 if only 8 bits
 #   Address: WORD address where the data starts (matches the spec)
@@ -43,8 +43,8 @@ new_mm_keys = {             # dynamic?, decoder, collapse, addr, length, BO, BL
      'VENDOR_OUI':       (0, 'get_bytes',       1, 0x8031, 3),
      'VENDOR_PN':        (0, 'get_string',      1, 0x8034, 16),
      'VENDOR_SN':        (0, 'get_string',      1, 0x8044, 16),
-     'TEMPERATURE':      (0, 'get_temperature', 0, 0xA02F, 1),
-     'SUPPLY_VOLTAGE':   (0, 'get_voltage',     0, 0xA030, 1),
+     'TEMPERATURE':      (1, 'get_temperature', 0, 0xA02F, 1),
+     'SUPPLY_VOLTAGE':   (1, 'get_voltage',     0, 0xA030, 1),
      'MAX_LASER_FREQ_THZ': (0, 'get_freq',      1, 0x818A, 4),
      'MIN_LASER_FREQ_THZ': (0, 'get_freq',      1, 0x818E, 4),
      'TX_GRID_SPACE_0':  (0, 'get_bits',        0, 0xB400, 1, 15, 3),
@@ -72,6 +72,10 @@ new_wm_keys = {
        }
 
 
+# the port types these keys serve (see keyfiles_c in oomlib.py)
+port_types = ((0x100, 0x1FF),)          # all of the CFP types
+
+
 # add these keys to the memory map, function map, write map for
 # all CFP class devices
 def add_keys(port):
@@ -13,6 +13,8 @@
 #   Decoder: name of the decoder function (these are in decode.py)
 #   Addr: i2c address (usually 0xA0 or 0xA2)
 #   Page: page the data lives in
+#       Note: pages 0x10-0xFF are banked, page P of bank B is written
+#       B * 0x100 + P, eg: 0x111 is page 0x11 of bank 1 (lanes 9-16)
 #   Offset: byte address where the data starts
 #       Note: if offset < 128, then the page value is not used
 #       Offsets from 0-127 are in the low memory of Addr
@@ -31,6 +33,7 @@ new_mm_keys = {        # dynamic?, decoder, addr, page, offset,length, BO, BL
     #    'IDENTIFIER':       (0, 'get_int', 0xA0, 0, 0, 1),
     'REV_COMPLIANCE':   (0, 'get_int', 0xA0, 0, 1, 1),
     'FLAT_MEM':         (0, 'get_bits', 0xA0, 0, 2, 1, 7, 1),
+    'INT_L':            (1, 'get_bits', 0xA0, 0, 3, 1, 0, 1),
 
     'L_TEMP_ALARM_WARN':   (1, 'get_bits', 0xA0, 0, 9, 1, 3, 4),  # all 4 temps
     'L_TEMP_HIGH_ALARM':   (1, 'get_bits', 0xA0, 0, 9, 1, 0, 1),
@@ -49,7 +52,7 @@ new_mm_keys = {        # dynamic?, decoder, addr, page, offset,length, BO, BL
     'SUPPLY_VOLTAGE':         (1, 'get_voltage', 0xA0, 0, 16, 2),
 
     # Channel Monitors Bytes (current values, not alarms/warnings)
-    # These are on the 'bank' pages, we are only looking at bank 1
+    # These are on the 'bank' pages, lanes 1-8 are in bank 0
     'RX1_POWER':        (1, 'get_power', 0xA0, 0x11, 186, 2),
     'RX1_POWER_DBM':    (1, 'get_power_dbm', 0xA0, 0x11, 186, 2),
     'RX2_POWER':        (1, 'get_power', 0xA0, 0x11, 188, 2),
@@ -91,6 +94,61 @@ new_mm_keys = {        # dynamic?, decoder, addr, page, offset,length, BO, BL
     'TX8_POWER':        (1, 'get_power', 0xA0, 0x11, 168, 2),
     'TX8_POWER_DBM':    (1, 'get_power_dbm', 0xA0, 0x11, 168, 2),
 
+    # the same monitors as lane vectors, a list of 8 values (lanes 1-8)
+    # decoded from one block, all three from one read of bytes 154-201
+    'TX_POWER_LANES':     (1, 'get_power_lanes', 0xA0, 0x11, 154, 16),
+    'TX_POWER_DBM_LANES': (1, 'get_power_dbm_lanes', 0xA0, 0x11, 154, 16),
+    'TX_BIAS_LANES':      (1, 'get_current_lanes', 0xA0, 0x11, 170, 16),
+    'RX_POWER_LANES':     (1, 'get_power_lanes', 0xA0, 0x11, 186, 16),
+    'RX_POWER_DBM_LANES': (1, 'get_power_dbm_lanes', 0xA0, 0x11, 186, 16),
+
+    # lanes 9-16 (16 lane modules), on the same page of bank 1
+    'RX9_POWER':        (1, 'get_power', 0xA0, 0x111, 186, 2),
+    'RX9_POWER_DBM':    (1, 'get_power_dbm', 0xA0, 0x111, 186, 2),
+    'RX10_POWER':       (1, 'get_power', 0xA0, 0x111, 188, 2),
+    'RX10_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 188, 2),
+    'RX11_POWER':       (1, 'get_power', 0xA0, 0x111, 190, 2),
+    'RX11_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 190, 2),
+    'RX12_POWER':       (1, 'get_power', 0xA0, 0x111, 192, 2),
+    'RX12_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 192, 2),
+    'RX13_POWER':       (1, 'get_power', 0xA0, 0x111, 194, 2),
+    'RX13_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 194, 2),
+    'RX14_POWER':       (1, 'get_power', 0xA0, 0x111, 196, 2),
+    'RX14_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 196, 2),
+    'RX15_POWER':       (1, 'get_power', 0xA0, 0x111, 198, 2),
+    'RX15_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 198, 2),
+    'RX16_POWER':       (1, 'get_power', 0xA0, 0x111, 200, 2),
+    'RX16_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 200, 2),
+    'TX9_BIAS':         (1, 'get_current', 0xA0, 0x111, 170, 2),
+    'TX10_BIAS':        (1, 'get_current', 0xA0, 0x111, 172, 2),
+    'TX11_BIAS':        (1, 'get_current', 0xA0, 0x111, 174, 2),
+    'TX12_BIAS':        (1, 'get_current', 0xA0, 0x111, 176, 2),
+    'TX13_BIAS':        (1, 'get_current', 0xA0, 0x111, 178, 2),
+    'TX14_BIAS':        (1, 'get_current', 0xA0, 0x111, 180, 2),
+    'TX15_BIAS':        (1, 'get_current', 0xA0, 0x111, 182, 2),
+    'TX16_BIAS':        (1, 'get_current', 0xA0, 0x111, 184, 2),
+    'TX9_POWER':        (1, 'get_power', 0xA0, 0x111, 154, 2),
+    'TX9_POWER_DBM':    (1, 'get_power_dbm', 0xA0, 0x111, 154, 2),
+    'TX10_POWER':       (1, 'get_power', 0xA0, 0x111, 156, 2),
+    'TX10_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 156, 2),
+    'TX11_POWER':       (1, 'get_power', 0xA0, 0x111, 158, 2),
+    'TX11_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 158, 2),
+    'TX12_POWER':       (1, 'get_power', 0xA0, 0x111, 160, 2),
+    'TX12_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 160, 2),
+    'TX13_POWER':       (1, 'get_power', 0xA0, 0x111, 162, 2),
+    'TX13_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 162, 2),
+    'TX14_POWER':       (1, 'get_power', 0xA0, 0x111, 164, 2),
+    'TX14_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 164, 2),
+    'TX15_POWER':       (1, 'get_power', 0xA0, 0x111, 166, 2),
+    'TX15_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 166, 2),
+    'TX16_POWER':       (1, 'get_power', 0xA0, 0x111, 168, 2),
+    'TX16_POWER_DBM':   (1, 'get_power_dbm', 0xA0, 0x111, 168, 2),
+
+    # Page 1, banks supported: 0: bank 0, 1: banks 0-1, 2: banks 0-3
+    'BANKS_SUPPORTED':  (0, 'get_bits', 0xA0, 1, 142, 1, 1, 2),
+    # VDM pages (0x20-0x2F) are there, see oomvdm.py for their keys
+    'VDM_SUPPORTED':    (0, 'get_bits', 0xA0, 1, 142, 1, 6, 1),
+
     # Page 0, Serial ID fields
     # Note, per the spec: Page 00h Byte 0 and Page 00h Byte 128 shall
     # contain the same parameter values.
@@ -185,7 +243,88 @@ new_fm_keys = {
                  'RX6_POWER',
                  'RX7_POWER',
                  'RX8_POWER',
-                 )
+                 ),
+
+    # DOM of all 8 lanes, as lane vectors, five keys instead of 26:
+    # oom_get_memory() reads the two cache lines (low memory, page 0x11)
+    # as for DOM, oom_read_keys() reads only the bytes they cover (14-17
+    # of low memory, 154-201 of page 0x11)
+    'DOM_LANES': ('TEMPERATURE',
+                  'SUPPLY_VOLTAGE',
+                  'TX_POWER_LANES',
+                  'TX_BIAS_LANES',
+                  'RX_POWER_LANES',
+                  ),
+
+    # the lane monitors of lanes 9-16, on 16 lane modules (bank 1),
+    # '' on modules without bank 1 (BANKS_SUPPORTED), which are not
+    # written to
+    'DOM_BANK1': ('TX9_BIAS',
+                  'TX10_BIAS',
+                  'TX11_BIAS',
+                  'TX12_BIAS',
+                  'TX13_BIAS',
+                  'TX14_BIAS',
+                  'TX15_BIAS',
+                  'TX16_BIAS',
+                  'TX9_POWER',
+                  'TX10_POWER',
+                  'TX11_POWER',
+                  'TX12_POWER',
+                  'TX13_POWER',
+                  'TX14_POWER',
+                  'TX15_POWER',
+                  'TX16_POWER',
+                  'RX9_POWER',
+                  'RX10_POWER',
+                  'RX11_POWER',
+                  'RX12_POWER',
+                  'RX13_POWER',
+                  'RX14_POWER',
+                  'RX15_POWER',
+                  'RX16_POWER',
+                  ),
+
+    # the interrupt and module flag bytes (3-9), read on their own
+    # to see if anything changed since the last read
+    'FLAG_GATE': ('INT_L',
+                  'L_TEMP_ALARM_WARN',
+                  'L_VCC_ALARM_WARN',
+                  ),
+
+    'FLAGS': ('L_TEMP_ALARM_WARN',
+              'L_TEMP_HIGH_ALARM',
+              'L_TEMP_LOW_ALARM',
+              'L_TEMP_HIGH_WARNING',
+              'L_TEMP_LOW_WARNING',
+              'L_VCC_ALARM_WARN',
+              'L_VCC_HIGH_ALARM',
+              'L_VCC_LOW_ALARM',
+              'L_VCC_HIGH_WARN',
+              'L_VCC_LOW_WARN',
+              ),
+
+    'THRESHOLDS': ('TEMP_HIGH_ALARM',
+                   'TEMP_LOW_ALARM',
+                   'TEMP_HIGH_WARN',
+                   'TEMP_LOW_WARN',
+                   'VOLTAGE_HIGH_ALARM',
+                   'VOLTAGE_LOW_ALARM',
+                   'VOLTAGE_HIGH_WARN',
+                   'VOLTAGE_LOW_WARN',
+                   'BIAS_HIGH_ALARM',
+                   'BIAS_LOW_ALARM',
+                   'BIAS_HIGH_WARN',
+                   'BIAS_LOW_WARN',
+                   'TX_POWER_HIGH_ALARM',
+                   'TX_POWER_LOW_ALARM',
+                   'TX_POWER_HIGH_WARN',
+                   'TX_POWER_LOW_WARN',
+                   'RX_POWER_HIGH_ALARM',
+                   'RX_POWER_LOW_ALARM',
+                   'RX_POWER_HIGH_WARN',
+                   'RX_POWER_LOW_WARN',
+                   ),
     }
 
 
@@ -199,6 +338,10 @@ new_wm_keys = {
        }
 
 
+# the port types these keys serve (see keyfiles_c in oomlib.py)
+port_types = (0x18, 0x19, 0x1E)         # QSFP_DD, OSFP, QSFPwCMIS
+
+
 # add these keys to the memory map, function map, write map for
 # QSFP-DD (OSFP, COBO) type devices
 def add_keys(port):
@@ -374,7 +374,143 @@ new_fm_keys = {
                  'RX2_POWER',
                  'RX3_POWER',
                  'RX4_POWER',
-                 )
+                 ),
+
+    # the interrupt and summary flag bytes (2-6), read on their own
+    # to see if anything changed since the last read
+    'FLAG_GATE': ('INT_L',
+                  'L_TX_RX_LOS',
+                  'L_TX_FAULT',
+                  'L_TX_RX_LOL',
+                  'L_TEMP_ALARM_WARN',
+                  ),
+
+    'FLAGS': ('L_TX_RX_LOS',
+              'L_TX4_LOS',
+              'L_TX3_LOS',
+              'L_TX2_LOS',
+              'L_TX1_LOS',
+              'L_RX4_LOS',
+              'L_RX3_LOS',
+              'L_RX2_LOS',
+              'L_RX1_LOS',
+              'L_TX_FAULT',
+              'L_TX4_ADAPT_EQ_FAULT',
+              'L_TX3_ADAPT_EQ_FAULT',
+              'L_TX2_ADAPT_EQ_FAULT',
+              'L_TX1_ADAPT_EQ_FAULT',
+              'L_TX4_FAULT',
+              'L_TX3_FAULT',
+              'L_TX2_FAULT',
+              'L_TX1_FAULT',
+              'L_TX_RX_LOL',
+              'L_TX4_LOL',
+              'L_TX3_LOL',
+              'L_TX2_LOL',
+              'L_TX1_LOL',
+              'L_RX4_LOL',
+              'L_RX3_LOL',
+              'L_RX2_LOL',
+              'L_RX1_LOL',
+              'L_TEMP_ALARM_WARN',
+              'L_TEMP_HIGH_ALARM',
+              'L_TEMP_LOW_ALARM',
+              'L_TEMP_HIGH_WARNING',
+              'L_TEMP_LOW_WARNING',
+              'L_VCC_ALARM_WARN',
+              'L_VCC_HIGH_ALARM',
+              'L_VCC_LOW_ALARM',
+              'L_VCC_HIGH_WARN',
+              'L_VCC_LOW_WARN',
+              'L_RX1_RX2_POWER',
+              'L_RX1_POWER',
+              'L_RX1_POWER_HIGH_ALARM',
+              'L_RX1_POWER_LOW_ALARM',
+              'L_RX1_POWER_HIGH_WARN',
+              'L_RX1_POWER_LOW_WARN',
+              'L_RX2_POWER',
+              'L_RX2_POWER_HIGH_ALARM',
+              'L_RX2_POWER_LOW_ALARM',
+              'L_RX2_POWER_HIGH_WARN',
+              'L_RX2_POWER_LOW_WARN',
+              'L_RX3_RX4_POWER',
+              'L_RX3_POWER',
+              'L_RX3_POWER_HIGH_ALARM',
+              'L_RX3_POWER_LOW_ALARM',
+              'L_RX3_POWER_HIGH_WARN',
+              'L_RX3_POWER_LOW_WARN',
+              'L_RX4_POWER',
+              'L_RX4_POWER_HIGH_ALARM',
+              'L_RX4_POWER_LOW_ALARM',
+              'L_RX4_POWER_HIGH_WARN',
+              'L_RX4_POWER_LOW_WARN',
+              'L_TX1_TX2_BIAS',
+              'L_TX1_BIAS',
+              'L_TX1_BIAS_HIGH_ALARM',
+              'L_TX1_BIAS_LOW_ALARM',
+              'L_TX1_BIAS_HIGH_WARN',
+              'L_TX1_BIAS_LOW_WARN',
+              'L_TX2_BIAS',
+              'L_TX2_BIAS_HIGH_ALARM',
+              'L_TX2_BIAS_LOW_ALARM',
+              'L_TX2_BIAS_HIGH_WARN',
+              'L_TX2_BIAS_LOW_WARN',
+              'L_TX3_TX4_BIAS',
+              'L_TX3_BIAS',
+              'L_TX3_BIAS_HIGH_ALARM',
+              'L_TX3_BIAS_LOW_ALARM',
+              'L_TX3_BIAS_HIGH_WARN',
+              'L_TX3_BIAS_LOW_WARN',
+              'L_TX4_BIAS',
+              'L_TX4_BIAS_HIGH_ALARM',
+              'L_TX4_BIAS_LOW_ALARM',
+              'L_TX4_BIAS_HIGH_WARN',
+              'L_TX4_BIAS_LOW_WARN',
+              'L_TX1_TX2_POWER',
+              'L_TX1_POWER',
+              'L_TX1_POWER_HIGH_ALARM',
+              'L_TX1_POWER_LOW_ALARM',
+              'L_TX1_POWER_HIGH_WARN',
+              'L_TX1_POWER_LOW_WARN',
+              'L_TX2_POWER',
+              'L_TX2_POWER_HIGH_ALARM',
+              'L_TX2_POWER_LOW_ALARM',
+              'L_TX2_POWER_HIGH_WARN',
+              'L_TX2_POWER_LOW_WARN',
+              'L_TX3_TX4_POWER',
+              'L_TX3_POWER',
+              'L_TX3_POWER_HIGH_ALARM',
+              'L_TX3_POWER_LOW_ALARM',
+              'L_TX3_POWER_HIGH_WARN',
+              'L_TX3_POWER_LOW_WARN',
+              'L_TX4_POWER',
+              'L_TX4_POWER_HIGH_ALARM',
+              'L_TX4_POWER_LOW_ALARM',
+              'L_TX4_POWER_HIGH_WARN',
+              'L_TX4_POWER_LOW_WARN',
+              ),
+
+    'THRESHOLDS': ('TEMP_HIGH_ALARM',
+                   'TEMP_LOW_ALARM',
+                   'TEMP_HIGH_WARN',
+                   'TEMP_LOW_WARN',
+                   'VOLTAGE_HIGH_ALARM',
+                   'VOLTAGE_LOW_ALARM',
+                   'VOLTAGE_HIGH_WARN',
+                   'VOLTAGE_LOW_WARN',
+                   'BIAS_HIGH_ALARM',
+                   'BIAS_LOW_ALARM',
+                   'BIAS_HIGH_WARN',
+                   'BIAS_LOW_WARN',
+                   'TX_POWER_HIGH_ALARM',
+                   'TX_POWER_LOW_ALARM',
+                   'TX_POWER_HIGH_WARN',
+                   'TX_POWER_LOW_WARN',
+                   'RX_POWER_HIGH_ALARM',
+                   'RX_POWER_LOW_ALARM',
+                   'RX_POWER_HIGH_WARN',
+                   'RX_POWER_LOW_WARN',
+                   ),
     }
 
 
@@ -388,6 +524,10 @@ new_wm_keys = {
        }
 
 
+# the port types these keys serve (see keyfiles_c in oomlib.py)
+port_types = (0xD, 0x11)                # QSFP_PLUS, QSFP28
+
+
 # add these keys to the memory map, function map, write map for
 # QSFP+ and QSFP28 devices
 def add_keys(port):
@@ -159,6 +159,41 @@ new_fm_keys = {
 
     'DOM': ('TEMPERATURE', 'VCC', 'TX_BIAS', 'TX_POWER',
             'RX_POWER'),
+
+    'FLAGS': ('L_TEMP_ALARM',
+              'L_TEMP_WARN',
+              'L_VCC_ALARM',
+              'L_VCC_WARN',
+              'L_BIAS_ALARM',
+              'L_BIAS_WARN',
+              'L_TX_POWER_ALARM',
+              'L_TX_POWER_WARN',
+              'L_RX_POWER_ALARM',
+              'L_RX_POWER_WARN',
+              'L_ALARM_WARN',
+              ),
+
+    'THRESHOLDS': ('TEMP_HIGH_ALARM',
+                   'TEMP_LOW_ALARM',
+                   'TEMP_HIGH_WARN',
+                   'TEMP_LOW_WARN',
+                   'VOLTAGE_HIGH_ALARM',
+                   'VOLTAGE_LOW_ALARM',
+                   'VOLTAGE_HIGH_WARN',
+                   'VOLTAGE_LOW_WARN',
+                   'BIAS_HIGH_ALARM',
+                   'BIAS_LOW_ALARM',
+                   'BIAS_HIGH_WARN',
+                   'BIAS_LOW_WARN',
+                   'TX_POWER_HIGH_ALARM',
+                   'TX_POWER_LOW_ALARM',
+                   'TX_POWER_HIGH_WARN',
+                   'TX_POWER_LOW_WARN',
+                   'RX_POWER_HIGH_ALARM',
+                   'RX_POWER_LOW_ALARM',
+                   'RX_POWER_HIGH_WARN',
+                   'RX_POWER_LOW_WARN',
+                   ),
     }
 
 
@@ -167,6 +202,10 @@ new_wm_keys = {
        }
 
 
+# the port types these keys serve (see keyfiles_c in oomlib.py)
+port_types = (0x3, 0xB)                 # SFP, DWDM_SFP
+
+
 # add these keys to the memory map, function map, write map for
 # SFP and DWDM_SFP devices
 def add_keys(port):
@@ -58,6 +58,17 @@ def oom_get_portlist():
     return(port_list)
 
 
+#
+# check that the port still holds the same module (type, vendor, part
+# number and serial number), re-type the port (and drop its page cache,
+# or its CFP register cache) if not.  Returns True if it changed.
+# Lets a program keep its portlist, instead of calling
+# oom_get_portlist() over and over
+#
+def oom_refresh_port(port):
+    return oomlib.oom_refresh_port(port)
+
+
 #
 # magic decoder - gets any attribute based on its key
 # if there is no decoder for the port type, or the key is not
@@ -92,6 +103,24 @@ def oom_get_memory(port, function):
     return oomlib.oom_get_memory(port, function)
 
 
+#
+# every key of the module in 'port', decoded from one fresh read of each
+# of its pages.  Returns a dictionary of every key: value.  Much faster
+# than oom_get_keyvalue() key by key, for reports on whole modules
+#
+def oom_get_snapshot(port):
+    return oomlib.oom_get_snapshot(port)
+
+
+#
+# same as oom_get_memory, for several functions at once, eg:
+# oom_get_memory_multi(port, ('DOM', 'FLAGS')).  Returns one dictionary
+# with the keys of all of the functions.  Reads each page only once
+#
+def oom_get_memory_multi(port, functions):
+    return oomlib.oom_get_memory_multi(port, functions)
+
+
 #
 # fetch raw data from sff type memory.
 #   port: an OOM port from oom_get_portlist()
@@ -137,13 +166,21 @@ def oom_get_memory_cfp(port, address, length):
 
 
 #
-# same as oom_get_memory_cfp except uses a page cache.
-#   (OOM does not cache CFP at this time)
+# same as oom_get_memory_cfp except uses a register cache, registers
+# already read are not read again
 #
 def oom_get_cached_cfp(port, address, length):
     return oomlib.oom_get_cached_cfp(port, address, length)
 
 
+#
+# which bus the port is on (eg: i2c bus number), -1 if unknown
+# ports on different buses can be accessed in parallel
+#
+def oom_get_bus(port):
+    return oomlib.oom_get_bus(port)
+
+
 #
 # write raw memory to CFP EEPROM
 # parameters are the same as oom_get_memory_cfp
@@ -0,0 +1,234 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomalarms.py : alarm and warning events for the modules of a switch
+#
+#  Modules carry their own alarm and warning thresholds (TEMP_HIGH_ALARM,
+#  RX_POWER_LOW_WARN...) and latched flags (L_TEMP_ALARM_WARN,
+#  L_TX_RX_LOS...).  An AlarmEngine checks each poll (an oompoller
+#  Snapshot) against them, and calls its callbacks only when a condition
+#  is raised or cleared, never for a condition that is unchanged:
+#
+#      engine = AlarmEngine()
+#      engine.add_callback(func)         # func(event), see AlarmEvent
+#      poller.add_listener(engine.evaluate)
+#
+#  The thresholds are static, the checks for a module are built once,
+#  when its thresholds are first seen, and kept until the module changes.
+#  A port whose values did not change since the last poll is skipped,
+#  so the cost of a poll follows what changed, not ports x keys.
+#
+#  Hysteresis: a high condition is raised when the value goes above the
+#  threshold, and cleared when it drops below (threshold - hysteresis),
+#  (low conditions the other way round), so a value sitting on a
+#  threshold does not raise and clear on every poll.  A latched flag is
+#  raised when it is read as set, and cleared when it is read as clear.
+#
+#  Power is read in mW and its thresholds are in dBm, power values are
+#  converted to dBm to be compared.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import re
+from .decode import mwtodbm
+
+# hysteresis by quantity, in the units of its thresholds
+HYSTERESIS = {
+    'TEMP': 1.0,        # 'C
+    'VOLTAGE': 0.01,    # V
+    'BIAS': 0.2,        # mA
+    'TX_POWER': 0.3,    # dB
+    'RX_POWER': 0.3,    # dB
+}
+
+# the conditions checked for each quantity, most severe first
+CONDITIONS = (('HIGH_ALARM', 'alarm', 1), ('LOW_ALARM', 'alarm', -1),
+              ('HIGH_WARN', 'warning', 1), ('LOW_WARN', 'warning', -1))
+
+# DOM key (lane number removed): quantity of its thresholds
+QUANTITIES = {
+    'TEMPERATURE': 'TEMP',
+    'SUPPLY_VOLTAGE': 'VOLTAGE',
+    'VCC': 'VOLTAGE',
+    'TX_BIAS': 'BIAS',
+    'TX_POWER': 'TX_POWER',
+    'RX_POWER': 'RX_POWER',
+}
+
+LANE = re.compile(r'^(TX|RX)[1-9][0-9]*_')
+
+
+#
+# one condition raised or cleared on one port
+#
+class AlarmEvent:
+    def __init__(self, port, key, condition, severity, raised, value,
+                 threshold, when):
+        self.port = port            # port name
+        self.key = key              # eg: RX3_POWER, L_TX_FAULT
+        self.condition = condition  # eg: RX_POWER_LOW_ALARM, L_TX_FAULT
+        self.severity = severity    # 'alarm', 'warning' or 'flag'
+        self.raised = raised        # True: raised, False: cleared
+        self.value = value          # the value that raised or cleared it
+        self.threshold = threshold  # None for flags
+        self.time = when
+
+    def __str__(self):
+        return '%s %s %s %s (%s=%s, threshold %s)' % (
+            self.port, 'RAISED' if self.raised else 'CLEARED',
+            self.severity, self.condition, self.key, self.value,
+            self.threshold)
+
+
+#
+# the checks of one module, built from its thresholds:
+# [(key, convert, [(condition, severity, direction, threshold,
+#                   hysteresis)])]
+#
+def build_checks(keys, thresholds, hysteresis):
+    checks = []
+    for key in sorted(keys):
+        quantity = QUANTITIES.get(LANE.sub(r'\1_', key))
+        if quantity is None:
+            continue
+        limits = dict([(cond, thresholds.get(quantity + '_' + cond))
+                       for (cond, severity, direction) in CONDITIONS])
+        if None in limits.values() or \
+                limits['HIGH_ALARM'] <= limits['LOW_ALARM']:
+            continue    # thresholds not there, or not programmed
+        conds = [(quantity + '_' + cond, severity, direction, limits[cond],
+                  hysteresis.get(quantity, 0))
+                 for (cond, severity, direction) in CONDITIONS]
+        convert = None
+        if quantity in ('TX_POWER', 'RX_POWER'):
+            convert = mwtodbm
+        checks.append((key, convert, conds))
+    return checks
+
+
+# a latched flag is set: a non zero value, or raw flag bytes not all zero
+def flag_set(value):
+    if isinstance(value, (bytes, bytearray)):
+        return any(bytearray(value))
+    return value not in (0, None, '', False)
+
+
+#
+# what is known about one port between polls
+#
+class PortState:
+    def __init__(self, static, checks):
+        self.static = static    # the thresholds the checks were built from
+        self.checks = checks
+        self.values = None      # the values last evaluated
+        self.active = {}        # (key, condition): AlarmEvent that raised it
+
+
+class AlarmEngine:
+    def __init__(self, hysteresis=None):
+        self.hysteresis = dict(HYSTERESIS)
+        if hysteresis is not None:
+            self.hysteresis.update(hysteresis)
+        self.callbacks = []
+        self.ports = {}         # port name: PortState
+
+    #
+    # func(event) is called for each condition raised or cleared
+    #
+    def add_callback(self, func):
+        self.callbacks.append(func)
+
+    # the conditions raised now: [AlarmEvent], as they were raised
+    def active(self, port=None):
+        events = []
+        for name in sorted(self.ports):
+            if port is None or name == port:
+                events.extend(self.ports[name].active.values())
+        return events
+
+    #
+    # check a snapshot (oompoller.Snapshot), call the callbacks for each
+    # change, returns the [AlarmEvent] of this snapshot
+    #
+    def evaluate(self, snapshot):
+        events = []
+        seen = set()
+        for sample in snapshot.samples:
+            seen.add(sample.name)
+            if sample.error is not None:
+                continue            # nothing new is known about this port
+            state = self.ports.get(sample.name)
+            if state is not None and state.static is not sample.static \
+                    and state.static == sample.static:
+                state.static = sample.static    # same module, re-read
+            if state is None or state.static is not sample.static:
+                # new module: its checks, and the old module's conditions
+                # are cleared
+                if state is not None:
+                    events.extend(self.clear_all(sample.name, state,
+                                                 sample.time))
+                state = PortState(sample.static,
+                                  build_checks(sample.values, sample.static,
+                                               self.hysteresis))
+                self.ports[sample.name] = state
+            elif state.values == sample.values:
+                continue            # nothing changed, nothing to do
+            state.values = sample.values
+            events.extend(self.check(sample, state))
+        for name in list(self.ports):
+            if name not in seen:    # the port went away
+                events.extend(self.clear_all(name, self.ports.pop(name),
+                                             snapshot.started))
+        for event in events:
+            for callback in self.callbacks:
+                callback(event)
+        return events
+
+    def check(self, sample, state):
+        events = []
+        values = sample.values
+        for (key, convert, conds) in state.checks:
+            value = values.get(key)
+            if value is None or value == '':
+                continue
+            if convert is not None:
+                value = convert(value)
+            for (condition, severity, direction, threshold, hyst) in conds:
+                ident = (key, condition)
+                raised = ident in state.active
+                if raised:
+                    # hysteresis: stay raised until well clear
+                    on = (value - (threshold - hyst * direction)) \
+                        * direction > 0
+                else:
+                    on = (value - threshold) * direction > 0
+                if on != raised:
+                    events.append(self.change(sample, state, key, condition,
+                                              severity, on, value,
+                                              threshold))
+        for key in values:
+            if not key.startswith('L_'):
+                continue
+            value = values[key]
+            on = flag_set(value)
+            if on != ((key, key) in state.active):
+                events.append(self.change(sample, state, key, key, 'flag',
+                                          on, value, None))
+        return events
+
+    def change(self, sample, state, key, condition, severity, on, value,
+               threshold):
+        event = AlarmEvent(sample.name, key, condition, severity, on, value,
+                           threshold, sample.time)
+        if on:
+            state.active[(key, condition)] = event
+        else:
+            del state.active[(key, condition)]
+        return event
+
+    def clear_all(self, name, state, when):
+        events = []
+        for ((key, condition), raised) in sorted(state.active.items()):
+            events.append(AlarmEvent(name, key, condition, raised.severity,
+                                     False, None, raised.threshold, when))
+        state.active = {}
+        return events
@@ -0,0 +1,267 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oombinproto.py : A compact binary framing for the OOM Southbound API
+#  over the network.  Used between oomjsonshim.py (client side) and
+#  oomjsonsvr.py (switch side) as a faster alternative to JSON+base64.
+#
+#  Every message is one frame:
+#      length (4 bytes)  op (1 byte)  flags (1 byte)  request id (4 bytes)
+#  followed by 'length' bytes of payload.  All fields are big endian.
+#
+#  Requests carry a request id chosen by the client, the reply to a
+#  request carries the same id, so a client can send several requests
+#  before reading any replies (pipelining), and the server is free to
+#  answer them in any order.
+#
+#  EEPROM data is carried as raw bytes.  A client that sets FLAG_ZLIB_OK
+#  on a request accepts a zlib compressed reply, the server compresses
+#  large replies (eg: full EEPROM dumps) and marks them with FLAG_ZLIB.
+#
+#  The binary transport is negotiated: the client asks the JSON server
+#  for its capabilities ('caps' command), older servers don't know that
+#  command, and the client stays with JSON.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import socket
+import struct
+import zlib
+from threading import Lock, Event, Thread
+
+PROTO_VERSION = 1
+
+# operations (requests and their replies use the same op)
+OP_PORTCOUNT = 0x01     # oom_get_portlist(0, 0), refreshes the portlist
+OP_PORTLIST = 0x02      # port count plus the (cached) portlist
+OP_GET_MEMORY = 0x03    # oom_get_memory_sff()
+OP_SET_MEMORY = 0x04    # oom_set_memory_sff()
+OP_GET_MULTI = 0x05     # several oom_get_memory_sff() in one request
+OP_ERROR = 0x7F         # reply only, payload is the error message
+
+# flags
+FLAG_ZLIB = 0x01        # payload is zlib compressed
+FLAG_ZLIB_OK = 0x02     # (request) client accepts a compressed reply
+
+ZLIB_MIN = 512          # don't bother compressing smaller replies
+MAX_PAYLOAD = 16 * 1024 * 1024
+TIMEOUT = 10            # default seconds to wait for a reply
+
+HEADER = struct.Struct('>IBBI')         # length, op, flags, request id
+MEMREQ = struct.Struct('>QBBHH')        # handle, address, page, offs, len
+RETLEN = struct.Struct('>i')            # return length (or -errno)
+MULTIRET = struct.Struct('>iH')         # return length, data length
+COUNT = struct.Struct('>H')
+CPORT = struct.Struct('>QB32s')         # handle, oom_class, name
+IDENT = struct.Struct('>I')             # module identity (0: unknown)
+
+
+#
+# build a frame, compress the payload if allowed and worth it
+#
+def pack_frame(op, reqid, payload, flags=0):
+    if (flags & FLAG_ZLIB_OK) and len(payload) >= ZLIB_MIN:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(len(payload), op, flags, reqid) + payload
+
+
+#
+# read 'length' bytes.  A socket timeout is only there to bound sends
+# (see BinClient), waiting here for a quiet peer is not an error
+#
+def recv_exact(sock, length):
+    chunks = []
+    while length > 0:
+        try:
+            chunk = sock.recv(min(length, 65536))
+        except socket.timeout:
+            continue
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+#
+# read one frame from a socket, returns (op, flags, reqid, payload)
+# with the payload already uncompressed
+#
+def read_frame(sock):
+    (length, op, flags, reqid) = HEADER.unpack(recv_exact(sock,
+                                                          HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise IOError('oom binary frame too large: %d' % length)
+    payload = recv_exact(sock, length)
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+        flags &= ~FLAG_ZLIB
+    return (op, flags, reqid, payload)
+
+
+def cport_handle(cport):
+    handle = cport.handle       # c_void_p '0' is None
+    if handle is None:
+        handle = 0
+    return handle
+
+
+# payload packers/unpackers, shared by both ends
+def pack_memreq(handle, address, page, offset, length):
+    return MEMREQ.pack(handle, address, page, offset, length)
+
+
+def pack_multireq(reqs):
+    payload = COUNT.pack(len(reqs))
+    for req in reqs:
+        payload += MEMREQ.pack(*req)
+    return payload
+
+
+def unpack_multireq(payload):
+    (count,) = COUNT.unpack_from(payload, 0)
+    return [MEMREQ.unpack_from(payload, COUNT.size + i * MEMREQ.size)
+            for i in range(count)]
+
+
+def pack_multiret(results):
+    payload = b''
+    for (retlen, data) in results:
+        payload += MULTIRET.pack(retlen, len(data)) + data
+    return payload
+
+
+def unpack_multiret(payload):
+    results = []
+    ptr = 0
+    while ptr < len(payload):
+        (retlen, datalen) = MULTIRET.unpack_from(payload, ptr)
+        ptr += MULTIRET.size
+        results.append((retlen, payload[ptr:ptr + datalen]))
+        ptr += datalen
+    return results
+
+
+#
+# a portlist, optionally followed by the identity of the module in each
+# port (see port_ident() in oomjsonsvr.py), older clients ignore those
+#
+def pack_portlist(cports, idents=None):
+    payload = COUNT.pack(len(cports))
+    for cport in cports:
+        payload += CPORT.pack(cport_handle(cport), cport.oom_class,
+                              bytes(bytearray(cport.name)))
+    if idents is not None:
+        for ident in idents:
+            payload += IDENT.pack(ident)
+    return payload
+
+
+# returns a list of (handle, oom_class, name as 32 bytes)
+def unpack_portlist(payload):
+    (count,) = COUNT.unpack_from(payload, 0)
+    return [CPORT.unpack_from(payload, COUNT.size + i * CPORT.size)
+            for i in range(count)]
+
+
+# the module identities after a portlist, None if there are none
+def unpack_portlist_idents(payload):
+    (count,) = COUNT.unpack_from(payload, 0)
+    ptr = COUNT.size + count * CPORT.size
+    if len(payload) < ptr + count * IDENT.size:
+        return None
+    return [IDENT.unpack_from(payload, ptr + i * IDENT.size)[0]
+            for i in range(count)]
+
+
+#
+# Client end of one binary connection.  Any number of threads can
+# share it, each request is tagged with its own id, and a reader thread
+# hands each reply to the thread waiting for it.  A reply that takes
+# more than 'timeout' seconds is an IOError (None waits forever), so is
+# a request that can't be sent in that time, the connection is then
+# closed (part of the request may have gone out).
+#
+class BinClient:
+    def __init__(self, host, port, compress=True, timeout=TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)   # bounds sends, see recv_exact()
+        self.flags = FLAG_ZLIB_OK if compress else 0
+        self.timeout = timeout
+        self.sendlock = Lock()
+        self.pendlock = Lock()
+        self.pending = {}       # reqid: [Event, (op, payload)]
+        self.nextid = 0
+        self.closed = False
+        self.reader = Thread(target=self._read_replies)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _read_replies(self):
+        try:
+            while True:
+                (op, flags, reqid, payload) = read_frame(self.sock)
+                with self.pendlock:
+                    waiter = self.pending.get(reqid)
+                if waiter is not None:
+                    waiter[1] = (op, payload)
+                    waiter[0].set()
+        except Exception:
+            pass
+        self.closed = True
+        with self.pendlock:
+            for waiter in self.pending.values():
+                waiter[0].set()   # wake everyone, there is no reply
+
+    # send a request, don't wait for the reply, returns the request id
+    def send(self, op, payload):
+        if self.closed:
+            raise IOError('oom binary connection is closed')
+        with self.pendlock:
+            self.nextid = (self.nextid + 1) & 0xFFFFFFFF
+            reqid = self.nextid
+            self.pending[reqid] = [Event(), None]
+        try:
+            with self.sendlock:
+                self.sock.sendall(pack_frame(op, reqid, payload,
+                                             self.flags))
+        except Exception:
+            with self.pendlock:
+                self.pending.pop(reqid, None)
+            self.close()
+            raise
+        return reqid
+
+    # wait for the reply to a request sent earlier, returns its payload
+    # 'timeout' (seconds) overrides the connection's timeout
+    def wait(self, reqid, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        with self.pendlock:
+            waiter = self.pending[reqid]
+        waiter[0].wait(timeout)
+        with self.pendlock:
+            del self.pending[reqid]
+        if waiter[1] is None:
+            raise IOError('no reply from oom binary server')
+        (op, payload) = waiter[1]
+        if op == OP_ERROR:
+            raise IOError(payload.decode('utf-8', 'replace'))
+        return payload
+
+    def call(self, op, payload):
+        return self.wait(self.send(op, payload))
+
+    # pipeline a list of (op, payload) requests, return the list of replies
+    def call_many(self, requests):
+        reqids = [self.send(op, payload) for (op, payload) in requests]
+        return [self.wait(reqid) for reqid in reqids]
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        self.sock.close()
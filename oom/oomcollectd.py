@@ -22,10 +22,55 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
 import oom
 import collectd
 
 
+#
+# Configuration (in the <Plugin python> <Module oomcollectd> block):
+#   Deadband 2.0         only dispatch a value that moved more than 2%
+#                        since it was last dispatched (default 0, every
+#                        value is dispatched on every read)
+#   Heartbeat 6          dispatch unchanged values anyway, every 6 reads
+#                        (keeps the graphs from having gaps)
+#   PortlistInterval 300 seconds between full portlist refreshes, ports
+#                        are checked for module changes on every read
+#
+class config:
+    deadband = 0.0
+    heartbeat = 6
+    portlist_interval = 300
+
+config = config()
+
+
+#
+# Kept across callbacks: the portlist (and with it, the static data in
+# each port's page cache), and the last value dispatched for each key
+#
+class state:
+    portlist = None
+    portlist_time = 0
+    last = {}       # (port name, key): [value dispatched, reads since]
+
+state = state()
+
+
+def config_callback(conf):
+    for node in conf.children:
+        key = node.key.lower()
+        if key == 'deadband':
+            config.deadband = float(node.values[0])
+        elif key == 'heartbeat':
+            config.heartbeat = int(node.values[0])
+        elif key == 'portlistinterval':
+            config.portlist_interval = float(node.values[0])
+        else:
+            collectd.warning('oomcollectd: unknown config key: %s' %
+                             node.key)
+
+
 class OOMValue(collectd.Values):
     def __init__(self, dtype, port, key, value):
         nkey = '%s-%s' % (key, port.port_name)
@@ -58,28 +103,76 @@ class ModuleTemperature(OOMValue):
         OOMValue.__init__(self, 'temperature', port, key, value)
 
 
+#
+# the portlist, rebuilt every PortlistInterval seconds, in between,
+# only the ports whose module changed are set up again
+#
+def get_portlist():
+    now = time.time()
+    if state.portlist is None or \
+            (now - state.portlist_time) > config.portlist_interval:
+        state.portlist = oom.oom_get_portlist()
+        state.portlist_time = now
+        state.last = {}
+        return state.portlist
+    for port in state.portlist:
+        if oom.oom_refresh_port(port):
+            for ident in list(state.last):
+                if ident[0] == port.port_name:
+                    del state.last[ident]
+    return state.portlist
+
+
+#
+# should this value be dispatched: it moved beyond the deadband, or it
+# has not been dispatched for 'heartbeat' reads
+#
+def changed(port, key, value):
+    ident = (port.port_name, key)
+    last = state.last.get(ident)
+    if last is not None and last[1] < config.heartbeat and \
+            abs(value - last[0]) <= abs(last[0]) * config.deadband / 100.0:
+        last[1] += 1
+        return False
+    state.last[ident] = [value, 1]
+    return True
+
+
+def dispatch(valueclass, port, key, name, value):
+    if config.deadband > 0 and not changed(port, key, value):
+        return
+    valueclass(port, name, value).dispatch()
+
+
 def read_callback(data=None):
-    portlist = oom.oom_get_portlist()
-    for port in portlist:
+    for port in get_portlist():
+        # all the DOM keys, read with one planned read per port
         dom = oom.oom_get_memory(port, 'DOM')
         if dom is None:
             continue
 
-        for key in ('TX1_POWER', 'TX2_POWER', 'TX3_POWER', 'TX4_POWER',
-                    'RX1_POWER', 'RX2_POWER', 'RX3_POWER', 'RX4_POWER'):
+        for key in ('TX1_POWER', 'TX2_POWER', 'TX3_POWER', 'TX4_POWER'):
+            if key in dom:
+                value = dom[key] / 1000.0
+                dispatch(LaserOutputPower, port, key, key[:3].lower(), value)
+
+        for key in ('RX1_POWER', 'RX2_POWER', 'RX3_POWER', 'RX4_POWER'):
             if key in dom:
                 value = dom[key] / 1000.0
-                LaserOutputPower(port, key[:3].lower(), value).dispatch()
+                dispatch(ReceivePower, port, key, key[:3].lower(), value)
 
         for key in ('TX1_BIAS', 'TX2_BIAS', 'TX3_BIAS', 'TX4_BIAS'):
             if key in dom:
                 value = dom[key] / 1000.0
-                LaserBiasCurrent(port, key[:3].lower(), value).dispatch()
+                dispatch(LaserBiasCurrent, port, key, key[:3].lower(), value)
 
         if 'SUPPLY_VOLTAGE' in dom:
-            SupplyVoltage(port, 'supply', dom['SUPPLY_VOLTAGE']).dispatch()
+            dispatch(SupplyVoltage, port, 'SUPPLY_VOLTAGE', 'supply',
+                     dom['SUPPLY_VOLTAGE'])
 
         if 'TEMPERATURE' in dom:
-            ModuleTemperature(port, 'module', dom['TEMPERATURE']).dispatch()
+            dispatch(ModuleTemperature, port, 'TEMPERATURE', 'module',
+                     dom['TEMPERATURE'])
 
+collectd.register_config(config_callback)
 collectd.register_read(read_callback)
@@ -0,0 +1,141 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomfleet.py : OOM across many switches at once
+#
+#  A Fleet holds one remote session (oomjsonshim.Remote) per switch,
+#  each switch running oomjsonsvr.py.  The ports of each switch use that
+#  switch's session as their southbound shim (see oomlib.oom_south()),
+#  so the usual OOM calls (oom_get_keyvalue(), oom_get_memory()...)
+#  work on them, and many switches can be queried at the same time.
+#
+#  Jobs run on a bounded pool of worker threads ('workers' switches at
+#  a time), results are returned as each switch finishes, in whatever
+#  order they finish.  A switch that takes more than 'timeout' seconds
+#  is abandoned, its result is the error: its requests never wait past
+#  its deadline, and the run stops waiting for switches that are still
+#  not done when every switch could have had its 'timeout' (a thread
+#  stuck in a request is left behind).
+#
+#  Python 2.7 needs the 'futures' package for concurrent.futures
+#
+# ////////////////////////////////////////////////////////////////////
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, \
+    TimeoutError
+from . import oomlib
+from .oomjsonshim import Remote
+
+
+class Fleet:
+    def __init__(self, switches, workers=16, timeout=60, usebinary=True):
+        self.switches = list(switches)
+        self.workers = workers
+        self.timeout = timeout
+        self.remotes = {}
+        self.souths = {}
+        for switch in self.switches:
+            remote = Remote(switch, timeout, usebinary)
+            self.remotes[switch] = remote
+            self.souths[switch] = oomlib.oom_south(remote)
+
+    # the (OOM python) portlist of one switch
+    def get_portlist(self, switch):
+        return oomlib.oom_get_portlist(self.souths[switch])
+
+    #
+    # run job(switch, portlist) for every switch (or for 'switches'),
+    # yields (switch, result, error) as each switch finishes,
+    # error is None if the job succeeded, result is None if it failed
+    # With portlist False, the job is job(switch, remote), for jobs that
+    # only use the key-level calls of the switch (oomjsonshim.Remote)
+    #
+    def run(self, job, switches=None, portlist=True):
+        if switches is None:
+            switches = self.switches
+        if len(switches) == 0:
+            return
+        workers = min(self.workers, len(switches))
+        pool = ThreadPoolExecutor(max_workers=workers)
+        limit = None
+        if self.timeout is not None:
+            # each worker runs its share of the switches one after the
+            # other, plus one switch that started just before the end
+            limit = self.timeout * ((len(switches) + workers - 1) //
+                                    workers + 1)
+        try:
+            futures = dict([(pool.submit(self.run_one, switch, job,
+                                         portlist), switch)
+                            for switch in switches])
+            try:
+                for future in as_completed(futures, limit):
+                    yield future.result()
+            except TimeoutError:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+                        yield (futures[future], None,
+                               IOError('%s: timed out' % futures[future]))
+        finally:
+            pool.shutdown(wait=False)
+
+    def run_one(self, switch, job, portlist):
+        remote = self.remotes[switch]
+        if self.timeout is not None:
+            remote.deadline = time.time() + self.timeout
+        try:
+            if portlist:
+                return (switch, job(switch, self.get_portlist(switch)), None)
+            return (switch, job(switch, remote), None)
+        except Exception as err:
+            remote.close()      # don't trust the connection after an error
+            remote.binary = None
+            return (switch, None, err)
+        finally:
+            remote.deadline = None
+
+    #
+    # the value of each key in 'keys', for each port of each switch
+    # yields (switch, [(port, {key: value})], error)
+    #
+    def get_keyvalues(self, keys, switches=None):
+        def job(switch, portlist):
+            return [(port, dict([(key, oomlib.oom_get_keyvalue(port, key))
+                                 for key in keys]))
+                    for port in portlist]
+        return self.run(job, switches)
+
+    #
+    # oom_get_memory(port, function) for each port of each switch
+    # yields (switch, [(port, {key: value})], error)
+    #
+    def get_memory(self, function, switches=None):
+        def job(switch, portlist):
+            return [(port, oomlib.oom_get_memory(port, function))
+                    for port in portlist]
+        return self.run(job, switches)
+
+    #
+    # keys and/or functions (eg: 'DOM') on every port of each switch,
+    # decoded on the switch, one request per switch (see oom_get_keys()
+    # in oomjsonshim.py)
+    # yields (switch, {port name: {key: value}}, error)
+    #
+    def get_keys(self, keys, switches=None, maxage=None):
+        def job(switch, remote):
+            return remote.oom_get_keys(keys, None, maxage)['ports']
+        return self.run(job, switches, portlist=False)
+
+    #
+    # the ports of each switch that match a query (see oomquery.py),
+    # evaluated on the switches, only the matches cross the network
+    # yields (switch, {port name: {key: value}}, error)
+    #
+    def query(self, where, keys=None, switches=None, maxage=None):
+        def job(switch, remote):
+            return remote.oom_query(where, keys, None, maxage)['ports']
+        return self.run(job, switches, portlist=False)
+
+    def close(self):
+        for remote in self.remotes.values():
+            remote.close()
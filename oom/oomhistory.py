@@ -0,0 +1,224 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomhistory.py : recent DOM history of every port, kept in memory
+#
+#      history = History()                 # 1 hour at 10 second polls
+#      poller.add_listener(history.add)
+#      for (times, values) in history.range('port3', 'RX2_POWER', start):
+#          ...
+#
+#  Each port has one ring buffer of fixed size, holding the last
+#  'capacity' polls: a timestamp (array 'd'), and one compact array
+#  ('f', 4 bytes a value) per key, rather than dicts of python floats.
+#  Every 'rollup' polls, those polls are also summed up as the min, max
+#  and mean of each key, into a second ring buffer of 'rollup_capacity'
+#  entries, which reaches much further back (8 hours by default).
+#
+#  Memory does not grow: for each port and key it is
+#      4 * capacity + 12 * rollup_capacity bytes
+#  (plus 8 bytes a timestamp per port), eg: the defaults, 512 ports and
+#  40 keys, about 55MB.  memory() gives the exact total.
+#
+#  Queries return memoryviews of the ring arrays, nothing is copied.
+#  A range that wraps around the end of a ring comes back as two
+#  segments, oldest first.  The views see the live arrays, keep a copy
+#  (eg: view.tolist()) of anything that must outlive the next few polls.
+#  (memoryview of an array needs python 3)
+#
+#  Values that could not be read are stored as NaN.
+#
+# ////////////////////////////////////////////////////////////////////
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+NAN = float('nan')
+
+
+#
+# a set of same sized arrays, written together, one entry per append
+#
+class Ring:
+    def __init__(self, size, columns):
+        self.size = size
+        self.arrays = {}
+        for (name, typecode) in columns:
+            self.arrays[name] = array(typecode, [0]) * size
+        self.count = 0          # entries ever appended
+
+    def append(self, entry):
+        pos = self.count % self.size
+        for name in self.arrays:
+            self.arrays[name][pos] = entry.get(name, NAN)
+        self.count += 1
+
+    # (first, last) positions of the entries held, oldest first
+    def spans(self):
+        if self.count <= self.size:
+            return [(0, self.count)]
+        pos = self.count % self.size
+        if pos == 0:
+            return [(0, self.size)]
+        return [(pos, self.size), (0, pos)]
+
+    #
+    # the (first, last) positions of the entries with start <= time <=
+    # end, oldest first, found by bisecting each (sorted) span
+    #
+    def find(self, start=None, end=None):
+        times = self.arrays['time']
+        found = []
+        for (first, last) in self.spans():
+            if start is not None:
+                first = bisect_left(times, start, first, last)
+            if end is not None:
+                last = bisect_right(times, end, first, last)
+            if last > first:
+                found.append((first, last))
+        return found
+
+    def views(self, names, spans):
+        return [tuple([memoryview(self.arrays[name])[first:last]
+                       for name in names])
+                for (first, last) in spans]
+
+    def memory(self):
+        return sum([arr.itemsize * len(arr) for arr in self.arrays.values()])
+
+
+#
+# the raw and rolled up history of one port
+#
+class PortHistory:
+    def __init__(self, port_type, static, keys, capacity, rollup_capacity):
+        self.port_type = port_type
+        self.static = static    # identity and thresholds of the module
+        self.keys = tuple(keys)
+        self.last = 0           # time of the last sample kept
+        self.raw = Ring(capacity, [('time', 'd')] +
+                        [(key, 'f') for key in keys])
+        columns = [('time', 'd')]
+        for key in keys:
+            columns += [((key, 'min'), 'f'), ((key, 'max'), 'f'),
+                        ((key, 'mean'), 'f')]
+        self.rollups = Ring(rollup_capacity, columns)
+
+
+# a value that can go in an array('f'), None if it can not
+def number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+class History:
+    def __init__(self, capacity=360, rollup=30, rollup_capacity=96,
+                 keys=None):
+        self.capacity = capacity                # polls kept as they were
+        self.rollup = rollup                    # polls per rollup entry
+        self.rollup_capacity = rollup_capacity  # rollup entries kept
+        self.keys = keys        # keys kept, None for every numeric key
+        self.ports = {}         # port name: PortHistory
+
+    # the keys of a sample to keep (flags are not history)
+    def sample_keys(self, values):
+        if self.keys is not None:
+            return [key for key in self.keys if key in values]
+        return sorted([key for key in values if not key.startswith('L_')
+                       and number(values[key]) is not None])
+
+    #
+    # add a poll (oompoller.Snapshot) to the history
+    #
+    def add(self, snapshot):
+        for sample in snapshot.samples:
+            if sample.error is not None:
+                continue
+            history = self.ports.get(sample.name)
+            if history is not None and \
+                    history.static is not sample.static and \
+                    history.static == sample.static:
+                history.static = sample.static  # same module, re-read
+            if history is None or history.port_type != sample.port_type \
+                    or history.static is not sample.static:
+                # new port, or a new module (even of the same type): start
+                # again
+                keys = self.sample_keys(sample.values)
+                if len(keys) == 0:
+                    self.ports.pop(sample.name, None)
+                    continue
+                history = PortHistory(sample.port_type, sample.static, keys,
+                                      self.capacity, self.rollup_capacity)
+                self.ports[sample.name] = history
+            if history.raw.count > 0 and sample.time <= history.last:
+                continue    # a sample already kept (the port was not read)
+            history.last = sample.time
+            entry = {'time': sample.time}
+            for key in history.keys:
+                value = number(sample.values.get(key))
+                if value is not None:
+                    entry[key] = value
+            history.raw.append(entry)
+            if history.raw.count % self.rollup == 0:
+                self.roll_up(history)
+
+    #
+    # sum up the last 'rollup' polls into one rollup entry, NaNs (values
+    # that were not read) are left out
+    #
+    def roll_up(self, history):
+        raw = history.raw
+        positions = [(raw.count - i - 1) % raw.size
+                     for i in range(min(self.rollup, raw.size))]
+        times = raw.arrays['time']
+        entry = {'time': min([times[pos] for pos in positions])}
+        for key in history.keys:
+            values = raw.arrays[key]
+            values = [values[pos] for pos in positions
+                      if values[pos] == values[pos]]    # not NaN
+            if len(values) == 0:
+                continue
+            entry[(key, 'min')] = min(values)
+            entry[(key, 'max')] = max(values)
+            entry[(key, 'mean')] = sum(values) / len(values)
+        history.rollups.append(entry)
+
+    def get_ports(self):
+        return sorted(self.ports)
+
+    def get_keys(self, port):
+        history = self.ports.get(port)
+        if history is None:
+            return ()
+        return history.keys
+
+    #
+    # the polls of one key of one port, with start <= time <= end
+    # (None for no limit), as [(times, values)] memoryview segments
+    #
+    def range(self, port, key, start=None, end=None):
+        history = self.ports.get(port)
+        if history is None or key not in history.keys:
+            return []
+        return history.raw.views(('time', key),
+                                 history.raw.find(start, end))
+
+    #
+    # the rollups of one key of one port, each entry is the min, max and
+    # mean of 'rollup' polls from its time on, as [(times, mins, maxs,
+    # means)] memoryview segments
+    #
+    def rollups(self, port, key, start=None, end=None):
+        history = self.ports.get(port)
+        if history is None or key not in history.keys:
+            return []
+        return history.rollups.views(('time', (key, 'min'), (key, 'max'),
+                                      (key, 'mean')),
+                                     history.rollups.find(start, end))
+
+    # bytes held by all the ring buffers
+    def memory(self):
+        return sum([history.raw.memory() + history.rollups.memory()
+                    for history in self.ports.values()])
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomimages.py : decode saved EEPROM images, in bulk, offline
+#
+#      python -m oom.oomimages [-f DOM,SERIAL_ID] [-j <processes>]
+#                              [-csv] <image file or directory>...
+#
+#  Each image (see oomimageshim.py for the layouts: SFP, QSFP, CMIS and
+#  CFP) is decoded with the usual OOM keyfiles, every key, or just the
+#  keys of the function groups asked for.  Large sets of images are
+#  spread across a pool of processes, each image's record is written
+#  as soon as it is decoded (in the order they finish), as JSON lines:
+#      {"file": ..., "type": ..., "values": {key: value...}}
+#  or as CSV, one row per key: file, type, key, value
+#  so the output can be processed before the run is done, and memory
+#  stays flat however many images there are.
+#
+#  Raw bytes (eg: VENDOR_OUI) are written as hex strings.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import os
+import sys
+import csv
+import json
+import argparse
+from binascii import hexlify
+from multiprocessing import Pool
+from . import oomlib
+from .oomlib import type_to_str
+from .oomimageshim import ImageShim
+
+
+# a value that JSON and CSV can carry
+def plain_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return hexlify(bytes(value)).decode('ascii')
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+#
+# decode one image, returns a record: {'file', 'type', 'values'}, or
+# {'file', 'error'} if it could not be decoded
+#
+def decode_image(path, functions=None):
+    try:
+        south = oomlib.oom_south(ImageShim([path]))
+        port = oomlib.oom_get_portlist(south)[0]
+        if functions is None:
+            values = oomlib.oom_get_snapshot(port)
+        else:
+            values = oomlib.oom_get_memory_multi(port, functions)
+        return {'file': path,
+                'type': type_to_str(port.port_type),
+                'values': dict([(key, plain_value(values[key]))
+                                for key in values])}
+    except Exception as err:
+        return {'file': path, 'error': str(err)}
+
+
+def decode_one(args):
+    return decode_image(*args)
+
+
+#
+# decode many images, yields the records as they are done (in any
+# order when processes > 1).  processes None is one per CPU, 1 decodes
+# in this process
+#
+def decode_images(paths, functions=None, processes=None, chunksize=8):
+    jobs = ((path, functions) for path in paths)
+    if processes == 1:
+        for job in jobs:
+            yield decode_one(job)
+        return
+    pool = Pool(processes)
+    try:
+        for record in pool.imap_unordered(decode_one, jobs, chunksize):
+            yield record
+    finally:
+        pool.terminate()
+
+
+# image files: the files named, and the files in the directories named
+def image_paths(names):
+    for name in names:
+        if os.path.isdir(name):
+            for (dirpath, dirnames, filenames) in os.walk(name):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield name
+
+
+def write_jsonlines(records, fd):
+    for record in records:
+        fd.write(json.dumps(record, sort_keys=True) + '\n')
+        fd.flush()
+
+
+def write_csv(records, fd):
+    writer = csv.writer(fd)
+    writer.writerow(('file', 'type', 'key', 'value'))
+    for record in records:
+        if 'error' in record:
+            writer.writerow((record['file'], '', 'error', record['error']))
+        else:
+            for key in sorted(record['values']):
+                writer.writerow((record['file'], record['type'], key,
+                                 record['values'][key]))
+        fd.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode EEPROM images')
+    parser.add_argument('images', nargs='+',
+                        help='image files, or directories of image files')
+    parser.add_argument('-f', dest='functions', default=None,
+                        help='function groups to decode (eg: DOM,SERIAL_ID)'
+                             ', default is every key')
+    parser.add_argument('-j', dest='processes', type=int, default=None,
+                        help='processes to decode with, default one per CPU')
+    parser.add_argument('-csv', action='store_true',
+                        help='write CSV (file, type, key, value) rather '
+                             'than JSON lines')
+    args = parser.parse_args()
+
+    functions = None
+    if args.functions is not None:
+        functions = args.functions.split(',')
+    records = decode_images(image_paths(args.images), functions,
+                            args.processes)
+    if args.csv:
+        write_csv(records, sys.stdout)
+    else:
+        write_jsonlines(records, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomimageshim.py : An OOM Southbound SHIM, in Python, that reads
+#  saved EEPROM images (files) instead of modules, so that archived
+#  dumps (RMA, interop labs...) can be decoded with OOM, offline.
+#
+#  Each image file is one port, named after the file.  The images use
+#  the same layout as the optoe (sysfs) EEPROM files:
+#    SFF (SFP, QSFP, CMIS): bytes 0-127 are low memory, page N (upper
+#      memory) is at 128 + N * 128, SFP address A2h follows address A0h
+#      at byte 256 (so A2h page N is at 384 + N * 128)
+#    CFP: 16 bit registers, big endian, register R at byte R * 2
+#  Files of 128K bytes or more, or named '*.cfp', are CFP images, all
+#  others are SFF images.  Bytes beyond the end of a file read as zeros.
+#  Images are read only.
+#
+#      oomlib.setshim('oomimageshim', ['rma/a.bin', 'rma/b.bin'])
+#  or, for a shim of its own (eg: one per image, see oomimages.py):
+#      south = oomlib.oom_south(ImageShim([path]))
+#
+# ////////////////////////////////////////////////////////////////////
+
+from .oomtypes import c_port_t
+from .oomtypes import port_class_e
+import errno
+import os
+
+CFP_SIZE = 0x20000      # a full CFP register map, 64K words
+
+
+class ImageShim:
+    def __init__(self, paths=None):
+        self.paths = []
+        self.images = {}    # handle: image (bytes), read when first used
+        if paths is not None:
+            self.setparms(paths)
+
+    #
+    # parms: an image file, a directory of image files, or a list of
+    # image files
+    #
+    def setparms(self, parms):
+        if isinstance(parms, (list, tuple)):
+            paths = list(parms)
+        elif os.path.isdir(parms):
+            paths = [os.path.join(parms, name)
+                     for name in sorted(os.listdir(parms))
+                     if os.path.isfile(os.path.join(parms, name))]
+        else:
+            paths = [parms]
+        self.paths = paths
+        self.images = {}
+
+    def image_class(self, path):
+        if path.lower().endswith('.cfp') or \
+                os.path.getsize(path) >= CFP_SIZE:
+            return port_class_e['CFP']
+        return port_class_e['SFF']
+
+    def oom_get_portlist(self, cport_list, numports):
+        if (cport_list == 0) and (numports == 0):   # how many ports?
+            return len(self.paths)
+        if numports < len(self.paths):
+            return -errno.ENOMEM
+        for (handle, path) in enumerate(self.paths):
+            cport = c_port_t()
+            cport.handle = handle
+            cport.oom_class = self.image_class(path)
+            name = bytearray(os.path.basename(path).encode('utf-8'))[:31]
+            for i in range(32):
+                cport.name[i] = name[i] if i < len(name) else 0
+            cport_list[handle] = cport
+        return 0
+
+    def image(self, cport):
+        handle = cport.handle or 0
+        if handle not in self.images:
+            with open(self.paths[handle], 'rb') as fd:
+                self.images[handle] = fd.read()
+        return self.images[handle]
+
+    # copy 'length' bytes of the image from 'start' into data
+    def copy(self, cport, start, length, data):
+        buf = bytearray(self.image(cport)[start:start + length])
+        buf += bytearray(length - len(buf))     # zeros past the end
+        data[0:length] = bytes(buf)
+
+    def oom_get_memory_sff(self, cport, address, page, offset, length,
+                           data):
+        if (address < 0xA0) or (address == 0xA1) or (address > 0xA2):
+            return -errno.EINVAL
+        start = offset
+        if offset >= 128:
+            start = page * 128 + offset
+        if address == 0xA2:
+            start += 256
+        self.copy(cport, start, length, data)
+        return length
+
+    def oom_get_memory_cfp(self, cport, address, length, data):
+        self.copy(cport, address * 2, length * 2, data)
+        return length
+
+    def oom_set_memory_sff(self, cport, address, page, offset, length,
+                           data):
+        return -errno.EROFS
+
+    def oom_set_memory_cfp(self, cport, address, length, data):
+        return -errno.EROFS
+
+
+# the images of the shim loaded by oomlib.setshim('oomimageshim', parms)
+images = ImageShim()
+
+
+def setparms(parms):
+    images.setparms(parms)
+
+
+def oom_get_portlist(cport_list, numports):
+    return images.oom_get_portlist(cport_list, numports)
+
+
+def oom_get_memory_sff(cport, address, page, offset, length, data):
+    return images.oom_get_memory_sff(cport, address, page, offset, length,
+                                     data)
+
+
+def oom_set_memory_sff(cport, address, page, offset, length, data):
+    return images.oom_set_memory_sff(cport, address, page, offset, length,
+                                     data)
+
+
+def oom_get_memory_cfp(cport, address, length, data):
+    return images.oom_get_memory_cfp(cport, address, length, data)
+
+
+def oom_set_memory_cfp(cport, address, length, data):
+    return images.oom_set_memory_cfp(cport, address, length, data)
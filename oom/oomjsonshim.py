@@ -17,79 +17,620 @@
 import requests
 import json
 import base64
+import time
 from .oomtypes import c_port_t
+from . import oombinproto
+from .oombinproto import BinClient, RETLEN, cport_handle
+from .oompagecache import PageCache
 
 
-# Set the default URL for the remote switch
-class url:
-    remote = "http://localhost:5000/OOM"
-url = url()
+#
+# One remote switch.  A Remote has everything the shim needs to talk to
+# one switch, and offers the shim routines as methods, so a program can
+# hold several of them, and talk to several switches at once (see
+# oomlib.oom_south() and oomfleet.py).  The module level shim routines
+# use the default Remote ('remote' below), set up by setparms().
+#
+# 'batch' is cleared if the remote switch does not understand the batch
+# command (an older oomjsonsvr), so we stop asking, a batch that fails
+# for any other reason is an IOError (see remote_batch())
+# 'portlist' holds the portlist that came back with the port count
+# 'usebinary' says to use the binary transport if the switch offers it,
+# 'binary' is the binary connection once negotiated (None: not yet asked,
+# False: not available, stay with JSON)
+# 'timeout' is the timeout (seconds) of each request, None for none
+# (binary requests then use oombinproto.TIMEOUT)
+# 'deadline' (a time.time()) fails all requests after it, and cuts
+# short the timeout of the requests before it, None for none
+#
+# Reads go through a page cache on this side of the network, unless
+# 'cache' is False.  Every read is rounded up to whole 128 byte cache
+# lines, so the next reads on the same lines don't cross the network.
+# Like the page cache in each OOM port, static lines are kept until the
+# module changes, dynamic lines are read fresh by every call (they are
+# shared by the reads of one call, eg: one oom_get_memory()), unless
+# 'dynamic_maxage' (seconds) lets them be kept for a burst of calls,
+# for callers that don't mind dynamic data (and latched flags, which a
+# read clears) that old (for the default Remote, set
+# remote.pagecache.dynamic_maxage).  Static lines are filed under the
+# port and the module's identity (from the switch's portlist), so they
+# survive portlist refreshes, and go when the module does.  Which lines
+# are dynamic comes from oomlib (oom_set_dynamic_pages()), lines of a
+# port oomlib has not described yet are treated as dynamic.
+#
+class Remote:
+    def __init__(self, parms=None, timeout=None, usebinary=True,
+                 cache=True, dynamic_maxage=0):
+        self.remote = "http://localhost:5000/OOM"
+        self.batch = True
+        self.portlist = None
+        self.usebinary = usebinary
+        self.binary = None
+        self.timeout = timeout
+        self.deadline = None
+        self.cache = cache
+        self.pagecache = PageCache(static_maxage=None,
+                                   dynamic_maxage=dynamic_maxage)
+        self.idents = {}        # handle: module identity (0: unknown)
+        self.dynamic = {}       # handle: set of dynamic (address, pagekey)
+        # one keep-alive session (connection pool) for all requests
+        self.session = requests.Session()
+        if parms is not None:
+            self.setparms(parms)
+
+    def setparms(self, parms):
+        temp = parms
+        portplus = ':5000/OOM'
+        if temp[-9:] != portplus:
+            temp = temp + portplus
+        preamble = 'http://'
+        if temp[:7] != preamble:
+            temp = preamble + temp
+        self.remote = temp
+        self.close()
+        self.binary = None
+        self.batch = True
+        self.pagecache.clear()
+        self.idents = {}
+        self.dynamic = {}
+
+    def close(self):
+        if self.binary:
+            self.binary.close()
+        self.binary = False
+
+    def check_deadline(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise IOError('%s: timed out' % self.remote)
+
+    # the timeout of the next request, cut short by the deadline
+    def request_timeout(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if self.deadline is None:
+            return timeout
+        left = max(0.001, self.deadline - time.time())
+        if timeout is None:
+            return left
+        return min(timeout, left)
+
+    #
+    # send one command to the remote switch, return the decoded reply
+    #
+    def remote_cmd(self, command):
+        self.check_deadline()
+        js = self.session.get(self.remote, json=command,
+                              timeout=self.request_timeout())
+        return json.loads(js.text)
+
+    #
+    # send a list of commands to the remote switch in one request, return
+    # the list of decoded replies.  If the remote switch does not support
+    # the 'batch' command (see batch_unknown()), stops batching and sends
+    # one request per command.  Any other failure is an IOError, the
+    # commands are not sent again: the switch may have run them already
+    # (reads can clear latched flags, writes would be done twice).
+    #
+    def remote_batch(self, commands):
+        if self.batch:
+            self.check_deadline()
+            js = self.session.get(self.remote,
+                                  json={'cmd': 'batch', 'ops': commands},
+                                  timeout=self.request_timeout())
+            if js.status_code == 200:
+                try:
+                    results = json.loads(js.text)['results']
+                except (ValueError, KeyError):
+                    raise IOError('%s: bad batch reply' % self.remote)
+                for py in results:
+                    if 'error' in py:
+                        raise IOError('%s: %s' % (self.remote, py['error']))
+                return results
+            if not self.batch_unknown(js):
+                raise IOError('%s: batch failed (%d)' % (self.remote,
+                                                         js.status_code))
+            self.batch = False
+        return [self.remote_cmd(command) for command in commands]
+
+    #
+    # True if a failed batch reply says the switch does not know the
+    # 'batch' command: 404, or 400 'unknown command' (oomjsonsvr.py), or
+    # a switch that doesn't know 'caps' either (an older oomjsonsvr
+    # answers every unknown command with a 500).  Any other failure
+    # (eg: a transient error on the switch) only fails this batch.
+    #
+    def batch_unknown(self, js):
+        if js.status_code == 404:
+            return True
+        if js.status_code == 400 and 'unknown command' in js.text:
+            return True
+        self.check_deadline()
+        caps = self.session.get(self.remote, json={'cmd': 'caps'},
+                                timeout=self.request_timeout())
+        if caps.status_code != 200:
+            return True
+        try:
+            return json.loads(caps.text).get('batch', '0') != '1'
+        except ValueError:
+            return True
+
+    #
+    # Ask the switch for its capabilities, open the binary connection if
+    # it has one, in the protocol version this side speaks.  Older
+    # switches don't know 'caps', they only speak JSON.
+    #
+    def bin_client(self):
+        if self.binary is None:
+            self.binary = False
+            if self.usebinary:
+                try:
+                    py = self.remote_cmd({'cmd': 'caps'})
+                    binport = int(py.get('binary', 0))
+                    version = int(py.get('version', 0))
+                    if binport > 0 and \
+                            version == oombinproto.PROTO_VERSION:
+                        host = self.remote.split('//')[-1].split('/')[0]
+                        host = host.rsplit(':', 1)[0]
+                        timeout = self.timeout
+                        if timeout is None:
+                            timeout = oombinproto.TIMEOUT
+                        self.binary = BinClient(
+                            host, binport,
+                            compress=int(py.get('zlib', 0)) > 0,
+                            timeout=timeout)
+                except Exception:
+                    pass
+        if self.binary and self.binary.closed:
+            self.binary = False
+        return self.binary
+
+    #
+    # Send one request over the binary connection, return the reply
+    # payload, or None if there is no binary connection, or it failed
+    # before the request went out (the caller then uses JSON).  Once
+    # the request is sent, a failure (no reply in time, an error from
+    # the switch) is an IOError, the request is not sent again: reads
+    # can clear latched flags, writes can start a CDB command.  A
+    # write ('fallback' False) is never sent again, even if the
+    # connection failed while sending it.
+    #
+    def bin_call(self, op, payload, fallback=True):
+        client = self.bin_client()
+        if not client:
+            return None
+        self.check_deadline()
+        try:
+            reqid = client.send(op, payload)
+        except (IOError, OSError):
+            self.close()
+            if fallback:
+                return None
+            raise
+        try:
+            return client.wait(reqid, self.request_timeout(client.timeout))
+        except (IOError, OSError):
+            if client.closed:
+                self.close()
+            raise
+
+    #
+    # implement oom_get_portlist over-the-network, using JSON
+    #
+    def oom_get_portlist(self, cport_list, numports):
+        if (cport_list == 0) and (numports == 0):
+            # fetch the count and the list in one round trip, keep the
+            # list for the call that is sure to follow
+            payload = self.bin_call(oombinproto.OP_PORTCOUNT, b'')
+            if payload is not None:
+                self.portlist = binportlist_to_cports(payload)
+                idents = oombinproto.unpack_portlist_idents(payload)
+            else:
+                py = self.remote_batch([{'cmd': 'ogp0'},
+                                        {'cmd': 'ogp', 'numports': 0}])
+                self.portlist = [jpdict_to_cport(jp_dict)
+                                 for jp_dict in py[1]['portlist']]
+                idents = [int(jp_dict.get('ident', '0'), 16)
+                          for jp_dict in py[1]['portlist']]
+            self.set_idents(self.portlist, idents)
+            return len(self.portlist)
+        else:
+            cports = self.portlist
+            self.portlist = None
+            if cports is None:
+                payload = self.bin_call(oombinproto.OP_PORTLIST, b'')
+                if payload is not None:
+                    cports = binportlist_to_cports(payload)
+                    idents = oombinproto.unpack_portlist_idents(payload)
+                else:
+                    py = self.remote_cmd({'cmd': 'ogp',
+                                          'numports': numports})
+                    cports = [jpdict_to_cport(jp_dict)
+                              for jp_dict in py['portlist']]
+                    idents = [int(jp_dict.get('ident', '0'), 16)
+                              for jp_dict in py['portlist']]
+                self.set_idents(cports, idents)
+            ptr = 0
+            for cport in cports[:numports]:
+                cport_list[ptr] = cport
+                ptr += 1
+            return 0
+
+    #
+    # remember the identity of the module in each port, forget the
+    # cached lines of ports and modules that are gone
+    #
+    def set_idents(self, cports, idents):
+        handles = [cport_handle(cport) for cport in cports]
+        if idents is None:
+            idents = [0] * len(handles)
+        self.idents = dict(zip(handles, idents))
+        for handle in list(self.dynamic):
+            if handle not in self.idents:
+                del self.dynamic[handle]
+        keep = set([('port', handle) for handle in handles])
+        keep.update([('module', handle, ident)
+                     for (handle, ident) in zip(handles, idents)
+                     if ident != 0])
+        self.pagecache.retain(keep)
+
+    # oomlib tells us which cache lines of a port are dynamic
+    def oom_set_dynamic_pages(self, cport, pages):
+        self.dynamic[cport_handle(cport)] = set(pages)
+
+    #
+    # where one cache line of a port is filed, and how long it lives,
+    # returns (portkey, maxage)
+    #
+    def cache_line(self, handle, address, pagekey):
+        ident = self.idents.get(handle, 0)
+        dynamic = self.dynamic.get(handle)
+        if ident != 0 and dynamic is not None and \
+                (address, pagekey) not in dynamic:
+            return (('module', handle, ident), None)
+        return (('port', handle), self.pagecache.dynamic_maxage)
+
+    #
+    # implement oom_get_memory_sff over-the-network, using JSON
+    # note, we are in oomsouth, so 'cport' is actually a c_port_t
+    #
+    def oom_get_memory_sff(self, cport, address, page, offset, length,
+                           data):
+        (retlen, retdata) = self.cached_reads([(cport, address, page,
+                                                offset, length)])[0]
+        ptr = 0
+
+        for c in retdata:
+            data[ptr] = c
+            ptr += 1
+        return(retlen)
+
+    #
+    # Several oom_get_memory_sff reads, in one request over the network
+    # 'reqs' is a list of (cport, address, page, offset, length)
+    # returns a list of (length, data) to match
+    #
+    def oom_get_memory_sff_batch(self, reqs):
+        return self.cached_reads(reqs)
+
+    #
+    # banked pages (see oomlib.split_bank()) go to the switch as
+    # bank * 0x100 + page, and are cached as such
+    #
+    def oom_get_memory_sff_bank(self, cport, address, bank, page, offset,
+                                length, data):
+        return self.oom_get_memory_sff(cport, address, (bank << 8) | page,
+                                       offset, length, data)
+
+    def oom_set_memory_sff_bank(self, port, address, bank, page, offset,
+                                length, data):
+        return self.oom_set_memory_sff(port, address, (bank << 8) | page,
+                                       offset, length, data)
+
+    #
+    # Serve reads from the page cache.  The cache lines that are missing
+    # (or too old) are read from the switch in one round trip, along
+    # with any reads that can't be cached (eg: past byte 255).
+    #
+    def cached_reads(self, reqs):
+        plans = []          # for each read: [(line, start, count)] or None
+        lines = {}          # line: data, for the lines that are cached
+        missing = []        # lines to read
+        raw = []            # reads for the switch
+        for (cport, address, page, offset, length) in reqs:
+            if (not self.cache) or (offset < 0) or (length <= 0) or \
+                    (offset + length > 256):
+                plans.append(None)
+                raw.append((cport, address, page, offset, length))
+                continue
+            handle = cport_handle(cport)
+            plan = []
+            ptr = 0
+            while ptr < length:
+                pagekey = -1
+                if offset + ptr >= 128:
+                    pagekey = page
+                start = (offset + ptr) % 128
+                count = min(length - ptr, 128 - start)
+                (portkey, maxage) = self.cache_line(handle, address, pagekey)
+                line = (portkey, address, pagekey)
+                if line not in lines and line not in missing:
+                    buf = None
+                    if maxage != 0:     # 0: always read fresh
+                        buf = self.pagecache.get(portkey, address, pagekey,
+                                                 maxage)
+                    if buf is not None:
+                        lines[line] = buf
+                    else:
+                        missing.append(line)
+                        if pagekey == -1:
+                            raw.append((cport, address, 0, 0, 128))
+                        else:
+                            raw.append((cport, address, pagekey, 128, 128))
+                plan.append((line, start, count))
+                ptr += count
+            plans.append(plan)
+
+        results = []
+        if raw != []:
+            results = self.raw_reads(raw)
+        uncached = results[:len(raw) - len(missing)]
+        failed = {}
+        for (line, (retlen, buf)) in zip(missing,
+                                         results[len(uncached):]):
+            if retlen == 128 and len(buf) == 128:
+                self.pagecache.put(line[0], line[1], line[2], buf)
+                lines[line] = buf
+            else:
+                failed[line] = retlen
+
+        replies = []
+        for plan in plans:
+            if plan is None:
+                replies.append(uncached.pop(0))
+                continue
+            errors = [failed[line] for (line, start, count) in plan
+                      if line in failed]
+            if errors != []:
+                replies.append((min(errors[0], -1), b''))
+                continue
+            data = b''.join([lines[line][start:start + count]
+                             for (line, start, count) in plan])
+            replies.append((len(data), data))
+        return replies
+
+    #
+    # the reads (cport, address, page, offset, length) themselves, from
+    # the switch, returns a list of (length, data)
+    #
+    def raw_reads(self, reqs):
+        if len(reqs) == 1:
+            return [self.raw_get_memory(*reqs[0])]
+        payload = None
+        if max([req[2] for req in reqs]) <= 0xFF:   # no banked pages
+            payload = self.bin_call(oombinproto.OP_GET_MULTI,
+                                    oombinproto.pack_multireq(
+                                        [(cport_handle(req[0]),) +
+                                         tuple(req[1:]) for req in reqs]))
+        if payload is not None:
+            return oombinproto.unpack_multiret(payload)
+        results = self.remote_batch([ogms_cmd(*req) for req in reqs])
+        return [(int(py['length']), pydict_to_data(py)) for py in results]
+
+    def raw_get_memory(self, cport, address, page, offset, length):
+        payload = None
+        if page <= 0xFF:    # banked pages don't fit the binary protocol
+            payload = self.bin_call(oombinproto.OP_GET_MEMORY,
+                                    oombinproto.pack_memreq(
+                                        cport_handle(cport), address,
+                                        page, offset, length))
+        if payload is not None:
+            (retlen,) = RETLEN.unpack_from(payload, 0)
+            return (retlen, payload[RETLEN.size:])
+        py = self.remote_cmd(ogms_cmd(cport, address, page, offset, length))
+        return (int(py['length']), pydict_to_data(py))
+
+    #
+    # implement oom_set_memory_sff over-the-network, using JSON
+    #
+    def oom_set_memory_sff(self, port, address, page, offset, length, data):
+        payload = None
+        try:
+            if page <= 0xFF:    # banked pages don't fit the binary protocol
+                payload = self.bin_call(oombinproto.OP_SET_MEMORY,
+                                        oombinproto.pack_memreq(
+                                            oombinproto.cport_handle(port),
+                                            address, page, offset, length) +
+                                        bytes(data[0:length]),
+                                        fallback=False)
+        finally:
+            self.invalidate(port, address, page, offset, length)
+        if payload is not None:
+            return RETLEN.unpack_from(payload, 0)[0]
+        strport = cport_to_json(port)
+        jsdata = base64.b64encode(data).decode('ascii')
+        py = self.remote_cmd({'cmd': 'osms', 'port': strport,
+                              'address': address, 'page': page,
+                              'offset': offset, 'length': length,
+                              'data': jsdata})
+        retlen = int(py['length'])
+        return retlen
+
+    #
+    # The Northbound calls, decoded on the switch (see 'ogkv', 'ogm' and
+    # 'keys' in oomjsonsvr.py), one small reply instead of raw pages.
+    # 'port' is an OOM port, 'maxage' is the oldest dynamic data wanted
+    # (seconds), None for the switch's default
+    #
+    def oom_get_keyvalue(self, port, key, maxage=None):
+        command = {'cmd': 'ogkv', 'port': cport_to_json(port.c_port),
+                   'key': key}
+        if maxage is not None:
+            command['maxage'] = str(maxage)
+        return self.remote_cmd(command)['value']
+
+    def oom_get_memory(self, port, function, maxage=None):
+        command = {'cmd': 'ogm', 'port': cport_to_json(port.c_port),
+                   'function': function}
+        if maxage is not None:
+            command['maxage'] = str(maxage)
+        return self.remote_cmd(command)['values']
+
+    #
+    # keys and/or functions (eg: 'DOM') on all ports, or on the ports
+    # named in 'ports', in one request, returns
+    #   {'timestamp': '...', 'ports': {port name: {key: value, ...}, ...}}
+    #
+    def oom_get_keys(self, keys, ports=None, maxage=None):
+        command = {'cmd': 'keys', 'keys': list(keys)}
+        if ports is not None:
+            command['ports'] = list(ports)
+        if maxage is not None:
+            command['maxage'] = str(maxage)
+        return self.remote_cmd(command)
+
+    #
+    # the ports that match a query (see oomquery.py), evaluated on the
+    # switch, eg: oom_query('RX*_POWER_DBM < -12'), returns the same as
+    # oom_get_keys(), for the matching ports only, with the keys that
+    # matched, plus the keys (or functions) in 'keys'
+    #
+    def oom_query(self, where, keys=None, ports=None, maxage=None):
+        command = {'cmd': 'query', 'where': where}
+        if keys is not None:
+            command['keys'] = list(keys)
+        if ports is not None:
+            command['ports'] = list(ports)
+        if maxage is not None:
+            command['maxage'] = str(maxage)
+        py = self.remote_cmd(command)
+        if 'error' in py:
+            raise ValueError(py['error'])
+        return py
+
+    # drop the cache lines a write goes to
+    def invalidate(self, cport, address, page, offset, length):
+        handle = cport_handle(cport)
+        for pagekey in set([-1 if offset < 128 else page,
+                            -1 if offset + length <= 128 else page]):
+            for portkey in (('port', handle),
+                            ('module', handle, self.idents.get(handle, 0))):
+                self.pagecache.invalidate(portkey, address, pagekey)
+
+    #
+    # Subscribe to a stream of decoded key values from the remote switch
+    # (see 'subscribe' in oomjsonsvr.py).  'keys' are key names and/or
+    # function names (eg: 'DOM'), 'ports' are port names (None for all).
+    # Yields one dict per sample, until the caller stops iterating:
+    #   {'timestamp': '...', 'ports': {port name: {key: value, ...}, ...}}
+    # With 'deltas' each sample only has the keys that changed (the first
+    # sample is complete), and a port that went away shows up as None.
+    #
+    def oom_subscribe(self, keys, interval=1.0, ports=None, deltas=True):
+        command = {'cmd': 'subscribe', 'keys': list(keys),
+                   'interval': str(interval),
+                   'deltas': '1' if deltas else '0'}
+        if ports is not None:
+            command['ports'] = list(ports)
+        reply = self.session.get(self.remote, json=command, stream=True,
+                                 timeout=self.timeout)
+        try:
+            for line in reply.iter_lines():
+                if line:
+                    yield json.loads(line.decode('utf-8'))
+        finally:
+            reply.close()
+
+
+# the default remote switch, used by the module level shim routines
+remote = Remote()
 
 
 def setparms(parms):
-    temp = parms
-    portplus = ':5000/OOM'
-    if temp[-9:] != portplus:
-        temp = temp + portplus
-    preamble = 'http://'
-    if temp[:7] != preamble:
-        temp = preamble + temp
-    url.remote = temp
+    remote.setparms(parms)
 
 
-#
-# implement oom_get_portlist over-the-network, using JSON
-#
 def oom_get_portlist(cport_list, numports):
-    if (cport_list == 0) and (numports == 0):
-        js = requests.get(url.remote, json={"cmd": "ogp0"})
-        return json_to_numports(js.text)
-    else:
-        js = requests.get(url.remote,
-                          json={'cmd': 'ogp', 'numports': numports})
-        retval = json_to_cport_list(js.text, cport_list)
-        return retval
+    return remote.oom_get_portlist(cport_list, numports)
 
 
-#
-# implement oom_get_memory_sff over-the-network, using JSON
-# note, we are in oomsouth, so 'cport' is actually a c_port_t
-#
 def oom_get_memory_sff(cport, address, page, offset, length, data):
-    strport = cport_to_json(cport)
-    js = requests.get(url.remote, json={'cmd': 'ogms', 'port': strport,
-                                        'address': address, 'page': page,
-                                        'offset': offset, 'length': length})
+    return remote.oom_get_memory_sff(cport, address, page, offset, length,
+                                     data)
 
-    py = json.loads(js.text)
-    pydata = py['data']
-    retlen = int(py['length'])
-    # in Python 3, type conversions add b' to the front and ' to the back
-    # need to strip them off before decoding.  Bother!
-    if isinstance(pydata, str):
-        pydata = pydata[2:len(pydata)-1]
-    retdata = base64.b64decode(pydata)
-    ptr = 0
 
-    for c in retdata:
-        data[ptr] = c
-        ptr += 1
-    return(retlen)
+def oom_get_memory_sff_batch(reqs):
+    return remote.oom_get_memory_sff_batch(reqs)
+
+
+def oom_set_memory_sff(port, address, page, offset, length, data):
+    return remote.oom_set_memory_sff(port, address, page, offset, length,
+                                     data)
+
+
+def oom_get_memory_sff_bank(cport, address, bank, page, offset, length,
+                            data):
+    return remote.oom_get_memory_sff_bank(cport, address, bank, page, offset,
+                                          length, data)
+
+
+def oom_set_memory_sff_bank(port, address, bank, page, offset, length,
+                            data):
+    return remote.oom_set_memory_sff_bank(port, address, bank, page, offset,
+                                          length, data)
+
+
+def oom_subscribe(keys, interval=1.0, ports=None, deltas=True):
+    return remote.oom_subscribe(keys, interval, ports, deltas)
+
+
+def oom_get_keys(keys, ports=None, maxage=None):
+    return remote.oom_get_keys(keys, ports, maxage)
+
+
+def oom_query(where, keys=None, ports=None, maxage=None):
+    return remote.oom_query(where, keys, ports, maxage)
+
+
+def oom_set_dynamic_pages(cport, pages):
+    remote.oom_set_dynamic_pages(cport, pages)
+
+
+def ogms_cmd(cport, address, page, offset, length):
+    return {'cmd': 'ogms', 'port': cport_to_json(cport),
+            'address': address, 'page': page,
+            'offset': offset, 'length': length}
 
 
 #
-# implement oom_set_memory_sff over-the-network, using JSON
+# extract the raw EEPROM bytes from a decoded 'ogms' reply
 #
-def oom_set_memory_sff(port, address, page, offset, length, data):
-    strport = cport_to_json(port)
-    jsdata = base64.b64encode(data)
-    js = requests.get(url.remote, json={'cmd': 'osms', 'port': strport,
-                                        'address': address, 'page': page,
-                                        'offset': offset, 'length': length,
-                                        'data': jsdata})
-    py = json.loads(js.text)
-    retlen = int(py['length'])
-    return retlen
+def pydict_to_data(py):
+    pydata = py['data']
+    # in Python 3, type conversions add b' to the front and ' to the back
+    # need to strip them off before decoding.  Bother!
+    if isinstance(pydata, str) and pydata[:2] == "b'":
+        pydata = pydata[2:len(pydata)-1]
+    return base64.b64decode(pydata)
 
 
 # Unpack the json return into a port list as defined by the Southbound API
@@ -103,6 +644,19 @@ def json_to_cport_list(js, cport_list):
     return 0
 
 
+# Unpack a binary portlist reply into a list of c_port_t
+def binportlist_to_cports(payload):
+    cports = []
+    for (handle, oom_class, name) in oombinproto.unpack_portlist(payload):
+        cport = c_port_t()
+        cport.handle = handle
+        cport.oom_class = oom_class
+        for i in range(0, 32):
+            cport.name[i] = bytearray(name)[i]
+        cports.append(cport)
+    return cports
+
+
 def json_to_numports(js):
     # json to dict, dict to value string, string to int
     return int(json.loads(js)["numports"])
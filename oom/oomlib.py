@@ -17,6 +17,10 @@ from ctypes import create_string_buffer
 import importlib
 import glob
 import sys
+import ast
+import threading
+import pickle
+import hashlib
 from .oomtypes import c_port_t
 from .oomtypes import port_class_e
 from .decode import collapse_cfp
@@ -109,6 +113,19 @@ class oomsth_c:
     ispy = False
 
 
+#
+# a southbound shim of its own, for ports that don't use the global
+# shim, eg: one oomjsonshim.Remote per switch to talk to many switches
+# at once (see oomfleet.py).  'shim' is any object with the python
+# shim routines (oom_get_portlist(), oom_get_memory_sff()...)
+#
+def oom_south(shim):
+    south = oomsth_c()
+    south.shim = shim
+    south.ispy = True
+    return south
+
+
 oomsth = oomsth_c()
 packagedir = os.path.normpath(os.path.dirname(os.path.realpath(__file__)))
 
@@ -151,62 +168,287 @@ except:
     decodelib = importlib.import_module('oom.decode')
 
 # and find all of the key/decode files
-keyfile_fns = []
 keyfile_dir = os.path.join(packagedir, 'keyfiles')
 
-sys.path.insert(0, keyfile_dir)   # required, to get them imported
-
-# build a list of modules in the keyfiles directory
-modulist = []
-modnamelist = glob.glob(os.path.join(keyfile_dir, '*.py'))
-for name in modnamelist:
-    name = os.path.basename(name)
-    name = name[0:len(name)-3]
-    modulist.append(name)
-modnamelist = glob.glob(keyfile_dir + '/*.pyc')  # obfuscated modules!
-for name in modnamelist:
-    name = os.path.basename(name)
-    name = name[0:len(name)-4]
-    modulist.append(name)
-modulist = list(set(modulist))  # eliminate dups, eg: x.py and x.pyc
-
-for module in modulist:
-    try:
-        keylib = importlib.import_module(module)
-    except:
-        # skip that one (it is not a module?)
-        pass
-    else:
+# a keyfile's declaration of the port types it serves, eg:
+#     port_types = (0xD, 0x11)          # QSFP_PLUS, QSFP28
+#     port_types = ((0x100, 0x1FF),)    # (low, high): all of the CFP types
+port_types_re = re.compile(r'^port_types\s*=\s*(.*?)\s*(#.*)?$', re.M)
+
+# The key maps of each port type, and what is derived from them, are
+# compiled into this file, so that they are not rebuilt by every run.
+# Bump the version when what is saved (or how it is derived) changes
+keymap_cache = os.environ.get('OOM_KEYMAP_CACHE',
+                              os.path.join(packagedir, 'keymaps.cache'))
+KEYMAP_CACHE_VERSION = (3, sys.version_info[0])
+
+
+#
+# the keys of one port type, built by the add_keys() of the keyfiles
+# that declare the type (it stands in for a port, add_keys() only looks
+# at the port type and fills in the maps), and the indexes derived from
+# them.  Ports of the type get copies of the maps, the indexes are
+# shared (unless an add-on changes a port's maps, see init_port_keys())
+#
+class keymap_c:
+    def __init__(self, port_type):
+        self.port_type = port_type
+        self.mmap = {}
+        self.fmap = {}
+        self.wmap = {}
+        self.pages = []             # (address, pagekey) lines with keys
+        self.dynamic_pages = []     # the lines with dynamic keys
+        self.function_pages = {}    # function: the lines its keys need
+        self.function_dynamic = {}  # function: its lines to re-read
+        self.page_keys = {}         # (address, pagekey): keys on that line
+
+    def derive(self):
+        # SFF types only, CFP types (0x100 and up) are not paged
+        if self.port_type >= 0x100:
+            return
+        mm = self.mmap
+        self.pages = sorted(key_pages(mm, mm))
+        self.dynamic_pages = key_pages(mm, [key for key in mm
+                                            if mm[key][0] == 1])
+        for function in self.fmap:
+            keys = self.fmap[function]
+            self.function_pages[function] = key_pages(mm, keys)
+            self.function_dynamic[function] = key_pages(
+                mm, [key for key in keys if key in mm and mm[key][0] == 1])
+        for key in mm:
+            for line in key_pages(mm, (key,)):
+                self.page_keys.setdefault(line, []).append(key)
+
+
+#
+# the keyfiles, indexed by the port types they serve
+# The index is built from the 'port_types' line of each keyfile's source,
+# without importing any of them.  A keyfile is imported the first time a
+# port of one of its types needs keys, so only the keyfiles of the types
+# actually present are ever imported.  The add_keys() of a keyfile that
+# declares its types is called once per type, to build the type's key
+# maps (see keymap_c).  A keyfile with no 'port_types' (eg: an add-on,
+# see addonsample.py, or an obfuscated .pyc) serves every type, its
+# add_keys() is called for every port, with the port, each time the
+# port is set up, and must do its own filtering, as before.
+#
+# The index, and the key maps of each type seen (see keymap_c), are saved
+# in the keymap_cache file, and loaded from it with one read by the next
+# run, which then imports no keyfiles at all for the types in it.  The
+# cache is dropped if a keyfile is added or removed, or if one's mtime
+# changed, and its contents too.  compile() puts every known type in
+# the cache (eg: at install time).  If the cache can't be written, the
+# key maps are just built by every run
+#
+class keyfiles_c:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.loaded = False     # the cache has been tried
+        self.stamps = None      # keyfile name: (mtime, size, sha1)
+        self.types = None       # port_type: [keyfile names]
+        self.ranges = []        # (low, high, keyfile name)
+        self.anytype = []       # keyfiles that serve every type
+        self.add_keys = {}      # keyfile name: add_keys (None if not there)
+        self.fns = {}           # port_type: [add_keys]
+        self.keymaps = {}       # port_type: keymap_c
+
+    # the port types declared in a keyfile, None if it doesn't say
+    def read_port_types(self, path):
         try:
-            keyfile_fns.append(getattr(keylib, 'add_keys'))
-        except:
-            # skip that one ('add_keys' is not there?)
-            pass
-sys.path = sys.path[1:]  # put the search path back
+            with open(path, 'r') as fd:
+                match = port_types_re.search(fd.read())
+            declared = ast.literal_eval(match.group(1))
+            if not isinstance(declared, (tuple, list)):
+                declared = (declared,)
+            return [tuple(item) if isinstance(item, (tuple, list))
+                    else (item, item) for item in declared]
+        except Exception:
+            return None
+
+    def keyfile_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.py')) +
+                      glob.glob(os.path.join(self.directory, '*.pyc')))
+
+    def sha1(self, path):
+        with open(path, 'rb') as fd:
+            return hashlib.sha1(fd.read()).hexdigest()
+
+    #
+    # the stamps of the keyfiles, from the cached stamps where the file's
+    # mtime and size have not changed (so unchanged keyfiles are not read)
+    #
+    def get_stamps(self, cached):
+        stamps = {}
+        for path in self.keyfile_paths():
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            old = cached.get(name)
+            if old is not None and old[0:2] == (stat.st_mtime, stat.st_size):
+                stamps[name] = old
+            else:
+                stamps[name] = (stat.st_mtime, stat.st_size, self.sha1(path))
+        return stamps
+
+    def build(self):
+        names = {}
+        for path in self.keyfile_paths():
+            if path.endswith('.py'):
+                names[os.path.basename(path)[:-3]] = path
+            else:
+                names.setdefault(os.path.basename(path)[:-4], None)
+        self.types = {}
+        for name in sorted(names):
+            declared = None
+            if names[name] is not None:
+                declared = self.read_port_types(names[name])
+            if declared is None:
+                self.anytype.append(name)
+                continue
+            for (low, high) in declared:
+                if low == high:
+                    self.types.setdefault(low, []).append(name)
+                else:
+                    self.ranges.append((low, high, name))
+
+    #
+    # load the index and key maps from the cache, if it is good, else
+    # build the index from the keyfiles
+    #
+    def load(self):
+        self.loaded = True
+        cache = None
+        try:
+            with open(keymap_cache, 'rb') as fd:
+                cache = pickle.loads(fd.read())
+            if cache['version'] != KEYMAP_CACHE_VERSION:
+                cache = None
+        except Exception:
+            cache = None
+        self.stamps = self.get_stamps(cache['stamps'] if cache else {})
+        if cache is None or \
+                [(name, stamp[2]) for (name, stamp) in
+                 sorted(cache['stamps'].items())] != \
+                [(name, stamp[2]) for (name, stamp) in
+                 sorted(self.stamps.items())]:
+            self.build()
+            return
+        (self.types, self.ranges, self.anytype) = cache['index']
+        for (port_type, state) in cache['keymaps'].items():
+            keymap = keymap_c(port_type)
+            keymap.__dict__.update(state)
+            self.keymaps[port_type] = keymap
+        if self.stamps != cache['stamps']:
+            self.save()     # same keyfiles, newer mtimes, note them
+
+    # write the cache (to a new file, renamed, so readers see all or none)
+    def save(self):
+        cache = {'version': KEYMAP_CACHE_VERSION,
+                 'stamps': self.stamps,
+                 'index': (self.types, self.ranges, self.anytype),
+                 'keymaps': dict([(port_type, keymap.__dict__)
+                                  for (port_type, keymap) in
+                                  self.keymaps.items()])}
+        temp = '%s.%d' % (keymap_cache, os.getpid())
+        try:
+            with open(temp, 'wb') as fd:
+                fd.write(pickle.dumps(cache, 2))
+            os.rename(temp, keymap_cache)
+        except Exception:
+            # not writable, eg: installed by root, the cache is optional
+            try:
+                os.remove(temp)
+            except Exception:
+                pass
+
+    # import a keyfile (once), returns its add_keys, None if none
+    def import_keyfile(self, name):
+        if name not in self.add_keys:
+            sys.path.insert(0, self.directory)  # required, to import it
+            try:
+                keylib = importlib.import_module(name)
+                self.add_keys[name] = getattr(keylib, 'add_keys', None)
+            except Exception:
+                # skip that one (it is not a module?)
+                self.add_keys[name] = None
+            finally:
+                sys.path.remove(self.directory)
+        return self.add_keys[name]
+
+    # the add_keys of the keyfiles that declare a port type
+    def get_fns(self, port_type):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            fns = self.fns.get(port_type)
+            if fns is None:
+                names = set(self.types.get(port_type, []))
+                names.update([name for (low, high, name) in self.ranges
+                              if low <= port_type <= high])
+                fns = [self.import_keyfile(name) for name in sorted(names)]
+                fns = [func for func in fns if func is not None]
+                self.fns[port_type] = fns
+            return fns
+
+    # the add_keys of the keyfiles that serve every type, called per port
+    def get_anytype_fns(self):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            fns = [self.import_keyfile(name) for name in self.anytype]
+            return [func for func in fns if func is not None]
+
+    # the keymap_c of a port type, from the cache, or built (and cached)
+    def get_keymap(self, port_type, save=True):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            keymap = self.keymaps.get(port_type)
+            if keymap is None:
+                keymap = keymap_c(port_type)
+                for func in self.get_fns(port_type):
+                    func(keymap)
+                keymap.derive()
+                self.keymaps[port_type] = keymap
+                if save:
+                    self.save()
+            return keymap
+
+    # build the key maps of every known port type, and cache them
+    # eg: at install time, by whoever can write the cache:
+    #     python -c 'from oom import oomlib; oomlib.keyfiles.compile()'
+    def compile(self):
+        with self.lock:
+            for port_type in sorted(port_type_e.values()):
+                if port_type >= 0:
+                    self.get_keymap(port_type, False)
+            self.save()
+
+keyfiles = keyfiles_c(keyfile_dir)
 
 
 # This class is the python port, which includes the C definition
 # of a port, plus other useful things, including the port type,
 # and the keymap for that port.
 class Port:
-    def __init__(self, cport):
+    def __init__(self, cport, south=None):
         self.c_port = cport
 
+        # the southbound shim for this port, normally the global one
+        if south is None:
+            south = oomsth
+        self.south = south
+
         # create an empty page cache
         self.pages = {}
         self.readcount = 0
+        self.tables = {}    # CFP register cache, see oom_get_cached_cfp()
+        self.ident = None   # module identity, see oom_refresh_port()
 
         # copy the C character array into a more manageable python string
         self.port_name = bytearray(cport.name).decode('utf-8').rstrip('\0')
         if oom_portlist_nokeys == 0:
-            self.port_type = get_port_type(self)
-
-            # initialize the key maps, potentially unique for each port
-            self.mmap = {}
-            self.fmap = {}
-            self.wmap = {}
-            for func in keyfile_fns:  # try each keyfile for appropriate keys
-                func(self)
+            init_port_keys(self)
 
     def add_addr(self, address):
         self.pages.update({address: {}})
@@ -217,6 +459,39 @@ class Port:
         self.pages[address].pop(pagekey, 'already empty')
 
 
+#
+# figure out the type of the port, and build its key maps.  Done for
+# every port by oom_get_portlist(), unless oom_portlist_nokeys is set,
+# in which case it can be done later, for just the ports that need it
+#
+def init_port_keys(port):
+    port.port_type = get_port_type(port)
+
+    # initialize the key maps, potentially unique for each port, from
+    # the (cached) key maps of its type, then let the add-ons look at
+    # the port.  A port whose maps they changed gets its own indexes
+    port.keymap = keyfiles.get_keymap(port.port_type)
+    port.mmap = dict(port.keymap.mmap)
+    port.fmap = dict(port.keymap.fmap)
+    port.wmap = dict(port.keymap.wmap)
+    for func in keyfiles.get_anytype_fns():
+        func(port)
+    if (port.mmap, port.fmap, port.wmap) != \
+            (port.keymap.mmap, port.keymap.fmap, port.keymap.wmap):
+        keymap = keymap_c(port.port_type)
+        keymap.mmap = port.mmap
+        keymap.fmap = port.fmap
+        keymap.wmap = port.wmap
+        keymap.derive()
+        port.keymap = keymap
+
+    # a shim that caches (eg: oomjsonshim) needs to know which cache
+    # lines are dynamic (optional shim routine oom_set_dynamic_pages())
+    if port.south.ispy and hasattr(port.south.shim, 'oom_set_dynamic_pages'):
+        port.south.shim.oom_set_dynamic_pages(port.c_port,
+                                              port.keymap.dynamic_pages)
+
+
 #
 # oom_get_port(n): helper routine, provides a port without requiring the prior
 # definition of the complicated port_t struct
@@ -241,9 +516,13 @@ def sort_portlist(portlist):
 #
 # similarly, provide the port list without requiring the definition
 # of the port_t structure.  Allocate the memory here.
+# 'south' (see oom_south()) gets the ports of another shim than the
+# global one
 #
-def oom_get_portlist():
-    numports = oomsth.shim.oom_get_portlist(0, 0)
+def oom_get_portlist(south=None):
+    if south is None:
+        south = oomsth
+    numports = south.shim.oom_get_portlist(0, 0)
     if numports < 0:
         raise RuntimeError("oom_get_portlist error: %d" % numports)
     elif numports == 0:
@@ -251,8 +530,8 @@ def oom_get_portlist():
 
     cport_array = c_port_t * numports
     cport_list = cport_array()
-    retval = oomsth.shim.oom_get_portlist(cport_list, numports)
-    pl = [Port(cport) for cport in cport_list]
+    retval = south.shim.oom_get_portlist(cport_list, numports)
+    pl = [Port(cport, south) for cport in cport_list]
     portlist = sort_portlist(pl)
     return portlist
 
@@ -279,6 +558,108 @@ def get_port_type(port):
     return ptype
 
 
+#
+# Check that the port still holds the module it was set up for (fresh
+# reads of the type byte (CFP: the ID register, 0x8000) and of the
+# vendor name, part number and serial number), for programs that keep a
+# portlist for a long time.  If the module was inserted, removed, or
+# replaced by another module (of any type), the page cache (CFP: the
+# register cache) is dropped, and the port is typed again, with new key
+# maps.  Returns True if the port changed.
+# The first check of a port compares with the identity in its cache,
+# if it is not cached, there is nothing to drop.
+#
+def oom_refresh_port(port):
+    if port.c_port.oom_class not in (port_class_e['SFF'],
+                                     port_class_e['CFP']):
+        return False
+    (ptype, ident) = read_port_ident(port)
+    if hasattr(port, 'port_type') and ptype == port.port_type:
+        old = port.ident
+        if old is None:
+            old = cached_port_ident(port)
+        port.ident = ident
+        if old is None or old == ident:
+            return False
+    port.pages = {}
+    port.tables = {}
+    init_port_keys(port)
+    port.ident = ident
+    return True
+
+
+#
+# The keys that identify a module, the bytes from the first to the
+# last (in one place in every type) are its identity
+#
+IDENT_KEYS = ('VENDOR_NAME', 'VENDOR_PN', 'VENDOR_SN')
+
+
+# (address, page, offset, length) of the identity in a key map, None
+# if it has none (eg: no module)
+def ident_span(mm):
+    keys = [key for key in IDENT_KEYS if key in mm]
+    if keys == []:
+        return None
+    (address, page) = mm[keys[0]][2:4]
+    keys = [key for key in keys if mm[key][2:4] == (address, page)]
+    start = min([mm[key][4] for key in keys])
+    end = max([mm[key][4] + mm[key][5] for key in keys])
+    return (address, page, start, end - start)
+
+
+# (register, length) of the identity in a CFP key map, None if it has
+# none
+def cfp_ident_span(mm):
+    keys = [key for key in IDENT_KEYS if key in mm]
+    if keys == []:
+        return None
+    start = min([mm[key][3] for key in keys])
+    end = max([mm[key][3] + mm[key][4] for key in keys])
+    return (start, end - start)
+
+
+#
+# the identity of the module in a port, read from the module (not the
+# cache): (type, bytes), the bytes are b'' if it has none
+#
+def read_port_ident(port):
+    if port.c_port.oom_class == port_class_e['CFP']:
+        ptype = get_port_type(port)
+        span = cfp_ident_span(keyfiles.get_keymap(ptype).mmap)
+        if span is None:
+            return (ptype, b'')
+        return (ptype, oom_get_memory_cfp(port, *span).raw[0:span[1]*2])
+    data = oom_get_memory_sff(port, 0xA0, 0, 0, 1)
+    ptype = bytearray(data.raw)[0]
+    span = ident_span(keyfiles.get_keymap(ptype).mmap)
+    if span is None:
+        return (ptype, b'')
+    return (ptype, oom_get_memory_sff(port, *span).raw[0:span[3]])
+
+
+# the identity in the page cache of a port, None if it is not cached
+def cached_port_ident(port):
+    if port.c_port.oom_class == port_class_e['CFP']:
+        span = cfp_ident_span(port.mmap)
+        if span is None:
+            return b''
+        (offset, length) = span
+        for reg in range(offset, offset + length):
+            if reg not in port.tables.get(cfp_table(reg), ()):
+                return None
+        return oom_get_cached_cfp(port, offset, length).raw
+    span = ident_span(port.mmap)
+    if span is None:
+        return b''
+    (address, page, offset, length) = span
+    for pagekey in (get_pagekey(page, offset),
+                    get_pagekey(page, offset + length - 1)):
+        if pagekey not in port.pages.get(address, {}):
+            return None
+    return oom_get_cached_sff(port, address, page, offset, length)
+
+
 #
 # Manage the buffer cache in the port class, transparently fill the
 # cache (for this i2c address, for this page) if it is empty,
@@ -311,28 +692,295 @@ def oom_get_cached_sff(port, address, page, offset, length):
     return data
 
 
+#
+# Map an offset and page to the key used in the page cache.
+# Low memory (offset < 128) is not actually in a page, it is cached as -1
+#
+def get_pagekey(page, offset):
+    if offset < 128:
+        return -1
+    return page
+
+
+#
+# List the (address, pagekey) cache lines needed to decode 'keys' on
+# an SFF port, in the order the keys are listed.  A key that starts in
+# low memory and runs past byte 127 needs both low memory and its page.
+#
+def get_key_pages(port, keys):
+    return key_pages(port.mmap, keys)
+
+
+# get_key_pages(), from a key map
+def key_pages(mm, keys):
+    pages = []
+    for key in keys:
+        if key not in mm:
+            continue
+        address = mm[key][2]
+        page = mm[key][3]
+        offset = mm[key][4]
+        length = mm[key][5]
+        for line in ((address, get_pagekey(page, offset)),
+                     (address, get_pagekey(page, offset + length - 1))):
+            if line not in pages:
+                pages.append(line)
+    return pages
+
+
+#
+# Fill the page cache of 'port' with every (address, pagekey) listed
+# in 'pages' that is not already cached.  If the southbound shim offers
+# oom_get_memory_sff_batch() (a python shim that can carry several reads
+# in one transaction, eg: oomjsonshim), all of the missing pages are
+# read with one call, otherwise they are read one page at a time.
+#
+def oom_fill_page_cache(port, pages):
+    missing = []
+    for (address, pagekey) in pages:
+        if address not in port.pages:
+            port.add_addr(address)
+        if pagekey not in port.pages[address]:
+            missing.append((address, pagekey))
+    if len(missing) == 0:
+        return
+    # banked pages are read last, bank by bank
+    banked = [line for line in missing if is_banked(line[1])]
+    missing = [line for line in missing if not is_banked(line[1])]
+    if len(missing) > 1 and port.south.ispy and \
+            hasattr(port.south.shim, 'oom_get_memory_sff_batch'):
+        # the shim's batch only takes bank 0 pages
+        reqs = []
+        for (address, pagekey) in missing:
+            if pagekey == -1:
+                reqs.append((port.c_port, address, 0, 0, 128))
+            else:
+                reqs.append((port.c_port, address, pagekey, 128, 128))
+        port.readcount = port.readcount + 1
+        results = port.south.shim.oom_get_memory_sff_batch(reqs)
+        for (address, pagekey), (retlen, buf) in zip(missing, results):
+            data = create_string_buffer(128)
+            data[0:len(buf)] = buf
+            port.pages[address].update({pagekey: data})
+        missing = []
+    for (address, pagekey) in missing:
+        buf = oom_get_page_sff(port, address, pagekey)
+        port.pages[address].update({pagekey: buf})
+    if len(banked) > 0:
+        fill_bank_pages(port, banked)
+
+
+#
+# read banked cache lines, one bank at a time: each bank is selected
+# once, its pages are read, then bank 0 is selected again (unless the
+# shim addresses banks itself).  Lines in banks the module does not
+# have, or that could not be selected, are cached as zeros
+#
+def fill_bank_pages(port, lines):
+    banks = port_banks(port)
+    groups = {}
+    for (address, pagekey) in lines:
+        groups.setdefault((address, pagekey >> 8), []).append(pagekey)
+    for (address, bank) in sorted(groups):
+        pagekeys = sorted(groups[(address, bank)])
+        if bank < banks and has_bank_routines(port):
+            for pagekey in pagekeys:
+                buf = oom_get_page_sff(port, address, pagekey)
+                port.pages[address].update({pagekey: buf})
+            continue
+        bufs = dict([(pagekey, create_string_buffer(128))
+                     for pagekey in pagekeys])
+        if bank < banks:
+            with bank_lock(port):
+                try:
+                    if select_bank(port, address, bank,
+                                   pagekeys[0] & 0xFF):
+                        for pagekey in pagekeys:
+                            port.readcount = port.readcount + 1
+                            shim_get_memory_sff(port, address,
+                                                pagekey & 0xFF, 128, 128,
+                                                bufs[pagekey])
+                finally:
+                    select_bank(port, address, 0, 0)
+        port.pages[address].update(bufs)
+
+
+#
+# read one whole cache line (128 bytes) from EEPROM, bypassing the cache
+#
+def oom_get_page_sff(port, address, pagekey):
+    if pagekey == -1:
+        return oom_get_memory_sff(port, address, 0, 0, 128)
+    return oom_get_memory_sff(port, address, pagekey, 128, 128)
+
+
+#
+# The (address, pagekey) cache lines holding dynamic keys for this port,
+# (the lines that must be re-read to get fresh values)
+#
+def get_dynamic_pages(port):
+    if port.c_port.oom_class != port_class_e['SFF']:
+        return []
+    mm = port.mmap
+    return get_key_pages(port, [key for key in mm if mm[key][0] == 1])
+
+
+#
+# Banked pages (CMIS): pages 0x10-0xFF come in banks, 16 lane modules
+# and breakouts use banks 1-3 for lanes 9 and up.  In keyfiles, and in
+# the page cache, page P of bank B is B * 0x100 + P (eg: 0x111 is page
+# 0x11 of bank 1), so each bank has its own cache lines, and bank 0
+# pages are just their page number, as always.
+# A shim that can address banks offers oom_get_memory_sff_bank() and
+# oom_set_memory_sff_bank() (same as oom_*_memory_sff(), with a bank
+# before the page), its other routines address bank 0.  For other
+# shims, oomlib selects the bank itself (bank and page, bytes 126 and
+# 127 of low memory, in one write), and selects bank 0 again when it is
+# done, as other programs (and the NOS) expect to find it.  Bank 0
+# pages are read without any select.  Banks beyond those the module
+# has (BANKS_SUPPORTED) are never selected, they read as zeros.
+# Threads of one process (eg: the servers' request, sampler and refresh
+# threads) share the module: the select, the access and the select of
+# bank 0 are done holding the module's bank lock, and so is any access
+# to pages 0x10-0xFF of bank 0, so it can't land while another bank is
+# selected.
+#
+def split_bank(page, offset):
+    if offset < 128 or page < 0x10:
+        return (0, page & 0xFF)     # low memory, and pages 0-0xF: no bank
+    return (page >> 8, page & 0xFF)
+
+
+# True if the cache line 'pagekey' is a page of banks 1-3
+def is_banked(pagekey):
+    return split_bank(pagekey, 128)[0] != 0
+
+
+#
+# the number of banks the module has (from its page 1), 1 if it has no
+# banks, or no pages at all
+#
+def port_banks(port):
+    mm = port.mmap
+    if 'BANKS_SUPPORTED' not in mm:
+        return 1
+    if 'FLAT_MEM' in mm and oom_get_keyvalue_cached(port, 'FLAT_MEM'):
+        return 1
+    return (1, 2, 4, 1)[oom_get_keyvalue_cached(port, 'BANKS_SUPPORTED')]
+
+
+# the cache lines among 'pages' in banks the module does not have
+def absent_bank_pages(port, pages):
+    banked = [line for line in pages if is_banked(line[1])]
+    if len(banked) == 0:
+        return []
+    banks = port_banks(port)
+    return [line for line in banked if line[1] >> 8 >= banks]
+
+
+#
+# the bank lock of a module (the port on its shim), see above
+#
+banklocks_mutex = threading.Lock()
+banklocks = {}
+
+
+def bank_lock(port):
+    key = (id(port.south.shim), port.port_name)
+    with banklocks_mutex:
+        if key not in banklocks:
+            banklocks[key] = threading.RLock()
+        return banklocks[key]
+
+
+# True if an access is to pages 0x10-0xFF, and oomlib selects the banks
+def needs_bank_lock(port, page, offset, length):
+    return offset + length > 128 and (page & 0xFF) >= 0x10 and \
+        not has_bank_routines(port)
+
+
+#
+# select 'bank' and 'page' in the module.  False if they could not be
+# selected
+#
+def select_bank(port, address, bank, page):
+    data = create_string_buffer(bytes(bytearray([bank, page])), 2)
+    return shim_set_memory_sff(port, address, 0, 126, 2, data) == 2
+
+
+def has_bank_routines(port):
+    return port.south.ispy and \
+        hasattr(port.south.shim, 'oom_get_memory_sff_bank')
+
+
+#
+# hack: if oomsouth is the python version, I can't figure out how to
+# deal with a byref() pointer, so I pass the c_port rather than the
+# pointer to it.  Fixing this hack would make me happy.
+#
+def shim_get_memory_sff(port, address, page, offset, length, data):
+    if port.south.ispy:
+        return port.south.shim.oom_get_memory_sff(port.c_port, address,
+                                                  page, offset, length,
+                                                  data)
+    return port.south.shim.oom_get_memory_sff(byref(port.c_port),
+                                              address, page, offset,
+                                              length, data)
+
+
+# same hack, see shim_get_memory_sff()
+def shim_set_memory_sff(port, address, page, offset, length, data):
+    if port.south.ispy:
+        return port.south.shim.oom_set_memory_sff(port.c_port, address,
+                                                  page, offset, length,
+                                                  data)
+    return port.south.shim.oom_set_memory_sff(byref(port.c_port),
+                                              address, page, offset,
+                                              length, data)
+
+
 #
 # Allocate the memory for raw reads, return the data cleanly
 # Does not interact at all with port's page caches
+# 'page' may be a banked page (see split_bank()), data from a bank that
+# the module does not have, or can't be selected, reads as zeros
 #
 def oom_get_memory_sff(port, address, page, offset, length):
     data = create_string_buffer(length)  # allocate space
     port.readcount = port.readcount + 1
-    #
-    # hack: if oomsouth is the python version, I can't figure out how to
-    # deal with a byref() pointer, so I pass the c_port rather than the
-    # pointer to it.  Fixing this hack would make me happy.
-    # Fix it in oom_set_memory_sff too!
-    #
-    if oomsth.ispy:
-        retlen = oomsth.shim.oom_get_memory_sff(port.c_port, address,
-                                                page, offset, length, data)
-    else:
-        retlen = oomsth.shim.oom_get_memory_sff(byref(port.c_port), address,
-                                                page, offset, length, data)
+    (bank, page) = split_bank(page, offset + length - 1)
+    if not needs_bank_lock(port, page, offset, length):
+        if bank == 0:
+            shim_get_memory_sff(port, address, page, offset, length, data)
+        elif bank < port_banks(port):
+            port.south.shim.oom_get_memory_sff_bank(port.c_port, address,
+                                                    bank, page, offset,
+                                                    length, data)
+        return data
+    with bank_lock(port):
+        if bank == 0:
+            shim_get_memory_sff(port, address, page, offset, length, data)
+        elif bank < port_banks(port):
+            try:
+                if select_bank(port, address, bank, page):
+                    shim_get_memory_sff(port, address, page, offset,
+                                        length, data)
+            finally:
+                select_bank(port, address, 0, 0)
     return data
 
 
+#
+# Which bus (i2c adapter, MDIO bus, ...) the port is on, if the shim
+# can tell (optional shim routine oom_get_bus()).  Ports on different
+# buses can be read in parallel.  Returns -1 if the bus is unknown
+#
+def oom_get_bus(port):
+    if port.south.ispy and hasattr(port.south.shim, 'oom_get_bus'):
+        return port.south.shim.oom_get_bus(port.c_port)
+    return -1
+
+
 #
 # Raw write
 #
@@ -341,23 +989,87 @@ def oom_set_memory_sff(port, address, page, offset, length, data):
     if offset < 128:
         pagekey = -1
     port.invalidate_page(address, pagekey)  # force re-read after write
-    if oomsth.ispy:
-        retlen = oomsth.shim.oom_set_memory_sff(port.c_port, address,
-                                                page, offset, length, data)
-    else:
-        retlen = oomsth.shim.oom_set_memory_sff(byref(port.c_port), address,
-                                                page, offset, length, data)
-    return retlen
+    (bank, page) = split_bank(page, offset + length - 1)
+    if not needs_bank_lock(port, page, offset, length):
+        if bank == 0:
+            return shim_set_memory_sff(port, address, page, offset, length,
+                                       data)
+        if bank >= port_banks(port):
+            return -1
+        return port.south.shim.oom_set_memory_sff_bank(port.c_port, address,
+                                                       bank, page, offset,
+                                                       length, data)
+    with bank_lock(port):
+        if bank == 0:
+            return shim_set_memory_sff(port, address, page, offset, length,
+                                       data)
+        if bank >= port_banks(port):
+            return -1
+        retlen = -1
+        try:
+            if select_bank(port, address, bank, page):
+                retlen = shim_set_memory_sff(port, address, page, offset,
+                                             length, data)
+        finally:
+            select_bank(port, address, 0, 0)
+        return retlen
 
 
 #
-# CFP version of get_cached...
-# for now, don't cache, just fetch everything, everytime
-# because, unlike i2c devices, there is no natural page boundary for
-# cache lines
+# CFP register cache.  CFP registers are organized in tables of 128
+# registers (CFP MSA Management Interface Specification: 0x8000 NVR1,
+# 0x8080 NVR2, 0xA000 VR1 (DOM), 0xB000 lane tables...), the cache
+# holds each table as it is read, {table: {register: 2 bytes}}, in
+# port.tables.  MDIO moves a register at a time, so unlike the SFF page
+# cache, only the registers asked for are read, not whole tables.
+# Static keys (see cfp.py) are read once, dynamic keys are read fresh
+# by oom_get_keyvalue(), and re-read by oom_get_memory() (their
+# registers are invalidated first)
 #
+CFP_TABLE = 0x80
+
+
+def cfp_table(register):
+    return register & ~(CFP_TABLE - 1)
+
+
 def oom_get_cached_cfp(port, offset, length):
-    return oom_get_memory_cfp(port, offset, length)
+    oom_fill_cfp_cache(port, [(offset, length)])
+    data = create_string_buffer(length*2)
+    if length > 0:
+        data[0:length*2] = b''.join(
+            [port.tables[cfp_table(reg)][reg]
+             for reg in range(offset, offset + length)])
+    return data
+
+
+#
+# read the registers of 'spans' ([(register, length)]) that are not
+# cached, one read per table, from the first missing register to the
+# last (MDIO reads a register at a time, a gap costs what it holds,
+# but one call is much cheaper than several through the shim)
+#
+def oom_fill_cfp_cache(port, spans):
+    missing = {}    # table: [first, last + 1]
+    for (offset, length) in spans:
+        for reg in range(offset, offset + length):
+            if reg in port.tables.get(cfp_table(reg), ()):
+                continue
+            span = missing.setdefault(cfp_table(reg), [reg, reg + 1])
+            span[0] = min(span[0], reg)
+            span[1] = max(span[1], reg + 1)
+    for (first, last) in missing.values():
+        data = oom_get_memory_cfp(port, first, last - first)
+        data = bytes(data.raw)
+        for reg in range(first, last):
+            table = port.tables.setdefault(cfp_table(reg), {})
+            table[reg] = data[(reg - first)*2:(reg - first)*2 + 2]
+
+
+# drop cached CFP registers, to be read fresh
+def cfp_invalidate(port, offset, length):
+    for reg in range(offset, offset + length):
+        port.tables.get(cfp_table(reg), {}).pop(reg, None)
 
 
 #
@@ -368,7 +1080,8 @@ def oom_get_cached_cfp(port, offset, length):
 def oom_get_memory_cfp(port, address, length):
     data = create_string_buffer(length*2)  # allocate space in bytes
     port.readcount = port.readcount + 1
-    retlen = oomsth.shim.oom_get_memory_cfp(port.c_port, address, length, data)
+    retlen = port.south.shim.oom_get_memory_cfp(port.c_port, address,
+                                                length, data)
     return data
 
 
@@ -376,7 +1089,9 @@ def oom_get_memory_cfp(port, address, length):
 # Raw write
 #
 def oom_set_memory_cfp(port, address, length, data):
-    retlen = oomsth.shim.oom_set_memory_cfp(port.c_port, address, length, data)
+    cfp_invalidate(port, address, length)     # force re-read after write
+    retlen = port.south.shim.oom_set_memory_cfp(port.c_port, address,
+                                                length, data)
     return retlen
 
 
@@ -387,6 +1102,9 @@ def oom_get_keyvalue(port, key):
         return ''
     decoder = getattr(decodelib, mm[key][1])      # get the decoder
     if port.c_port.oom_class == port_class_e['SFF']:
+        line = (mm[key][2], get_pagekey(mm[key][3], mm[key][4]))
+        if len(absent_bank_pages(port, [line])) > 0:
+            return ''                             # a bank it does not have
         par = (port,) + mm[key][2:6]              # get the location
         if mm[key][0] == 0:                       # static data, use cache
             raw_data = oom_get_cached_sff(*par)   # get the cached data
@@ -461,27 +1179,222 @@ def oom_set_keyvalue(port, key, value):
 #
 def oom_get_memory(port, function):
 
-    mm = port.mmap
     funcmap = port.fmap
-    retval = {}
 
     if function not in funcmap:
         return None
 
-    for key in funcmap[function]:
-        if mm[key][0] == 1:         # Dynamic key, invalidate page cache
-            pagekey = mm[key][3]    # page of interest
-            if mm[key][4] < 128:    # unless it is the low memory page
-                pagekey = -1        # whose pagekey is -1
-            port.invalidate_page(mm[key][2], pagekey)
+    (pages, dynamic) = get_function_pages(port, function)
+    return oom_get_keys(port, funcmap[function], pages, dynamic)
+
+
+#
+# the cache lines the keys of a function need, and the lines of its
+# dynamic keys (to be re-read), as (pages, dynamic), from the index of
+# the port's type, unless the port's keys for that function were changed
+#
+def get_function_pages(port, function):
+    if port.c_port.oom_class != port_class_e['SFF']:
+        return ([], [])     # not paged
+    keymap = getattr(port, 'keymap', None)
+    if keymap is not None and function in keymap.function_pages and \
+            port.fmap.get(function) is keymap.fmap[function]:
+        return (keymap.function_pages[function],
+                keymap.function_dynamic[function])
+    keys = port.fmap[function]
+    return (get_key_pages(port, keys), get_dynamic_key_pages(port, keys))
+
+
+# the cache lines of the dynamic keys among 'keys'
+def get_dynamic_key_pages(port, keys):
+    mm = port.mmap
+    return key_pages(mm, [key for key in keys
+                          if key in mm and mm[key][0] == 1])
 
-    for key in funcmap[function]:
+
+#
+# like oom_get_memory(), for several functions at once, eg: ('DOM',
+# 'FLAGS').  Pages shared by the functions are only read once.
+# Returns one dictionary with the keys of all of the functions,
+# functions that are not defined for this port are skipped
+#
+def oom_get_memory_multi(port, functions):
+    keys = []
+    pages = []
+    dynamic = []
+    for function in functions:
+        if function not in port.fmap:
+            continue
+        for key in port.fmap[function]:
+            if key not in keys:
+                keys.append(key)
+        (fpages, fdynamic) = get_function_pages(port, function)
+        pages.extend([line for line in fpages if line not in pages])
+        dynamic.extend([line for line in fdynamic if line not in dynamic])
+    return oom_get_keys(port, keys, pages, dynamic)
+
+
+#
+# the values of a list of keys, with fresh dynamic data, reading each
+# page they need once.  'pages' and 'dynamic' (the lines of the keys,
+# and of their dynamic keys, see get_function_pages()) save working them
+# out again, when they are already known
+#
+def oom_get_keys(port, keys, pages=None, dynamic=None):
+    retval = {}
+    absent = []
+
+    if port.c_port.oom_class == port_class_e['SFF']:
+        # each line with dynamic keys is invalidated once, then all the
+        # lines the keys need are read in one go
+        if dynamic is None:
+            dynamic = get_dynamic_key_pages(port, keys)
+        for (address, pagekey) in dynamic:
+            port.invalidate_page(address, pagekey)
+        if pages is None:
+            pages = get_key_pages(port, keys)
+        oom_fill_page_cache(port, pages)
+        absent = absent_bank_pages(port, pages)
+    elif port.c_port.oom_class == port_class_e['CFP']:
+        oom_refresh_cfp_keys(port, keys)
+
+    mm = port.mmap
+    for key in keys:
+        if len(absent) > 0 and key in mm and \
+                (mm[key][2], get_pagekey(mm[key][3], mm[key][4])) in absent:
+            retval[key] = ''    # in a bank the module does not have
+            continue
+        retval[key] = oom_get_keyvalue_cached(port, key)
+    return retval
+
+
+#
+# re-read a few cache lines ((address, pagekey), eg: the dynamic lines
+# of a function), and re-decode only the keys on those lines, into
+# 'values' (eg: the dictionary from an earlier oom_get_memory()), other
+# keys are left as they are.  Returns the keys that were re-decoded.
+# SFF ports only
+#
+def oom_refresh_pages(port, pages, values):
+    keymap = getattr(port, 'keymap', None)
+    mm = port.mmap
+    if keymap is not None and mm == keymap.mmap:
+        page_keys = keymap.page_keys
+    else:
+        page_keys = {}
+        for key in mm:
+            for line in key_pages(mm, (key,)):
+                page_keys.setdefault(line, []).append(key)
+    for (address, pagekey) in pages:
+        port.invalidate_page(address, pagekey)
+    oom_fill_page_cache(port, pages)
+    keys = []
+    for line in pages:
+        keys.extend([key for key in page_keys.get(line, ())
+                     if key in values and key not in keys])
+    for key in keys:
+        values[key] = oom_get_keyvalue_cached(port, key)
+    return keys
+
+
+#
+# CFP: invalidate the registers of the dynamic keys among 'keys', then
+# read every register the keys need that is not cached
+#
+def oom_refresh_cfp_keys(port, keys):
+    mm = port.mmap
+    for key in keys:
+        if key in mm and mm[key][0] == 1:
+            cfp_invalidate(port, mm[key][3], mm[key][4])
+    oom_fill_cfp_cache(port, [mm[key][3:5] for key in keys if key in mm])
+
+
+#
+# Snapshot of a whole module: every page that holds any of its keys is
+# read fresh, once, in page order, each page as one 128 byte block (all
+# in one transaction if the shim can batch).  Pages beyond page 0 are
+# skipped on flat memory modules (they are not implemented), banks
+# beyond those the module has are skipped too.  On CFP modules, the
+# registers of dynamic keys are read fresh, static ones come from the
+# register cache.
+# The page cache then holds the whole image, every key is decoded from
+# it, with no further reads.  Returns {key: value} for every key.
+#
+def oom_get_snapshot(port):
+    mm = port.mmap
+    if port.c_port.oom_class == port_class_e['SFF']:
+        keymap = getattr(port, 'keymap', None)
+        if keymap is not None and mm == keymap.mmap:
+            pages = keymap.pages
+        else:
+            pages = sorted(get_key_pages(port, mm))
+        for (address, pagekey) in pages:
+            port.invalidate_page(address, pagekey)
+        # low memory first, it tells if the upper pages are there
+        oom_fill_page_cache(port, [line for line in pages if line[1] == -1])
+        if 'FLAT_MEM' in mm and oom_get_keyvalue_cached(port, 'FLAT_MEM'):
+            pages = [line for line in pages if line[1] <= 0]
+        else:
+            # and the banks it has (its page 1 tells)
+            absent = absent_bank_pages(port, pages)
+            pages = [line for line in pages if line not in absent]
+        oom_fill_page_cache(port, pages)
+    elif port.c_port.oom_class == port_class_e['CFP']:
+        oom_refresh_cfp_keys(port, list(mm))
+    retval = {}
+    for key in mm:
+        if port.c_port.oom_class == port_class_e['SFF'] and \
+                (mm[key][2], get_pagekey(mm[key][3], mm[key][4])) \
+                not in pages:
+            retval[key] = ''    # on a page the module does not have
+            continue
         retval[key] = oom_get_keyvalue_cached(port, key)
     return retval
 
 
+#
+# the values of a few SFF keys, read straight from the module, only
+# the bytes the keys cover (one read for each address and page), the
+# page cache is neither used nor filled.  For small, hot regions (eg:
+# the interrupt flags) where a whole cache line would be wasted.
+# The keys in 'covered' that are in the bytes read are decoded too (eg:
+# latched flags, which the read has just cleared in the module)
+#
+def oom_read_keys(port, keys, covered=()):
+    mm = port.mmap
+    spans = {}      # (address, page): [first byte, last byte + 1]
+    for key in keys:
+        (address, page, offset, length) = mm[key][2:6]
+        span = spans.get((address, page))
+        if span is None:
+            spans[(address, page)] = [offset, offset + length]
+        else:
+            span[0] = min(span[0], offset)
+            span[1] = max(span[1], offset + length)
+    raw = {}
+    for ((address, page), (first, last)) in spans.items():
+        raw[(address, page)] = (first, oom_get_memory_sff(port, address,
+                                                          page, first,
+                                                          last - first))
+    retval = {}
+    for key in list(keys) + [key for key in covered if key in mm]:
+        (address, page, offset, length) = mm[key][2:6]
+        if (address, page) not in raw:
+            continue
+        (first, data) = raw[(address, page)]
+        if offset < first or offset + length > first + len(data):
+            continue
+        decoder = getattr(decodelib, mm[key][1])
+        retval[key] = decoder(data[offset - first:offset - first + length],
+                              *mm[key][6:])
+    return retval
+
+
 # debug helper function, print raw data, in hex
+# 'data' is anything bytearray() takes: a string buffer, bytes, or (on
+# python 2) a string
 def print_block_hex(data, initial):
+    data = bytearray(data)
     dataptr = 0
     bytesleft = len(data)
     lines = int((bytesleft + 15) / 16)
@@ -496,7 +1409,7 @@ def print_block_hex(data, initial):
             if nbytes > 4:
                 nbytes = 4
             for k in range(nbytes):
-                temp = ord(data[dataptr])
+                temp = data[dataptr]
                 foo = hex(temp)
                 if temp < 16:
                     outstr += '0'
@@ -0,0 +1,125 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oompagecache.py : A page cache that can be shared by many users of
+#  the same ports (eg: all the clients of oomjsonsvr.py).  Like the page
+#  cache in each OOM port, it holds 128 byte cache lines, by port,
+#  i2c address and page (low memory is page -1).  Unlike that cache,
+#  each line has an age, and is re-read when it is older than the
+#  max-age for that line.
+#
+#  The max-age policy:
+#    static lines (no dynamic keys on them) live for 'static_maxage'
+#    dynamic lines (any dynamic key on them) live for 'dynamic_maxage'
+#    a max-age of None means the line never expires
+#    'maxages' can override the max-age of any (address, pagekey)
+#
+#  When several threads want the same stale line at the same time,
+#  only one of them reads it from the module, the others wait for
+#  that read and share the result.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import time
+from threading import Lock
+
+
+class PageCache:
+    def __init__(self, static_maxage=None, dynamic_maxage=1.0, maxages=None):
+        self.static_maxage = static_maxage
+        self.dynamic_maxage = dynamic_maxage
+        self.maxages = {}
+        if maxages is not None:
+            self.maxages.update(maxages)
+        self.lines = {}     # (portkey, address, pagekey): (data, time)
+        self.locks = {}     # (portkey, address, pagekey): Lock
+        self.mutex = Lock()
+        self.reads = 0      # reads that actually went to the module
+        self.hits = 0       # reads served from the cache
+
+    #
+    # the max-age of one cache line, given whether it is dynamic
+    #
+    def maxage(self, address, pagekey, dynamic):
+        if (address, pagekey) in self.maxages:
+            return self.maxages[(address, pagekey)]
+        if dynamic:
+            return self.dynamic_maxage
+        return self.static_maxage
+
+    def _linelock(self, line):
+        with self.mutex:
+            lock = self.locks.get(line)
+            if lock is None:
+                lock = Lock()
+                self.locks[line] = lock
+            return lock
+
+    def _fresh(self, line, maxage, now):
+        entry = self.lines.get(line)
+        if entry is None:
+            return None
+        if maxage is not None and (now - entry[1]) > maxage:
+            return None
+        return entry[0]
+
+    #
+    # return the cache line, calling reader() to fill it if it is
+    # missing or older than maxage
+    #
+    def fetch(self, portkey, address, pagekey, maxage, reader):
+        line = (portkey, address, pagekey)
+        data = self._fresh(line, maxage, time.time())
+        if data is not None:
+            self.hits += 1
+            return data
+        with self._linelock(line):
+            # someone else may have just read it while we waited
+            data = self._fresh(line, maxage, time.time())
+            if data is not None:
+                self.hits += 1
+                return data
+            data = reader()
+            self.reads += 1
+            self.lines[line] = (data, time.time())
+        return data
+
+    #
+    # return the cache line if it is younger than maxage, else None
+    #
+    def get(self, portkey, address, pagekey, maxage=None):
+        return self._fresh((portkey, address, pagekey), maxage, time.time())
+
+    def put(self, portkey, address, pagekey, data):
+        self.lines[(portkey, address, pagekey)] = (data, time.time())
+
+    # age of a cache line in seconds, None if it is not cached
+    def age(self, portkey, address, pagekey):
+        entry = self.lines.get((portkey, address, pagekey))
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+
+    #
+    # drop cache lines: one line, one address of a port, or a whole port
+    #
+    def invalidate(self, portkey, address=None, pagekey=None):
+        with self.mutex:
+            for line in list(self.lines):
+                if line[0] != portkey:
+                    continue
+                if address is not None and line[1] != address:
+                    continue
+                if pagekey is not None and line[2] != pagekey:
+                    continue
+                self.lines.pop(line, None)
+
+    # drop every line of every port not in 'portkeys'
+    def retain(self, portkeys):
+        with self.mutex:
+            for line in list(self.lines):
+                if line[0] not in portkeys:
+                    self.lines.pop(line, None)
+
+    def clear(self):
+        with self.mutex:
+            self.lines = {}
@@ -0,0 +1,271 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oompoller.py : poll the modules of a switch in the background
+#
+#  A Poller runs one thread that reads the same functions (by default
+#  DOM and FLAGS) from every port, every 'interval' seconds, and keeps
+#  the results in a Snapshot.  Readers (exporters, alarm checks...) use
+#  the latest snapshot, they never touch the modules themselves, so any
+#  number of readers add no i2c traffic.
+#
+#  Static data (identity, thresholds) is read once per module, when the
+#  port is first seen or its module changes.  Each poll checks every
+#  port for a module change (see oom_refresh_port()), the whole portlist
+#  is rebuilt every 'portlist_interval' seconds.
+#
+#  A snapshot is never changed after it is published, a poll builds a
+#  new one and swaps it in, so readers need no lock.  Functions added
+#  with add_listener() are called with each new snapshot, on the
+#  poller thread.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import time
+import threading
+from . import oomlib
+
+IDENTITY_KEYS = ('VENDOR_NAME', 'VENDOR_PN', 'VENDOR_SN')
+
+
+#
+# what is known about one port: its module identity and thresholds
+# (read once per module), and the values of the polled functions
+#
+class PortSample:
+    def __init__(self, port, static, values, when, error=None):
+        self.port = port
+        self.name = port.port_name
+        self.port_type = port.port_type
+        self.static = static    # {key: value}, identity and thresholds
+        self.values = values    # {key: value}, the polled functions
+        self.time = when        # when values were read
+        self.error = error      # None, or why the port could not be read
+
+
+#
+# one poll of all the ports
+#
+class Snapshot:
+    def __init__(self, samples, started, duration, errors, sequence):
+        self.samples = samples      # [PortSample], in portlist order
+        self.started = started      # time.time() the poll started
+        self.duration = duration    # seconds the poll took
+        self.errors = errors        # ports that failed this poll
+        self.sequence = sequence    # polls since the poller started
+
+
+class Poller:
+    def __init__(self, functions=('DOM', 'FLAGS'),
+                 static_functions=('THRESHOLDS',), interval=10,
+                 portlist_interval=300, south=None):
+        self.functions = tuple(functions)
+        self.static_functions = tuple(static_functions)
+        self.interval = interval
+        self.portlist_interval = portlist_interval
+        self.south = south
+        self.portlist = None
+        self.portlist_time = 0
+        self.static = {}        # port name: static values of its module
+        self.snapshot = Snapshot([], 0, 0, 0, 0)
+        self.listeners = []
+        self.polls = 0
+        self.errors = 0         # port reads that failed, since started
+        self.refresh_ports = True   # check every port for a new module
+        self.thread = None
+        self.stopping = threading.Event()
+
+    #
+    # func(snapshot) is called after each poll
+    #
+    def add_listener(self, func):
+        self.listeners.append(func)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='oompoller')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stopping.is_set():
+            started = time.time()
+            try:
+                self.poll()
+            except Exception:   # eg: a listener failed, keep polling
+                pass
+            # polls start every 'interval', however long the poll took
+            wait = self.interval - (time.time() - started)
+            self.stopping.wait(max(wait, 0))
+
+    #
+    # the portlist, rebuilt every portlist_interval seconds, in between,
+    # only the ports whose module changed are set up again
+    #
+    def get_portlist(self):
+        now = time.time()
+        if self.portlist is None or \
+                (now - self.portlist_time) > self.portlist_interval:
+            self.portlist = oomlib.oom_get_portlist(self.south)
+            self.portlist_time = now
+            self.static = {}
+            return self.portlist
+        if self.refresh_ports:
+            for port in self.portlist:
+                self.refresh_port(port)
+        return self.portlist
+
+    # set the port up again (new static values) if its module changed
+    def refresh_port(self, port):
+        if oomlib.oom_refresh_port(port):
+            self.static.pop(port.port_name, None)
+
+    # identity and thresholds, read when a module is first seen
+    def get_static(self, port):
+        static = self.static.get(port.port_name)
+        if static is None:
+            static = {}
+            keys = [key for key in IDENTITY_KEYS if key in port.mmap]
+            for key in keys:
+                static[key] = oomlib.oom_get_keyvalue(port, key)
+            static.update(oomlib.oom_get_memory_multi(port,
+                                                      self.static_functions))
+            self.static[port.port_name] = static
+        return static
+
+    #
+    # read one port, its static values only if its module is new
+    #
+    def read_port(self, port):
+        try:
+            static = self.get_static(port)
+            values = oomlib.oom_get_memory_multi(port, self.functions)
+            return PortSample(port, static, values, time.time())
+        except Exception as err:
+            self.static.pop(port.port_name, None)
+            return PortSample(port, {}, {}, time.time(), str(err))
+
+    #
+    # read every port once, publish the new snapshot
+    #
+    def poll(self):
+        started = time.time()
+        samples = []
+        errors = 0
+        try:
+            portlist = self.get_portlist()
+        except Exception:
+            portlist = []
+            self.portlist = None    # try again from scratch next time
+            errors += 1
+        for port in portlist:
+            sample = self.read_port(port)
+            if sample.error is not None:
+                errors += 1
+            samples.append(sample)
+        return self.publish(samples, started, errors)
+
+    # make the samples the current snapshot, tell the listeners
+    def publish(self, samples, started, errors):
+        self.polls += 1
+        self.errors += errors
+        snapshot = Snapshot(samples, started, time.time() - started,
+                            errors, self.polls)
+        self.snapshot = snapshot
+        for listener in self.listeners:
+            listener(snapshot)
+        return snapshot
+
+
+#
+# Flag gated polling: modules with a FLAG_GATE function (QSFP, CMIS)
+# summarize what changed in a few interrupt and latched flag bytes.
+# Each poll reads only those bytes (see oom_read_keys()), and reads the
+# polled functions in full only when:
+#     a flag is set (or the interrupt line is asserted)
+#     'full_interval' seconds have passed since the last full read
+#     a consumer asked for it, with request_full()
+# otherwise the port's last full sample stands.  Ports without a
+# FLAG_GATE (eg: SFP) are read in full on every poll.  A port is only
+# checked for a module change (see oom_refresh_port()) before a full
+# read, not on every poll.
+#
+# Reading the latched flags clears them, so the gate read also decodes
+# the latched flags of the polled functions that are in the bytes it
+# read (eg: the per lane LOS flags of a QSFP), and carries them into
+# the full read that follows it.
+#
+class FlagGatedPoller(Poller):
+    def __init__(self, functions=('DOM', 'FLAGS'),
+                 static_functions=('THRESHOLDS',), interval=1,
+                 full_interval=60, portlist_interval=300, south=None):
+        Poller.__init__(self, functions, static_functions, interval,
+                        portlist_interval, south)
+        self.full_interval = full_interval
+        self.refresh_ports = False
+        self.latest = {}        # port name: last full PortSample
+        self.requested = set()  # port names to read in full next poll
+        self.gate_reads = 0
+        self.full_reads = 0
+
+    #
+    # read this port (a port name), or every port, in full on the next
+    # poll
+    #
+    def request_full(self, name=None):
+        if name is None:
+            self.latest = {}
+        else:
+            self.requested.add(name)
+
+    def read_port(self, port):
+        name = port.port_name
+        gate = port.fmap.get('FLAG_GATE')
+        latest = self.latest.get(name)
+        flags = {}
+        if gate is not None and latest is not None and \
+                latest.error is None and latest.port_type == port.port_type \
+                and name not in self.requested and \
+                time.time() - latest.time < self.full_interval:
+            latched = [key for function in self.functions
+                       for key in port.fmap.get(function, ())
+                       if key.startswith('L_')]
+            try:
+                flags = oomlib.oom_read_keys(port, gate, latched)
+            except Exception as err:
+                return PortSample(port, {}, {}, time.time(), str(err))
+            self.gate_reads += 1
+            if not gate_set(flags):
+                return latest
+        self.requested.discard(name)
+        try:
+            self.refresh_port(port)
+        except Exception as err:
+            return PortSample(port, {}, {}, time.time(), str(err))
+        sample = Poller.read_port(self, port)
+        self.full_reads += 1
+        for key in flags:
+            if key.startswith('L_') and flags[key]:
+                sample.values[key] = (sample.values.get(key) or 0) | \
+                    flags[key]
+        if gate is not None:
+            self.latest[name] = sample
+        return sample
+
+
+# the gate shows a change: the interrupt is asserted, or a flag is set
+def gate_set(flags):
+    for key in flags:
+        if key == 'INT_L':
+            if flags[key] == 0:
+                return True
+        elif flags[key]:
+            return True
+    return False
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomprometheus.py : Prometheus exporter for the modules of a switch
+#
+#      python -m oom.oomprometheus [-port 9650] [-interval 10]
+#                                  [-url <oomjsonsvr URL>]
+#
+#  A background poller (oompoller.py) reads DOM, flags, thresholds and
+#  module identity from every port on its own schedule.  Each poll is
+#  rendered once into the Prometheus text format, a scrape (GET
+#  /metrics) just returns the latest rendering, so scrapes cost the
+#  same however many ports there are, and any number of scrapers add
+#  no i2c traffic.
+#
+#  Metrics:
+#    oom_module_info{port, type, vendor, pn, sn} 1
+#    oom_temperature_celsius{port}
+#    oom_supply_voltage_volts{port}
+#    oom_tx_bias_milliamps{port, lane}
+#    oom_tx_power_milliwatts{port, lane}
+#    oom_rx_power_milliwatts{port, lane}
+#    oom_flag{port, flag, lane}          latched flags, as decoded
+#    oom_threshold{port, threshold}      as decoded (power in dBm)
+#    oom_port_up{port}                   0 if the port could not be read
+#    oom_poll_duration_seconds, oom_poll_timestamp_seconds,
+#    oom_poll_errors, oom_polls_total
+#  Lanes are numbered from 1, keys with no lane (eg: SFP TX_BIAS) have
+#  no lane label.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import re
+import argparse
+from oom import oomlib
+from oom.oomlib import type_to_str
+from oom.oompoller import Poller, IDENTITY_KEYS
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+# DOM keys: (metric, help), the lane is taken from the key name
+DOM_METRICS = {
+    'TEMPERATURE': ('oom_temperature_celsius', 'Module temperature'),
+    'SUPPLY_VOLTAGE': ('oom_supply_voltage_volts', 'Module supply voltage'),
+    'VCC': ('oom_supply_voltage_volts', 'Module supply voltage'),
+    'TX_BIAS': ('oom_tx_bias_milliamps', 'Laser bias current'),
+    'TX_POWER': ('oom_tx_power_milliwatts', 'Transmit power'),
+    'RX_POWER': ('oom_rx_power_milliwatts', 'Receive power'),
+}
+
+# a lane number in a key name: TX3_BIAS, L_RX3_LOS...
+# (keys for two lanes at once, eg: L_RX1_RX2_POWER, keep their name)
+LANE = re.compile(r'^([A-Z_]*?[A-Z])([1-9][0-9]*)(_[A-Z_]*)?$')
+
+
+#
+# split a key into its name without the lane, and the lane (or None)
+#
+def split_lane(key):
+    match = LANE.match(key)
+    if match is None:
+        return (key, None)
+    return (match.group(1) + (match.group(3) or ''), match.group(2))
+
+
+def label_value(value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return value.replace('\n', '\\n')
+
+
+def labels(pairs):
+    if len(pairs) == 0:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, label_value(value))
+                              for (name, value) in pairs])
+
+
+# a value Prometheus can take, or None
+def number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+#
+# render a snapshot in the Prometheus text format
+#
+def render(snapshot):
+    metrics = {}    # metric name: (help, type, [lines])
+
+    def add(name, helptext, mtype, pairs, value):
+        value = number(value)
+        if value is None:
+            return
+        if name not in metrics:
+            metrics[name] = (helptext, mtype, [])
+        metrics[name][2].append('%s%s %s' % (name, labels(pairs),
+                                             repr(value)))
+
+    for sample in snapshot.samples:
+        port = [('port', sample.name)]
+        add('oom_port_up', 'Port was read on the last poll', 'gauge',
+            port, int(sample.error is None))
+        if sample.error is not None:
+            continue
+        static = sample.static
+        add('oom_module_info', 'Module identity', 'gauge',
+            port + [('type', type_to_str(sample.port_type)),
+                    ('vendor', str(static.get('VENDOR_NAME', '')).strip()),
+                    ('pn', str(static.get('VENDOR_PN', '')).strip()),
+                    ('sn', str(static.get('VENDOR_SN', '')).strip())], 1)
+        for key in sorted(sample.values):
+            (name, lane) = split_lane(key)
+            pairs = list(port)
+            if name.startswith('L_'):
+                pairs.append(('flag', name))
+                if lane is not None:
+                    pairs.append(('lane', lane))
+                add('oom_flag', 'Latched flag', 'gauge', pairs,
+                    sample.values[key])
+            elif name in DOM_METRICS:
+                if lane is not None:
+                    pairs.append(('lane', lane))
+                (metric, helptext) = DOM_METRICS[name]
+                add(metric, helptext, 'gauge', pairs, sample.values[key])
+        for key in sorted(static):
+            if key not in IDENTITY_KEYS:
+                add('oom_threshold', 'Alarm and warning thresholds',
+                    'gauge', port + [('threshold', key)], static[key])
+
+    add('oom_poll_duration_seconds', 'Time the last poll took', 'gauge',
+        [], snapshot.duration)
+    add('oom_poll_timestamp_seconds', 'Time the last poll started', 'gauge',
+        [], snapshot.started)
+    add('oom_poll_errors', 'Ports that failed the last poll', 'gauge',
+        [], snapshot.errors)
+    add('oom_polls_total', 'Polls since the exporter started', 'counter',
+        [], snapshot.sequence)
+
+    text = []
+    for name in sorted(metrics):
+        (helptext, mtype, lines) = metrics[name]
+        text.append('# HELP %s %s' % (name, helptext))
+        text.append('# TYPE %s %s' % (name, mtype))
+        text.extend(lines)
+    return ('\n'.join(text) + '\n').encode('utf-8')
+
+
+#
+# the rendering of the latest poll, swapped in by the poller thread
+# (empty until the first poll is done)
+#
+class exposition:
+    text = b''
+
+exposition = exposition()
+
+
+def publish(snapshot):
+    exposition.text = render(snapshot)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        text = exposition.text
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OOM Prometheus exporter')
+    parser.add_argument('-port', type=int, default=9650,
+                        help='HTTP port to serve /metrics on')
+    parser.add_argument('-interval', type=float, default=10,
+                        help='seconds between polls of the modules')
+    parser.add_argument('-url', default=None,
+                        help='poll a remote switch (oomjsonsvr.py)')
+    args = parser.parse_args()
+
+    if args.url is not None:
+        oomlib.setshim('oomjsonshim', args.url)
+
+    poller = Poller(interval=args.interval)
+    poller.add_listener(publish)
+    poller.start()
+    server = MetricsServer(('', args.port), MetricsHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    poller.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomquery.py : select ports with a predicate on their keys, eg:
+#
+#      RX*_POWER_DBM < -12 or L_TX*_FAULT != 0
+#
+#  A query is a python style boolean expression: comparisons (<, <=, >,
+#  >=, ==, !=) of key names and constants (numbers, strings, True,
+#  False), combined with 'and', 'or', 'not' and parentheses.
+#  Nothing else (no calls, no arithmetic, no attributes) is allowed.
+#
+#  A '*' in a key name is a wildcard, matching any characters.  A
+#  comparison holds if it holds for any of the keys its names match on
+#  the port.  A key that is not on the port matches nothing, so a
+#  comparison with it does not hold.
+#
+#  compile_query() checks the query once, then the query works out
+#  which keys it needs on each port (from the port's own keys, which
+#  can differ between ports of one type, eg: VDM keys), and can be
+#  evaluated against any source of decoded values, eg: the page cache
+#  of oomjsonsvr.py (the 'query' command), or oom_query() below for
+#  local ports.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import ast
+import re
+import fnmatch
+from . import oomlib
+
+# comparison operators allowed, by ast class name
+COMPARES = {
+    'Lt': lambda a, b: a < b,
+    'LtE': lambda a, b: a <= b,
+    'Gt': lambda a, b: a > b,
+    'GtE': lambda a, b: a >= b,
+    'Eq': lambda a, b: a == b,
+    'NotEq': lambda a, b: a != b,
+}
+
+# names that are constants, not keys (python 2 parses these as names)
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+class Query:
+    def __init__(self, text):
+        self.text = text
+        self.wildcards = {}     # placeholder name: key pattern
+        # '*' is not legal in a python name, stand in for the wildcards
+        source = re.sub(r'\'[^\']*\'|"[^"]*"|[A-Za-z_*][A-Za-z0-9_*]*',
+                        self._name, text)
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as err:
+            raise ValueError('bad query: %s (%s)' % (text, err))
+        self.tree = tree.body
+        self.names = []         # key names and patterns, in order
+        self._check(self.tree)
+
+    def _name(self, match):
+        name = match.group(0)
+        if '*' not in name or name[0] in '\'"':   # not in strings
+            return name
+        placeholder = '_oomwild%d' % len(self.wildcards)
+        self.wildcards[placeholder] = name
+        return placeholder
+
+    def _check(self, node):
+        kind = type(node).__name__
+        if kind == 'BoolOp':
+            for value in node.values:
+                self._check(value)
+        elif kind == 'UnaryOp' and \
+                type(node.op).__name__ in ('Not', 'USub', 'UAdd'):
+            self._check(node.operand)
+        elif kind == 'Compare':
+            for op in node.ops:
+                if type(op).__name__ not in COMPARES:
+                    raise ValueError('bad query: %s (operator %s)' %
+                                     (self.text, type(op).__name__))
+            self._check(node.left)
+            for comparator in node.comparators:
+                self._check(comparator)
+        elif kind == 'Name':
+            if node.id not in CONSTANTS:
+                name = self.wildcards.get(node.id, node.id)
+                if name not in self.names:
+                    self.names.append(name)
+        elif kind not in ('Constant', 'Num', 'Str', 'NameConstant'):
+            raise ValueError('bad query: %s (%s not allowed)' %
+                             (self.text, kind))
+
+    #
+    # the keys this query needs on this port, in the order the query
+    # names them (worked out each time, a port's keys can change, eg:
+    # oomvdm adds the VDM keys of its module)
+    #
+    def keys(self, port):
+        mm = sorted(port.mmap)
+        keys = []
+        for name in self.names:
+            for key in fnmatch.filter(mm, name):
+                if key not in keys:
+                    keys.append(key)
+        return keys
+
+    #
+    # evaluate the query, 'values' is {key: decoded value} for (at least)
+    # the keys() of the port.  Returns (matched, keys), where keys are
+    # the keys of the comparisons that held
+    #
+    def evaluate(self, values):
+        hits = []
+        matched = bool(self._eval(self.tree, values, hits))
+        return (matched, hits)
+
+    def _eval(self, node, values, hits):
+        kind = type(node).__name__
+        if kind == 'BoolOp':
+            # no short cut, so that every comparison that holds is seen
+            results = [self._eval(value, values, hits)
+                       for value in node.values]
+            if type(node.op).__name__ == 'And':
+                return all(results)
+            return any(results)
+        if kind == 'UnaryOp':
+            opname = type(node.op).__name__
+            if opname == 'Not':
+                return not self._eval(node.operand, values, [])
+            operand = self._operand(node.operand, values)
+            try:
+                if opname == 'USub':
+                    return -operand[0][1]
+                return operand[0][1]
+            except (TypeError, IndexError):
+                return None
+        if kind == 'Compare':
+            return self._compare(node, values, hits)
+        operands = self._operand(node, values)
+        if len(operands) == 0:
+            return False
+        return operands[0][1]
+
+    #
+    # the candidates for one side of a comparison, [(key, value)],
+    # key is None for a constant
+    #
+    def _operand(self, node, values):
+        kind = type(node).__name__
+        if kind == 'Name':
+            if node.id in CONSTANTS:
+                return [(None, CONSTANTS[node.id])]
+            name = self.wildcards.get(node.id, node.id)
+            return [(key, values[key]) for key in sorted(values)
+                    if fnmatch.fnmatchcase(key, name)]
+        if kind == 'Constant' or kind == 'NameConstant':
+            return [(None, node.value)]
+        if kind == 'Num':
+            return [(None, node.n)]
+        if kind == 'Str':
+            return [(None, node.s)]
+        return [(None, self._eval(node, values, []))]
+
+    def _compare(self, node, values, hits):
+        sides = [self._operand(node.left, values)]
+        sides += [self._operand(comp, values) for comp in node.comparators]
+        ops = [COMPARES[type(op).__name__] for op in node.ops]
+        matched = False
+        # try every combination of candidates (one key per name)
+        combos = [[]]
+        for side in sides:
+            combos = [combo + [candidate] for combo in combos
+                      for candidate in side]
+        for combo in combos:
+            if self._holds(ops, combo):
+                matched = True
+                for (key, value) in combo:
+                    if key is not None and key not in hits:
+                        hits.append(key)
+        return matched
+
+    def _holds(self, ops, combo):
+        for i in range(len(ops)):
+            a = combo[i][1]
+            b = combo[i + 1][1]
+            if a is None or b is None or a == '' or b == '':
+                return False    # a key that could not be read
+            try:
+                if not ops[i](a, b):
+                    return False
+            except TypeError:   # eg: a string compared to a number
+                return False
+        return True
+
+
+#
+# compile a query, keep the compiled queries, the same queries tend to
+# come back again and again (eg: a health check across a fleet)
+#
+class compiled:
+    queries = {}
+    MAX = 100
+
+compiled = compiled()
+
+
+def compile_query(text):
+    query = compiled.queries.get(text)
+    if query is None:
+        query = Query(text)
+        if len(compiled.queries) >= compiled.MAX:
+            compiled.queries.clear()
+        compiled.queries[text] = query
+    return query
+
+
+#
+# the ports of 'portlist' that match the query (local ports)
+# returns [(port, {key: value})], with the keys of the comparisons
+# that held
+#
+def oom_query(portlist, text):
+    query = compile_query(text)
+    matches = []
+    for port in portlist:
+        values = dict([(key, oomlib.oom_get_keyvalue(port, key))
+                       for key in query.keys(port)])
+        (matched, hits) = query.evaluate(values)
+        if matched:
+            matches.append((port, dict([(key, values[key])
+                                        for key in hits])))
+    return matches
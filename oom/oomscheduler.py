@@ -0,0 +1,280 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomscheduler.py : poll each port as often as it is worth polling
+#
+#  An AdaptivePoller is an oompoller.Poller (same snapshots, same
+#  listeners) that reads each port on its own interval instead of
+#  reading every port at one rate.  After each read, the port's interval
+#  is set from how interesting it is ('urgency', 0 to 1):
+#
+#    volatility  how far its DOM values moved since the last read,
+#                against the span of their alarm thresholds
+#    proximity   how close a value is to a warning threshold
+#    flags       any latched flag set means full urgency
+#
+#  interval = max_interval * (min_interval / max_interval) ** urgency
+#  so a quiet port is read every max_interval seconds, a port on the
+#  edge every min_interval seconds.  Urgency decays over a few reads,
+#  a port that just settled is not dropped back to the slowest rate at
+#  once.
+#
+#  Bus budget: each bus (see oom_get_bus()) gets at most 'budget' reads
+#  a second (a port read costs its module-change check plus the pages
+#  of its polled keys).  If the intervals asked for would need more,
+#  every interval on that bus is stretched by the same factor, so the
+#  budget wins over max_interval.  Reads are paced by a token bucket
+#  per bus, so the reads of ports due at the same time are spread out,
+#  not read in a burst.
+#
+#  A snapshot holds the latest sample of every port, it is published at
+#  most every 'publish_interval' seconds, when any port was read.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import time
+from . import oomlib
+from .oomtypes import port_class_e
+from .oompoller import Poller, PortSample
+from .oomalarms import build_checks, flag_set
+
+
+#
+# the schedule of one port
+#
+class PortSchedule:
+    def __init__(self, due):
+        self.due = due          # when it is to be read next
+        self.urgency = 1.0      # new ports are read fast, until known
+        self.interval = None    # seconds, as asked for by its urgency
+        self.cost = 1           # bus reads, for one read of this port
+        self.bus = -1
+        self.checks = None      # threshold checks of the module
+        self.static = None      # the static values the checks came from
+        self.sample = None      # the latest sample
+
+
+class AdaptivePoller(Poller):
+    def __init__(self, functions=('DOM', 'FLAGS'),
+                 static_functions=('THRESHOLDS',), min_interval=1,
+                 max_interval=60, budget=50, portlist_interval=300,
+                 publish_interval=None, south=None):
+        Poller.__init__(self, functions, static_functions, min_interval,
+                        portlist_interval, south)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.budget = float(budget)     # reads a second, per bus
+        self.publish_interval = publish_interval
+        if publish_interval is None:
+            self.publish_interval = self.min_interval
+        self.volatility = 0.02  # moving 2% of the threshold span: urgent
+        self.proximity = 0.1    # within 10% of the span of a warning
+        self.decay = 0.5        # urgency kept from the last read
+        self.schedules = {}     # port name: PortSchedule
+        self.tokens = {}        # bus: [tokens, time last filled]
+        self.demand = {}        # bus: reads a second the intervals ask for
+        self.costs = {}         # port_type: cost of one read
+        self.published = 0
+
+    def run(self):
+        started = time.time()
+        errors = 0
+        read = False
+        while not self.stopping.is_set():
+            try:
+                (count, failed) = self.run_due()
+                read = read or count > 0
+                errors += failed
+                now = time.time()
+                if read and now - self.published >= self.publish_interval:
+                    self.publish_samples(started, errors)
+                    (started, errors, read) = (now, 0, False)
+            except Exception:   # eg: a listener failed, keep polling
+                pass
+            self.stopping.wait(self.next_wait())
+
+    def publish_samples(self, started, errors):
+        self.published = time.time()
+        samples = [self.schedules[port.port_name].sample
+                   for port in self.portlist or []
+                   if port.port_name in self.schedules and
+                   self.schedules[port.port_name].sample is not None]
+        return self.publish(samples, started, errors)
+
+    #
+    # the portlist, rebuilt every portlist_interval seconds, the schedules
+    # of the ports are kept, ports that went away are dropped
+    #
+    def get_portlist(self):
+        now = time.time()
+        if self.portlist is None or \
+                (now - self.portlist_time) > self.portlist_interval:
+            self.portlist = oomlib.oom_get_portlist(self.south)
+            self.portlist_time = now
+            self.static = {}
+            names = [port.port_name for port in self.portlist]
+            for name in list(self.schedules):
+                if name not in names:
+                    self.drop(self.schedules.pop(name))
+            # first reads are spread over min_interval
+            for (i, name) in enumerate(names):
+                if name not in self.schedules:
+                    self.schedules[name] = PortSchedule(
+                        now + self.min_interval * i / max(len(names), 1))
+        return self.portlist
+
+    #
+    # read the ports that are due, as the bus budgets allow
+    # returns (ports read, ports that failed)
+    #
+    def run_due(self):
+        now = time.time()
+        count = 0
+        errors = 0
+        due = [port for port in self.get_portlist()
+               if self.schedules[port.port_name].due <= now]
+        due.sort(key=lambda port: self.schedules[port.port_name].due)
+        for port in due:
+            schedule = self.schedules[port.port_name]
+            if not self.take_tokens(schedule.bus, schedule.cost):
+                continue            # over budget, wait for the next turn
+            try:
+                if oomlib.oom_refresh_port(port):
+                    self.static.pop(port.port_name, None)
+                    schedule.urgency = 1.0
+                sample = self.read_port(port)
+            except Exception as err:
+                sample = PortSample(port, {}, {}, time.time(), str(err))
+            count += 1
+            if sample.error is not None:
+                errors += 1
+            try:
+                self.update(port, schedule, sample)
+            except Exception as err:
+                # the port's error is its sample, and it is not left due,
+                # or it would stop every pass
+                if sample.error is None:
+                    errors += 1
+                schedule.sample = PortSample(port, {}, {}, sample.time,
+                                             str(err))
+                schedule.due = sample.time + self.max_interval
+        return (count, errors)
+
+    # a port went away, it no longer asks for its share of the bus
+    def drop(self, schedule):
+        if schedule.interval is not None:
+            self.demand[schedule.bus] -= schedule.cost / schedule.interval
+
+    # wait until the next port is due (or min_interval at most)
+    def next_wait(self):
+        now = time.time()
+        due = [schedule.due for schedule in self.schedules.values()]
+        if len(due) == 0:
+            return self.min_interval
+        return min(max(min(due) - now, 0.01), self.min_interval)
+
+    #
+    # token bucket of a bus: 'budget' tokens a second, holding at most
+    # what one port read costs, or what a 10th of a second brings in,
+    # whichever is more, so reads are spread out, not bunched up
+    #
+    def take_tokens(self, bus, cost):
+        now = time.time()
+        bucket = self.tokens.get(bus)
+        most = max(cost, self.budget / 10)
+        if bucket is None:
+            bucket = [most, now]
+            self.tokens[bus] = bucket
+        bucket[0] = min(most, bucket[0] + (now - bucket[1]) * self.budget)
+        bucket[1] = now
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+    # the cost of one read of a port: module check plus the dynamic pages
+    # (CFP: register tables) of its polled keys
+    def read_cost(self, port):
+        if port.port_type not in self.costs:
+            mm = port.mmap
+            keys = []
+            for function in self.functions:
+                keys.extend(port.fmap.get(function, ()))
+            keys = [key for key in keys if key in mm and mm[key][0] == 1]
+            if port.c_port.oom_class == port_class_e['SFF']:
+                reads = len(oomlib.get_key_pages(port, keys))
+            elif port.c_port.oom_class == port_class_e['CFP']:
+                reads = len(set([oomlib.cfp_table(mm[key][3])
+                                 for key in keys]))
+            else:
+                reads = 0
+            self.costs[port.port_type] = 1 + reads
+        return self.costs[port.port_type]
+
+    #
+    # the port was just read: work out its urgency, and when it is due
+    #
+    def update(self, port, schedule, sample):
+        bus = oomlib.oom_get_bus(port)
+        cost = self.read_cost(port)
+        previous = schedule.sample
+        schedule.sample = sample
+        urgency = 1.0
+        if sample.error is None:
+            if schedule.static is not sample.static:
+                schedule.static = sample.static
+                schedule.checks = build_checks(sample.values, sample.static,
+                                               {})
+            old = None
+            if previous is not None and previous.error is None and \
+                    previous.static is sample.static:
+                old = previous.values
+            urgency = self.urgency(schedule.checks, sample.values, old)
+        schedule.urgency = max(urgency, schedule.urgency * self.decay)
+        # take back what the port asked for at its old bus and cost
+        if schedule.interval is not None:
+            self.demand[schedule.bus] -= schedule.cost / schedule.interval
+        schedule.bus = bus
+        schedule.cost = cost
+        schedule.interval = self.max_interval * \
+            (self.min_interval / self.max_interval) ** schedule.urgency
+        self.demand[schedule.bus] = self.demand.get(schedule.bus, 0.0) + \
+            schedule.cost / schedule.interval
+        schedule.due = sample.time + schedule.interval * \
+            self.stretch(schedule.bus)
+
+    #
+    # 0 (quiet) to 1 (worth watching closely)
+    #
+    def urgency(self, checks, values, old):
+        for key in values:
+            if key.startswith('L_') and flag_set(values[key]):
+                return 1.0
+        urgency = 0.0
+        for (key, convert, conds) in checks:
+            value = values.get(key)
+            if value is None or value == '':
+                continue
+            if convert is not None:
+                value = convert(value)
+            # conds: high alarm, low alarm, high warning, low warning
+            span = conds[0][3] - conds[1][3]
+            # proximity to (or beyond) a warning threshold
+            margin = min(conds[2][3] - value, value - conds[3][3])
+            urgency = max(urgency, 1 - margin / (self.proximity * span))
+            # volatility since the last read
+            if old is not None and old.get(key) not in (None, ''):
+                before = old[key]
+                if convert is not None:
+                    before = convert(before)
+                urgency = max(urgency, abs(value - before) /
+                              (self.volatility * span))
+            if urgency >= 1:
+                return 1.0
+        return min(max(urgency, 0.0), 1.0)
+
+    #
+    # how much the intervals of a bus must be stretched to keep within
+    # the budget: 1 if they fit
+    #
+    def stretch(self, bus):
+        return max(self.demand.get(bus, 0.0) / self.budget, 1.0)
@@ -18,7 +18,8 @@ import os
 import re
 from threading import Lock
 
-mutex = Lock()
+mutex = Lock()      # protects buslocks
+buslocks = {}       # one lock per bus, ports on different buses run in parallel
 
 
 #
@@ -78,6 +79,7 @@ class ports:
         # fill an array of ports
         self.portcount = 0
         self.portname_list = []
+        self.bus_list = []
         portname = None
         pyportlist = []
 
@@ -183,6 +185,7 @@ class ports:
                         newport.name[i] = 0
                 pyportlist.append(newport)
                 self.portname_list.append(eeprompath)
+                self.bus_list.append(find_bus(eeprompath))
                 self.portcount += 1
             # next key
 
@@ -244,6 +247,37 @@ def setparms(parms):
     return
 
 
+#
+# figure out which bus an EEPROM file is on.  i2c devices are named
+# '<bus>-00<addr>' (eg 54-0050) somewhere along the real path of the
+# file.  Anything else (MDIO, unrecognized) goes on bus -1
+#
+def find_bus(eeprompath):
+    match = re.search(r'/(\d+)-[0-9a-fA-F]{4}/', os.path.realpath(eeprompath))
+    if match:
+        return int(match.group(1))
+    return -1
+
+
+#
+# Not part of the Southbound API, optional: the bus a port is on
+# OOM may access ports on different buses in parallel
+#
+def oom_get_bus(cport):
+    try:
+        return allports.bus_list[gethandle(cport)]
+    except IndexError:
+        return -1
+
+
+def buslock(cport):
+    bus = oom_get_bus(cport)
+    with mutex:
+        if bus not in buslocks:
+            buslocks[bus] = Lock()
+        return buslocks[bus]
+
+
 # cport.handle is a c_void_p, but not really :-(
 # turn it into an integer by handling '0 is None'
 def gethandle(cport):
@@ -298,7 +332,7 @@ def oom_get_memory_sff(cport, address, page, offset, length, data):
 
     if length != len(data):
         return -errno.EINVAL
-    with mutex:
+    with buslock(cport):
         fd = open_and_seek(cport, address, page, offset, 'rb')
         if ((fd is None) or (fd.fileno() < 0)):
             try:
@@ -330,7 +364,7 @@ def oom_set_memory_sff(cport, address, page, offset, length, data):
 
     if not data or length > len(data):
         return -errno.EINVAL
-    with mutex:
+    with buslock(cport):
         fd = open_and_seek(cport, address, page, offset, 'rb+')
         if isinstance(fd, int):
             if fd < 0:
@@ -0,0 +1,119 @@
+# /////////////////////////////////////////////////////////////////////
+#
+#  oomvdm.py : CMIS VDM (Versatile Diagnostics Monitoring), the pre-FEC
+#  BER, SNR, errored frames and laser monitors of 400G/800G modules
+#
+#      values = oom_get_vdm(port)      # {key: value}, {} if no VDM
+#      values['VDM_FROZEN']            # False if not from one freeze
+#
+#  What a module monitors is up to the module: its VDM descriptor pages
+#  (0x20-0x23, one per group of 64 monitors) say which observable (see
+#  decode.vdm_type_dict) of which lane is in each 2 byte slot of the
+#  matching sample page (0x24-0x27).  The descriptor pages are static,
+#  they are read (and cached) once, the first time, and turned into keys
+#  of the port, one per monitor, eg: VDM_PREFEC_BER_CUR_MEDIA_LANE1,
+#  listed in the port's 'VDM' function.  Modules without VDM get none.
+#
+#  A VDM read freezes the samples (page 0x2F, byte 144), so that all of
+#  them are from the same moment, reads every sample page as one whole
+#  page (in one transaction if the shim can batch), then unfreezes.  If
+#  the module does not say the freeze is done (FreezeDone) in time, the
+#  samples are still read, but may not all be from the same moment, the
+#  result's VDM_FROZEN is False then.
+#  oom_get_memory(port, 'VDM') (once oom_get_vdm() has built the keys)
+#  reads the same samples without any freeze, for one monitor, or when
+#  it doesn't matter that they are from different moments.
+#
+# ////////////////////////////////////////////////////////////////////
+
+import time
+from ctypes import create_string_buffer
+from . import oomlib
+from .decode import vdm_type_dict, get_vdm_descriptors
+
+VDM_DESCRIPTORS = 0x20      # first descriptor page
+VDM_SAMPLES = 0x24          # first sample page
+VDM_CONTROL = 0x2F
+
+# the VDM control and status keys, on page 0x2F
+vdm_mm_keys = {
+    'VDM_GROUPS':        (0, 'get_bits', 0xA0, VDM_CONTROL, 128, 1, 1, 2),
+    'VDM_FREEZE':        (1, 'get_bits', 0xA0, VDM_CONTROL, 144, 1, 7, 1),
+    'VDM_FREEZE_DONE':   (1, 'get_bits', 0xA0, VDM_CONTROL, 145, 1, 7, 1),
+    'VDM_UNFREEZE_DONE': (1, 'get_bits', 0xA0, VDM_CONTROL, 145, 1, 6, 1),
+    }
+
+
+#
+# the VDM keys of a port, built from its descriptor pages the first
+# time, [] if the module does not have VDM
+#
+def get_vdm_keys(port):
+    if 'VDM' in port.fmap:
+        return port.fmap['VDM']
+    if 'VDM_SUPPORTED' not in port.mmap or \
+            not oomlib.oom_get_keyvalue(port, 'VDM_SUPPORTED'):
+        return []
+    port.mmap.update(vdm_mm_keys)
+    groups = oomlib.oom_get_keyvalue(port, 'VDM_GROUPS') + 1
+    keys = []
+    for group in range(groups):
+        raw = oomlib.oom_get_cached_sff(port, 0xA0, VDM_DESCRIPTORS + group,
+                                        128, 128)
+        for (slot, (type_id, lane, thresholds)) in \
+                enumerate(get_vdm_descriptors(raw)):
+            if type_id == 0:
+                continue        # unused slot
+            (name, decoder, scale) = vdm_type_dict.get(
+                type_id, ('VDM_TYPE_%d' % type_id, 'get_vdm_u16', 1))
+            key = '%s_LANE%d' % (name, lane)
+            if key in port.mmap:
+                continue        # the same monitor twice, keep the first
+            port.mmap[key] = (1, decoder, 0xA0, VDM_SAMPLES + group,
+                              128 + slot * 2, 2, scale)
+            keys.append(key)
+    port.fmap['VDM'] = tuple(keys)
+    return port.fmap['VDM']
+
+
+#
+# freeze (or unfreeze) the VDM samples, and wait (up to 'timeout'
+# seconds) for the module to say it is done.  False if it didn't
+#
+def vdm_freeze(port, freeze, timeout):
+    data = create_string_buffer(bytes(bytearray([0x80 if freeze else 0])), 1)
+    if oomlib.oom_set_memory_sff(port, 0xA0, VDM_CONTROL, 144, 1, data) != 1:
+        return False    # eg: a saved image, it can't be frozen
+    done = 'VDM_FREEZE_DONE' if freeze else 'VDM_UNFREEZE_DONE'
+    deadline = time.time() + timeout
+    while True:
+        if oomlib.oom_get_keyvalue(port, done):
+            return True
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+
+
+#
+# the VDM samples of a port, all from one freeze, {key: value}
+# ({} if the module does not have VDM), plus VDM_FROZEN: False if the
+# freeze could not be confirmed, and the samples may be inconsistent
+#
+def oom_get_vdm(port, timeout=0.5):
+    keys = get_vdm_keys(port)
+    if len(keys) == 0:
+        return {}
+    mm = port.mmap
+    pages = sorted(set([(mm[key][2], mm[key][3]) for key in keys]))
+    frozen = False
+    try:
+        frozen = vdm_freeze(port, True, timeout)
+        for (address, pagekey) in pages:
+            port.invalidate_page(address, pagekey)
+        oomlib.oom_fill_page_cache(port, pages)
+    finally:
+        vdm_freeze(port, False, timeout)
+    values = dict([(key, oomlib.oom_get_keyvalue_cached(port, key))
+                   for key in keys])
+    values['VDM_FROZEN'] = frozen
+    return values
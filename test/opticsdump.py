@@ -17,16 +17,79 @@ import argparse
 import json
 import math
 import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from oom import *
 from oom.oomlib import type_to_str
 
 ag_parser = argparse.ArgumentParser()
 ag_parser.add_argument("-p", "--port-name", help="The port name in 'port12' format. The port number is different than both i2cdump and onlpdump -S port numbers.")
-ag_parser.add_argument("-j", "--json",  help="Generate output in JSON format. Currently only honored if dumping a single port.", action="store_true")
+ag_parser.add_argument("-j", "--json",  help="Generate output in JSON format. Honored if dumping a single port, or with --all.", action="store_true")
+ag_parser.add_argument("-a", "--all", help="Dump every port, one JSON line per port (with --json), written as soon as the port is decoded. Ports on different buses are read in parallel.", action="store_true")
 args = ag_parser.parse_args()
 
-if args.port_name is None:
+
+# one port's record: each function group, read with one planned read
+def port_record(port):
+    record = {'port': port.port_name, 'type': type_to_str(port.port_type)}
+    for k in sorted(port.fmap.keys()):
+        group = oom_get_memory(port, k)
+        record[k] = {}
+        for l in sorted(group):
+            v = group[l]
+            if l.endswith('POWER') and isinstance(v, float):
+                record[k][l + '_CALCULATED_DBM'] = 10 * math.log10(v if v>0 else 1)
+            if (isinstance(v, bytes)):
+                v = v.decode('ISO-8859-1')
+            record[k][l] = v
+    return record
+
+
+# read the ports of one bus, one after the other, hand each record over
+# the None at the end is always sent, or dump_all() would wait forever
+def dump_bus(ports, records):
+    try:
+        for port in ports:
+            try:
+                record = port_record(port)
+            except Exception as err:
+                record = {'port': port.port_name, 'error': str(err)}
+            records.put(json.dumps(record, sort_keys=True,
+                                   ensure_ascii=False, default=str))
+    finally:
+        records.put(None)
+
+
+# every port, one JSON line each, one thread per bus
+def dump_all():
+    buses = {}
+    for port in oom_get_portlist():
+        buses.setdefault(oom_get_bus(port), []).append(port)
+    records = queue.Queue(maxsize=64)
+    for ports in buses.values():
+        thread = threading.Thread(target=dump_bus, args=(ports, records))
+        thread.daemon = True
+        thread.start()
+    running = len(buses)
+    while running > 0:
+        line = records.get()
+        if line is None:
+            running -= 1
+            continue
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+
+if args.all:
+    if not args.json:
+        print("--all needs --json")
+        sys.exit(1)
+    dump_all()
+elif args.port_name is None:
     formatstr = '%-10s %-16s %-13s %-16s %-16s'
     print(formatstr % ('Port Name', 'Vendor', 'Type', 'Part #', 'Serial #'))
     for port in oom_get_portlist():
@@ -44,18 +107,20 @@ else:
     if args.json:
         for port in oom_get_portlist():
             if args.port_name == port.port_name:
+                # one read of each page, every key decoded from that
+                values = oom_get_snapshot(port)
                 for k in sorted(port.fmap.keys()):
                     port_data[k] = {}
                     for l in sorted(port.fmap[k]):
-                        v = oom_get_keyvalue(port, l)
-                        if l.endswith('POWER'):
+                        v = values[l]
+                        if l.endswith('POWER') and isinstance(v, float):
                             port_data[k][l + '_CALCULATED_DBM'] = 10 * math.log10(v if v>0 else 1)
                         if (isinstance(v, bytes)):
                             v = v.decode('ISO-8859-1')
                         port_data[k][l] = v
                 for k in sorted(port.mmap.keys()):
-                    v = oom_get_keyvalue(port, k)
-                    if l.endswith('POWER'):
+                    v = values[k]
+                    if k.endswith('POWER') and isinstance(v, float):
                         port_data[k + '_CALCULATED_DBM'] = 10 * math.log10(v if v>0 else 1)
                     if (isinstance(v, bytes)):
                         v = v.decode('ISO-8859-1')
@@ -70,21 +135,23 @@ else:
     else:
         for port in oom_get_portlist():
             if args.port_name == port.port_name:
+                # one read of each page, every key decoded from that
+                values = oom_get_snapshot(port)
                 for k in sorted(port.fmap.keys()):
                     print(k)
                     for l in sorted(port.fmap[k]):
-                        v = oom_get_keyvalue(port, l)
+                        v = values[l]
                         if (isinstance(v, bytes)):
                             v = v.decode('ISO-8859-1')
-                        if l.endswith('POWER'):
+                        if l.endswith('POWER') and isinstance(v, float):
                             print('\t%-20s= %-10s(calculated %s dBm)' % (l, v, 10 * math.log10(v if v>0 else 1)))
                         else:
                             print('\t%-20s= %s' % (l, v))
                 for k in sorted(port.mmap.keys()):
-                    v = oom_get_keyvalue(port, k)
+                    v = values[k]
                     if (isinstance(v, bytes)):
                         v = v.decode('ISO-8859-1')
-                    if k.endswith('POWER'):
+                    if k.endswith('POWER') and isinstance(v, float):
                         print('%-26s= %-10s(calculated %s dBm)' % (k, v, 10 * math.log10(v if v>0 else 1)))
                     else:
                         print('%-26s= %s' % (k, v))